@@ -1,9 +1,15 @@
 from fastapi import APIRouter
-from app.api import user, character, level, equipment, ranking, skill, task, social, shop
+from app.database import DB_ASYNC
+from app.api import user, character, level, equipment, inventory, ranking, skill, task, social, shop
 
 # 创建主路由器
 router = APIRouter()
 
+# 异步模式：先注册热点接口的异步版本，覆盖下面同路径的同步接口
+if DB_ASYNC:
+    from app.api import async_routes
+    router.include_router(async_routes.router)
+
 # 包含用户路由
 router.include_router(user.router)
 
@@ -16,6 +22,9 @@ router.include_router(level.router)
 # 包含装备路由
 router.include_router(equipment.router)
 
+# 包含背包路由
+router.include_router(inventory.router)
+
 # 包含排行榜路由
 router.include_router(ranking.router)
 
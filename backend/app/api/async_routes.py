@@ -0,0 +1,114 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+from app import response_cache
+from app.database import get_async_db
+from app.auth.dependencies import get_current_user_async
+from app.models.user import User
+from app.api import equipment, level, ranking, task
+
+# 异步模式下的热点接口（DB_ASYNC=true 时在同步路由之前注册，同路径优先匹配）
+# 接口为 async def，数据库访问通过 AsyncSession（aiosqlite / asyncpg），不占用线程池；
+# Redis读取使用异步客户端，升级后的排行榜同步等同步Redis写入在一次线程池调用中执行
+router = APIRouter()
+
+
+# 排行榜
+@router.get(ranking.router.prefix + "/level", response_model=ranking.RankingResponse, tags=["ranking"])
+async def get_level_ranking_async(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    class_type: Optional[str] = None,
+    bracket: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取等级排行榜（异步）"""
+    return await response_cache.cached_response_async(
+        request, "ranking", await ranking.ranking_version_async(), ranking.RankingResponse,
+        lambda: ranking.read_ranking_page_async(db, "level", current_user.id, offset, limit, class_type, bracket),
+        vary=current_user.id
+    )
+
+@router.get(ranking.router.prefix + "/power", response_model=ranking.RankingResponse, tags=["ranking"])
+async def get_power_ranking_async(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    class_type: Optional[str] = None,
+    bracket: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取战力排行榜（异步）"""
+    return await response_cache.cached_response_async(
+        request, "ranking", await ranking.ranking_version_async(), ranking.RankingResponse,
+        lambda: ranking.read_ranking_page_async(db, "power", current_user.id, offset, limit, class_type, bracket),
+        vary=current_user.id
+    )
+
+@router.get(ranking.router.prefix + "/{board}/around-me", response_model=ranking.RankingResponse, tags=["ranking"])
+async def get_ranking_around_me_async(
+    request: Request,
+    board: str,
+    radius: int = Query(5, ge=0, le=50),
+    class_type: Optional[str] = None,
+    bracket: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取个人附近的排名（异步）"""
+    ranking.check_board(board)
+    return await response_cache.cached_response_async(
+        request, "ranking", await ranking.ranking_version_async(), ranking.RankingResponse,
+        lambda: ranking.read_ranking_around_async(db, board, current_user.id, radius, class_type, bracket),
+        vary=current_user.id
+    )
+
+
+# 等级
+@router.get(level.router.prefix + "/", response_model=Dict, tags=["level"])
+async def get_characters_level_async(
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取当前用户所有角色的等级信息（异步）"""
+    return await level.get_characters_level_async(current_user, db)
+
+@router.get(level.router.prefix + "/{character_id}", response_model=Dict, tags=["level"])
+async def get_character_level_async(
+    character_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取角色等级信息（异步）"""
+    return await level.get_character_level_async(character_id, current_user, db)
+
+@router.post(level.router.prefix + "/gain-exp", response_model=level.LevelResponse, tags=["level"])
+async def character_gain_exp_async(
+    exp_gain: level.ExpGain,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """角色获取经验值（异步）"""
+    return await level.character_gain_exp_async(exp_gain, current_user, db)
+
+
+# 任务
+@router.get("/characters/{character_id}/tasks", response_model=task.CharacterTaskList, tags=["task"])
+async def get_character_tasks_async(character_id: int, compact: bool = False, db: AsyncSession = Depends(get_async_db)):
+    """获取角色的所有任务（异步）"""
+    return await task.get_character_tasks_async(character_id, compact, db)
+
+
+# 装备
+@router.get(equipment.router.prefix + "/character/{character_id}",
+            response_model=List[equipment.EquipmentSlotResponse], tags=["equipment"])
+async def get_character_equipment_async(
+    character_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取角色已穿戴的装备（异步）"""
+    return await equipment.get_character_equipment_async(character_id, current_user, db)
@@ -6,6 +6,7 @@ from app.database import get_db
 from app.auth.dependencies import get_current_user
 from app.models.user import User
 from app.models.character import Character
+from app.services import effective_stats, leaderboard
 
 # 创建路由器
 router = APIRouter(prefix="/character", tags=["character"])
@@ -14,6 +15,8 @@ router = APIRouter(prefix="/character", tags=["character"])
 class CharacterCreate(BaseModel):
     name: str
     class_type: str
+    # 所属区服，决定每日任务重置的时区（为空使用服务器默认时区）
+    region: Optional[str] = None
 
 class CharacterUpdate(BaseModel):
     name: Optional[str] = None
@@ -24,7 +27,9 @@ class CharacterResponse(BaseModel):
     user_id: int
     level: int
     exp: int
+    gold: Optional[int] = 0
     class_type: Optional[str] = None
+    region: Optional[str] = None
     # 基础属性
     strength: int
     agility: int
@@ -39,6 +44,16 @@ class CharacterResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class EffectiveStatsResponse(BaseModel):
+    """最终属性：自身属性 + 装备加成 + 技能被动加成"""
+    character_id: int
+    attack: float
+    defense: float
+    strength: float
+    agility: float
+    intelligence: float
+    vitality: float
+
 # 角色创建
 @router.post("/", response_model=CharacterResponse)
 def create_character(character: CharacterCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -78,6 +93,7 @@ def create_character(character: CharacterCreate, current_user: User = Depends(ge
         level=1,
         exp=0,
         class_type=character.class_type,
+        region=character.region,
         # 基础属性
         strength=initial_attrs["strength"],
         agility=initial_attrs["agility"],
@@ -94,6 +110,9 @@ def create_character(character: CharacterCreate, current_user: User = Depends(ge
     db.commit()
     db.refresh(db_character)
     
+    # 新角色加入排行榜
+    leaderboard.update_character(db_character, db_character.power, current_user.username)
+    
     # 返回字典格式的数据
     return {
         "id": db_character.id,
@@ -101,7 +120,9 @@ def create_character(character: CharacterCreate, current_user: User = Depends(ge
         "user_id": db_character.user_id,
         "level": db_character.level,
         "exp": db_character.exp,
+        "gold": db_character.gold,
         "class_type": db_character.class_type,
+        "region": db_character.region,
         "strength": db_character.strength,
         "agility": db_character.agility,
         "intelligence": db_character.intelligence,
@@ -125,7 +146,9 @@ def get_characters(current_user: User = Depends(get_current_user), db: Session =
             "user_id": character.user_id,
             "level": character.level,
             "exp": character.exp,
+            "gold": character.gold,
             "class_type": character.class_type,
+            "region": character.region,
             "strength": character.strength,
             "agility": character.agility,
             "intelligence": character.intelligence,
@@ -150,6 +173,19 @@ def get_character(character_id: int, current_user: User = Depends(get_current_us
         )
     return character
 
+# 获取角色最终属性
+@router.get("/{character_id}/stats", response_model=EffectiveStatsResponse)
+def get_character_stats(character_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """获取角色最终属性，命中缓存时不查询装备和技能"""
+    owner_id = db.query(Character.user_id).filter(Character.id == character_id).scalar()
+    if owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="角色不存在"
+        )
+    stats = effective_stats.get(character_id, db)
+    return {"character_id": character_id, **stats._asdict()}
+
 # 更新角色信息
 @router.put("/{character_id}", response_model=CharacterResponse)
 def update_character(character_id: int, character_update: CharacterUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -189,6 +225,10 @@ def delete_character(character_id: int, current_user: User = Depends(get_current
     
     db.delete(character)
     db.commit()
+    
+    # 从排行榜中移除
+    leaderboard.remove_character(character_id, current_user.id)
+    effective_stats.invalidate(character_id)
     return {"message": "角色删除成功"}
 
 # 获取角色数量
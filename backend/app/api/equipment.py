@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from pydantic import BaseModel, Field
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from app import response_cache
 from app.database import get_db
 from app.auth.dependencies import get_current_user
 from app.models.user import User
 from app.models.character import Character
 from app.models.equipment import Equipment, EquipmentSlot
+from app.services import catalog, effective_stats, equip, equipment_search, game_events, inventory, leaderboard, loadout_optimizer
+from app.services.power import adjust_power, equipment_power
 
 # 创建路由器
 router = APIRouter(prefix="/equipment", tags=["equipment"])
@@ -44,6 +51,11 @@ class EquipmentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class EquipmentPage(BaseModel):
+    items: List[EquipmentResponse]
+    # 下一页游标，为空表示没有下一页
+    next_cursor: Optional[str] = None
+
 class EquipmentSlotCreate(BaseModel):
     character_id: int
     equipment_id: int
@@ -59,6 +71,36 @@ class EquipmentSlotResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class LoadoutEquip(BaseModel):
+    character_id: int
+    # {槽位: 装备ID}，装备ID为空表示卸下该槽位（与最优装备方案的格式一致）
+    slots: Dict[str, Optional[int]] = Field(..., min_length=1, max_length=len(equip.SLOT_TYPES))
+
+class LoadoutResponse(BaseModel):
+    character_id: int
+    slots: List[EquipmentSlotResponse]
+    # 最终属性（自身属性 + 装备加成 + 技能被动加成）
+    stats: Dict[str, float]
+    power: Optional[int] = None
+
+class LoadoutChange(BaseModel):
+    slot_type: str
+    from_equipment_id: Optional[int] = None
+    to_equipment_id: Optional[int] = None
+
+class LoadoutSuggestion(BaseModel):
+    # {槽位: 装备ID}，空槽位为null
+    slots: Dict[str, Optional[int]]
+    power: int
+    # 相对当前装备的战力变化
+    delta: int
+    changes: List[LoadoutChange]
+
+class LoadoutSuggestions(BaseModel):
+    character_id: int
+    current_power: int
+    loadouts: List[LoadoutSuggestion]
+
 # 创建装备
 @router.post("/", response_model=EquipmentResponse)
 def create_equipment(equipment: EquipmentCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -81,20 +123,60 @@ def create_equipment(equipment: EquipmentCreate, current_user: User = Depends(ge
     db.add(db_equipment)
     db.commit()
     db.refresh(db_equipment)
+    catalog.invalidate("equipment")
     return db_equipment
 
 # 获取装备列表
 @router.get("/", response_model=List[EquipmentResponse])
-def get_equipment_list(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_equipment_list(request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """获取装备列表"""
-    equipment = db.query(Equipment).all()
-    return equipment
+    return response_cache.cached_response(
+        request, "equipment", response_cache.get_version("equipment"), List[EquipmentResponse],
+        lambda: catalog.get_catalog("equipment", db).items
+    )
+
+# 按条件查询装备
+@router.get("/search", response_model=EquipmentPage)
+def search_equipment(
+    type: Optional[str] = None,
+    rarity: Optional[str] = None,
+    min_level: Optional[int] = None,
+    max_level: Optional[int] = None,
+    min_attack: Optional[int] = None,
+    min_defense: Optional[int] = None,
+    min_strength: Optional[int] = None,
+    min_agility: Optional[int] = None,
+    min_intelligence: Optional[int] = None,
+    min_vitality: Optional[int] = None,
+    sort: str = Query("id", pattern="^(" + "|".join(equipment_search.SORT_FIELDS) + ")$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(20, ge=1, le=equipment_search.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """按类型、稀有度、等级区间和属性下限筛选装备，按指定字段排序，使用 next_cursor 翻页"""
+    min_stats = {
+        "attack": min_attack, "defense": min_defense, "strength": min_strength,
+        "agility": min_agility, "intelligence": min_intelligence, "vitality": min_vitality
+    }
+    try:
+        page = equipment_search.search(
+            db, type=type, rarity=rarity, min_level=min_level, max_level=max_level, min_stats=min_stats,
+            sort=sort, descending=order == "desc", limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+    return {"items": page.items, "next_cursor": page.next_cursor}
 
 # 获取单个装备信息
 @router.get("/{equipment_id}", response_model=EquipmentResponse)
 def get_equipment(equipment_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """获取单个装备信息"""
-    equipment = db.query(Equipment).filter(Equipment.id == equipment_id).first()
+    equipment = catalog.get_catalog("equipment", db).get(equipment_id)
     if not equipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -102,66 +184,134 @@ def get_equipment(equipment_id: int, current_user: User = Depends(get_current_us
         )
     return equipment
 
-# 穿戴装备
-@router.post("/equip", response_model=EquipmentSlotResponse)
-def equip_equipment(slot_data: EquipmentSlotCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """穿戴装备"""
+# 校验并穿戴装备
+def equip_loadout(character_id: int, loadout: Dict[str, Optional[int]], current_user: User, db: Session) -> equip.EquipResult:
+    """校验角色、装备和槽位后在一个事务中穿戴，并同步排行榜、推进穿戴类任务"""
     # 检查角色是否存在且属于当前用户
-    character = db.query(Character).filter(Character.id == slot_data.character_id, Character.user_id == current_user.id).first()
+    character = db.query(Character).filter(Character.id == character_id, Character.user_id == current_user.id).first()
     if not character:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="角色不存在"
         )
     
-    # 检查装备是否存在
-    equipment = db.query(Equipment).filter(Equipment.id == slot_data.equipment_id).first()
-    if not equipment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="装备不存在"
-        )
+    equipment_catalog = catalog.get_catalog("equipment", db)
+    for slot_type, equipment_id in loadout.items():
+        # 检查槽位类型是否有效
+        if slot_type not in equip.SLOT_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的槽位类型"
+            )
+        if equipment_id is None:
+            continue
+        # 检查装备是否存在
+        equipment = equipment_catalog.get(equipment_id)
+        if not equipment:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="装备不存在"
+            )
+        # 检查装备等级是否不超过角色等级
+        if equipment.level > character.level:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="装备等级不能超过角色等级"
+            )
     
-    # 检查装备等级是否不超过角色等级
-    if equipment.level > character.level:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="装备等级不能超过角色等级"
-        )
-    
-    # 检查槽位类型是否有效
-    valid_slot_types = ["武器", "头盔", "胸甲", "手套", "靴子", "饰品1", "饰品2"]
-    if slot_data.slot_type not in valid_slot_types:
+    # 检查角色是否拥有足够的装备实例（穿戴后同一装备占用几个槽位就需要几件）
+    slots = dict(db.query(EquipmentSlot.slot_type, EquipmentSlot.equipment_id).filter(
+        EquipmentSlot.character_id == character_id
+    ).all())
+    slots.update(loadout)
+    needed = Counter(
+        equipment_id for equipment_id in slots.values()
+        if equipment_id is not None and equipment_id in loadout.values()
+    )
+    owned = inventory.owned_equipment(db, character_id, needed)
+    if any(owned.get(equipment_id, 0) < count for equipment_id, count in needed.items()):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="无效的槽位类型"
+            detail="背包中没有足够的该装备"
         )
     
-    # 检查该槽位是否已穿戴装备
-    existing_slot = db.query(EquipmentSlot).filter(
-        EquipmentSlot.character_id == slot_data.character_id,
-        EquipmentSlot.slot_type == slot_data.slot_type
-    ).first()
-    
-    if existing_slot:
-        # 如果已穿戴装备，先卸下
-        db.delete(existing_slot)
-        db.commit()
-    
-    # 创建新的装备槽位记录
-    new_slot = EquipmentSlot(
-        character_id=slot_data.character_id,
-        equipment_id=slot_data.equipment_id,
-        slot_type=slot_data.slot_type
+    # 提交后角色对象会过期，排行榜使用提交前的快照
+    snapshot = SimpleNamespace(
+        id=character.id, name=character.name, user_id=character.user_id,
+        class_type=character.class_type, level=character.level
     )
-    db.add(new_slot)
-    db.commit()
-    db.refresh(new_slot)
-    
-    # 加载装备信息
-    db.refresh(new_slot.equipment)
+    result = equip.equip(db, character, loadout)
     
-    return new_slot
+    # 战力变化后同步排行榜
+    if result.power is not None:
+        leaderboard.update_character(snapshot, result.power, current_user.username)
+    game_events.emit_many(
+        game_events.GameEvent(game_events.EQUIP, character_id, target=str(equipment_id))
+        for equipment_id in loadout.values() if equipment_id is not None
+    )
+    return result
+
+# 槽位响应
+def slot_response(character_id: int, slot: equip.EquippedSlot, db: Session) -> Dict:
+    return {
+        "id": slot.id,
+        "character_id": character_id,
+        "equipment_id": slot.equipment_id,
+        "slot_type": slot.slot_type,
+        "equipment": catalog.get_catalog("equipment", db).get(slot.equipment_id)._asdict()
+    }
+
+# 穿戴装备
+@router.post("/equip", response_model=EquipmentSlotResponse)
+def equip_equipment(slot_data: EquipmentSlotCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """穿戴装备，已穿戴的同槽位装备在同一事务中被替换"""
+    result = equip_loadout(slot_data.character_id, {slot_data.slot_type: slot_data.equipment_id}, current_user, db)
+    return slot_response(slot_data.character_id, result.slots[slot_data.slot_type], db)
+
+# 穿戴整套装备
+@router.post("/equip/loadout", response_model=LoadoutResponse)
+def equip_whole_loadout(loadout: LoadoutEquip, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """一次穿戴多个槽位（最多全部7个），值为空的槽位被卸下，返回穿戴后的全部槽位、属性合计和战力"""
+    result = equip_loadout(loadout.character_id, loadout.slots, current_user, db)
+    return {
+        "character_id": loadout.character_id,
+        "slots": [slot_response(loadout.character_id, slot, db) for slot in result.slots.values()],
+        "stats": result.stats._asdict(),
+        "power": result.power
+    }
+
+# 最优装备方案
+@router.get("/optimize/{character_id}", response_model=LoadoutSuggestions)
+def optimize_loadout(
+    character_id: int,
+    top_k: int = Query(3, ge=1, le=loadout_optimizer.MAX_TOP_K),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """在角色拥有且等级满足的装备中计算战力最高的前 top_k 套方案，可直接用于 /equip/loadout"""
+    owner_id = db.query(Character.user_id).filter(Character.id == character_id).scalar()
+    if owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="角色不存在"
+        )
+    result = loadout_optimizer.optimize(character_id, db, top_k)
+    return {
+        "character_id": character_id,
+        "current_power": result.current_power,
+        "loadouts": [
+            {
+                "slots": loadout.slots,
+                "power": loadout.power,
+                "delta": loadout.delta,
+                "changes": [
+                    {"slot_type": slot_type, "from_equipment_id": before, "to_equipment_id": after}
+                    for slot_type, before, after in loadout.changes
+                ]
+            }
+            for loadout in result.loadouts
+        ]
+    }
 
 # 卸下装备
 @router.delete("/unequip/{slot_id}")
@@ -183,9 +333,14 @@ def unequip_equipment(slot_id: int, current_user: User = Depends(get_current_use
             detail="角色不存在"
         )
     
-    # 删除装备槽位记录
+    # 删除装备槽位记录并扣除战力
+    adjust_power(db, character.id, -equipment_power(slot.equipment))
     db.delete(slot)
     db.commit()
+    effective_stats.invalidate(character.id)
+    
+    # 战力变化后同步排行榜
+    leaderboard.sync_character(character, db)
     
     return {"message": "装备卸下成功"}
 
@@ -209,3 +364,17 @@ def get_character_equipment(character_id: int, current_user: User = Depends(get_
         db.refresh(slot.equipment)
     
     return slots
+
+# 获取角色已穿戴的装备（异步会话）
+async def get_character_equipment_async(character_id: int, current_user: User, db: AsyncSession) -> List[EquipmentSlotResponse]:
+    """与 get_character_equipment 相同，装备信息随槽位一起预加载，在会话关闭前完成校验"""
+    owner = await db.scalar(select(Character.id).where(Character.id == character_id, Character.user_id == current_user.id))
+    if owner is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="角色不存在"
+        )
+    slots = await db.scalars(
+        select(EquipmentSlot).where(EquipmentSlot.character_id == character_id).options(selectinload(EquipmentSlot.equipment))
+    )
+    return [EquipmentSlotResponse.model_validate(slot) for slot in slots]
@@ -0,0 +1,100 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Dict, List
+from app.database import get_db
+from app.auth.dependencies import get_current_user
+from app.models.user import User
+from app.models.character import Character
+from app.services import inventory
+
+# 创建路由器；物品只由服务端发放（任务奖励、商城购买），玩家只能查看、移除和转移
+router = APIRouter(prefix="/inventory", tags=["inventory"])
+
+# 请求和响应模型
+class InventoryRemove(BaseModel):
+    # {可堆叠物品标识: 数量}
+    items: Dict[str, int] = {}
+    # 装备实例ID
+    instance_ids: List[int] = []
+
+class InventoryMove(InventoryRemove):
+    to_character_id: int
+
+class InventoryInstance(BaseModel):
+    id: int
+    item_key: str
+    durability: int
+
+class InventoryResponse(BaseModel):
+    character_id: int
+    # {物品标识: 数量}
+    stacks: Dict[str, int]
+    instances: List[InventoryInstance]
+
+# 检查角色归属
+def get_owned_character_id(character_id: int, current_user: User, db: Session) -> int:
+    owner_id = db.query(Character.user_id).filter(Character.id == character_id).scalar()
+    if owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="角色不存在"
+        )
+    return character_id
+
+# 背包响应
+def inventory_response(character_id: int, db: Session) -> Dict:
+    view = inventory.get(character_id, db)
+    return {
+        "character_id": character_id,
+        "stacks": view.stacks,
+        "instances": [
+            {"id": item_id, "item_key": item_key, "durability": durability}
+            for item_id, item_key, durability in view.instances
+        ]
+    }
+
+# 执行背包变更并提交
+def apply_change(db: Session, change, *character_ids: int):
+    try:
+        change()
+        db.commit()
+    except inventory.InventoryError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="物品不存在、数量不足或正在穿戴"
+        )
+    inventory.invalidate(*character_ids)
+
+# 获取背包
+@router.get("/{character_id}", response_model=InventoryResponse)
+def get_inventory(character_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """获取角色背包（可堆叠物品数量和装备实例），命中缓存时不查询数据库"""
+    get_owned_character_id(character_id, current_user, db)
+    return inventory_response(character_id, db)
+
+# 移除物品
+@router.post("/{character_id}/remove", response_model=InventoryResponse)
+def remove_items(character_id: int, data: InventoryRemove, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """批量移除物品，任一物品数量不足时全部不移除"""
+    get_owned_character_id(character_id, current_user, db)
+    apply_change(db, lambda: inventory.remove(db, character_id, data.items, data.instance_ids), character_id)
+    return inventory_response(character_id, db)
+
+# 转移物品
+@router.post("/{character_id}/move", response_model=InventoryResponse)
+def move_items(character_id: int, data: InventoryMove, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """把物品转移给当前用户的另一个角色，返回转出角色的背包"""
+    get_owned_character_id(character_id, current_user, db)
+    get_owned_character_id(data.to_character_id, current_user, db)
+    if data.to_character_id == character_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="不能转移给同一个角色"
+        )
+    apply_change(
+        db, lambda: inventory.move(db, character_id, data.to_character_id, data.items, data.instance_ids),
+        character_id, data.to_character_id
+    )
+    return inventory_response(character_id, db)
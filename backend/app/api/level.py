@@ -1,19 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Dict
+from sqlalchemy import select, update
+from pydantic import BaseModel, Field
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from app import metrics
 from app.database import get_db
 from app.auth.dependencies import get_current_user
 from app.models.user import User
 from app.models.character import Character
+from app.services import effective_stats, exp_quota, game_events, leaderboard
+from app.services.power import LEVEL_POWER
+from app.services.level_curve import ATTRIBUTES, apply_exp, get_next_level_exp
 
 # 创建路由器
 router = APIRouter(prefix="/api/level", tags=["level"])
 
+# 单次经验值获取上限
+MAX_EXP_PER_GAIN = 5000
+# 批量发放经验的最大条数
+MAX_BATCH_GRANTS = 500
+# 批量发放时比较并交换写回的重试次数
+GRANT_RETRIES = 5
+
 # 请求和响应模型
 class ExpGain(BaseModel):
     character_id: int
-    exp: int
+    exp: int = Field(..., ge=0)
 
 class LevelResponse(BaseModel):
     character_id: int
@@ -23,43 +38,26 @@ class LevelResponse(BaseModel):
     next_level_exp: int
     level_up: bool
     new_level: int = None
+    # 实际获得的经验值（受每日经验上限限制）
+    exp_gained: Optional[int] = None
 
-# 计算升级所需经验值
-def calculate_next_level_exp(current_level: int) -> int:
-    """
-    计算升级所需经验值
-    公式: 基础经验值 * 等级因子
-    基础经验值: 1000
-    等级因子: 1.5 ^ (等级-1)
-    """
-    base_exp = 1000
-    level_factor = 1.5 ** (current_level - 1)
-    return int(base_exp * level_factor)
+class ExpGrantBatch(BaseModel):
+    grants: List[ExpGain] = Field(..., min_length=1, max_length=MAX_BATCH_GRANTS)
 
-# 根据职业类型获取属性成长系数
-def get_class_growth_bonus(class_type: str) -> Dict[str, float]:
-    """
-    根据职业类型获取属性成长系数
-    """
-    growth_bonuses = {
-        "warrior": {"strength": 1.5, "vitality": 1.3, "agility": 0.8, "intelligence": 0.5},
-        "mage": {"intelligence": 1.5, "agility": 0.8, "vitality": 0.7, "strength": 0.5},
-        "archer": {"agility": 1.5, "strength": 1.0, "intelligence": 0.7, "vitality": 0.8},
-        "thief": {"agility": 1.4, "intelligence": 0.9, "strength": 0.9, "vitality": 0.8},
-        "priest": {"intelligence": 1.3, "vitality": 1.1, "strength": 0.6, "agility": 0.7}
-    }
-    return growth_bonuses.get(class_type.lower(), {"strength": 1.0, "agility": 1.0, "intelligence": 1.0, "vitality": 1.0})
+class ExpGrantResult(BaseModel):
+    character_id: int
+    name: str
+    level: int
+    exp: int
+    next_level_exp: int
+    level_up: bool
+    levels_gained: int
+    exp_gained: int
 
-# 计算属性成长值
-def calculate_attribute_growth(current_level: int, base_growth: float, class_bonus: float) -> int:
-    """
-    计算属性成长值
-    公式: 基础成长值 * 等级因子 * 职业系数
-    """
-    base_growth_value = 2
-    level_factor = 1 + (current_level - 1) * 0.05  # 等级越高，成长越高
-    total_growth = base_growth_value * level_factor * class_bonus
-    return int(total_growth)
+class ExpGrantBatchResponse(BaseModel):
+    results: List[ExpGrantResult]
+    # 不存在或不属于当前用户的角色ID
+    missing: List[int]
 
 # 更新衍生属性
 def update_derived_attributes(character: Character):
@@ -79,54 +77,33 @@ def update_derived_attributes(character: Character):
 def handle_level_up(character: Character, exp_gained: int) -> Dict:
     """
     处理角色经验值获取和等级提升
+    通过预计算的等级曲线一次结算，跨多级升级无需逐级计算
+    不修改战力：调用方按 levels_gained * LEVEL_POWER 在SQL中增量更新，避免覆盖并发穿戴带来的战力变化
     """
     original_level = character.level
-    character.exp += exp_gained
-    level_up = False
-    new_level = original_level
+    gain = apply_exp(character.class_type, original_level, character.exp + exp_gained)
+    level_up = gain.level > original_level
+    character.level = gain.level
+    character.exp = gain.exp
     
-    # 检查是否可以升级
-    while character.exp >= calculate_next_level_exp(character.level):
-        character.level += 1
-        character.exp -= calculate_next_level_exp(character.level - 1)
-        level_up = True
-        new_level = character.level
-        
-        # 获取职业成长系数
-        class_bonus = get_class_growth_bonus(character.class_type)
-        
+    if level_up:
         # 增加基础属性
-        character.strength += calculate_attribute_growth(character.level, 1.0, class_bonus.get("strength", 1.0))
-        character.agility += calculate_attribute_growth(character.level, 1.0, class_bonus.get("agility", 1.0))
-        character.intelligence += calculate_attribute_growth(character.level, 1.0, class_bonus.get("intelligence", 1.0))
-        character.vitality += calculate_attribute_growth(character.level, 1.0, class_bonus.get("vitality", 1.0))
+        for attribute in ATTRIBUTES:
+            setattr(character, attribute, getattr(character, attribute) + gain.attributes[attribute])
         
         # 更新衍生属性
         update_derived_attributes(character)
-        
-        # 限制等级上限为100级
-        if character.level >= 100:
-            character.exp = 0
-            break
     
     return {
         "level_up": level_up,
-        "new_level": new_level if level_up else None
+        "new_level": gain.level if level_up else None,
+        "levels_gained": gain.level - original_level
     }
 
-# 获取角色等级信息
-@router.get("/{character_id}", response_model=Dict)
-def get_character_level(character_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """获取角色等级信息"""
-    character = db.query(Character).filter(Character.id == character_id, Character.user_id == current_user.id).first()
-    if not character:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="角色不存在"
-        )
-    
-    next_level_exp = calculate_next_level_exp(character.level)
-    
+# 角色等级信息
+def level_info(character: Character, **extra) -> Dict:
+    """等级、经验进度和属性，extra 为附加字段"""
+    next_level_exp = get_next_level_exp(character.level)
     return {
         "character_id": character.id,
         "name": character.name,
@@ -134,6 +111,7 @@ def get_character_level(character_id: int, current_user: User = Depends(get_curr
         "exp": character.exp,
         "next_level_exp": next_level_exp,
         "exp_percentage": min(100, (character.exp / next_level_exp) * 100),
+        **extra,
         # 属性信息
         "strength": character.strength,
         "agility": character.agility,
@@ -145,10 +123,35 @@ def get_character_level(character_id: int, current_user: User = Depends(get_curr
         "defense": character.defense
     }
 
+# 获取角色等级信息
+@router.get("/{character_id}", response_model=Dict)
+def get_character_level(character_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """获取角色等级信息"""
+    character = db.query(Character).filter(Character.id == character_id, Character.user_id == current_user.id).first()
+    if not character:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="角色不存在"
+        )
+    
+    # 今日已获得经验值及每日上限
+    return level_info(character, daily_exp=exp_quota.used_today(db, character.id), daily_exp_limit=exp_quota.DAILY_EXP_LIMIT)
+
+# 获取角色等级信息（异步会话）
+async def get_character_level_async(character_id: int, current_user: User, db: AsyncSession) -> Dict:
+    character = await db.scalar(select(Character).where(Character.id == character_id, Character.user_id == current_user.id))
+    if not character:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="角色不存在"
+        )
+    daily_exp = await exp_quota.used_today_async(db, character.id)
+    return level_info(character, daily_exp=daily_exp, daily_exp_limit=exp_quota.DAILY_EXP_LIMIT)
+
 # 获取经验值
-def gain_exp(character_id: int, exp: int, db: Session, current_user: User) -> Character:
+def gain_exp(character_id: int, exp: int, db: Session, current_user: User) -> Tuple[Character, int]:
     """
-    为角色添加经验值并处理等级提升
+    为角色添加经验值并处理等级提升，返回角色和实际获得的经验值
     """
     character = db.query(Character).filter(Character.id == character_id, Character.user_id == current_user.id).first()
     if not character:
@@ -157,30 +160,111 @@ def gain_exp(character_id: int, exp: int, db: Session, current_user: User) -> Ch
             detail="角色不存在"
         )
     
-    # 检查经验值获取限制（每日经验值获取上限为10000）
-    # 这里简化处理，实际应该在数据库中记录每日经验值获取量
-    if exp > 5000:
+    # 检查经验值获取限制
+    if exp > MAX_EXP_PER_GAIN:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="单次经验值获取不能超过5000"
+            detail=f"单次经验值获取不能超过{MAX_EXP_PER_GAIN}"
         )
     
-    # 处理等级提升
-    result = handle_level_up(character, exp)
+    # 扣除每日经验额度
+    reservation = exp_quota.reserve(db, character.id, exp)
+    if exp > 0 and reservation.granted <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"今日获得的经验值已达上限{exp_quota.DAILY_EXP_LIMIT}"
+        )
     
-    db.commit()
+    # 处理等级提升：读取最新的角色行结算后比较并交换写回，并发更新时重试
+    try:
+        for _ in range(GRANT_RETRIES):
+            row = db.query(*GRANT_COLUMNS).filter(Character.id == character.id).one()
+            result = apply_grant(db, SimpleNamespace(**row._asdict()), reservation.granted)
+            if result is not None:
+                break
+        else:
+            raise HTTPException(status_code=409, detail="角色数据正在更新，请稍后重试")
+        db.commit()
+    except Exception:
+        db.rollback()
+        reservation.release()
+        raise
     db.refresh(character)
     
-    return character
+    if result["level_up"]:
+        after_level_up(character, current_user.username, result["levels_gained"])
+    
+    return character, reservation.granted
+
+# 获取经验值（异步会话）
+async def gain_exp_async(character_id: int, exp: int, db: AsyncSession, current_user: User) -> Tuple[SimpleNamespace, int]:
+    """
+    与 gain_exp 相同：额度预占和比较并交换写回通过异步会话执行，
+    升级后的排行榜同步和事件发布（同步Redis调用）在一次线程池调用中完成
+    """
+    grant_row = select(*GRANT_COLUMNS).where(Character.id == character_id)
+    row = (await db.execute(grant_row.where(Character.user_id == current_user.id))).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="角色不存在"
+        )
+    
+    if exp > MAX_EXP_PER_GAIN:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次经验值获取不能超过{MAX_EXP_PER_GAIN}"
+        )
+    
+    reservation = await exp_quota.reserve_async(db, character_id, exp)
+    if exp > 0 and reservation.granted <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"今日获得的经验值已达上限{exp_quota.DAILY_EXP_LIMIT}"
+        )
+    
+    try:
+        for attempt in range(GRANT_RETRIES):
+            if attempt:
+                row = (await db.execute(grant_row)).one()
+            character = SimpleNamespace(**row._asdict())
+            result = await apply_grant_async(db, character, reservation.granted)
+            if result is not None:
+                break
+        else:
+            raise HTTPException(status_code=409, detail="角色数据正在更新，请稍后重试")
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await reservation.release_async()
+        raise
+    
+    if result["level_up"]:
+        await run_in_threadpool(after_level_up, character, current_user.username, result["levels_gained"])
+    
+    return character, reservation.granted
+
+# 升级后的处理
+def after_level_up(character, username: str, levels_gained: int):
+    """等级变化后同步排行榜，并推进升级类任务"""
+    effective_stats.invalidate(character.id)
+    leaderboard.update_character(character, character.power, username)
+    game_events.emit(game_events.LEVEL_UP, character.id, amount=levels_gained)
 
 # 角色获取经验值
 @router.post("/gain-exp", response_model=LevelResponse)
 def character_gain_exp(exp_gain: ExpGain, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """角色获取经验值"""
-    character = gain_exp(exp_gain.character_id, exp_gain.exp, db, current_user)
-    
-    next_level_exp = calculate_next_level_exp(character.level)
-    
+    character, exp_gained = gain_exp(exp_gain.character_id, exp_gain.exp, db, current_user)
+    return level_response(character, exp_gained)
+
+# 角色获取经验值（异步会话）
+async def character_gain_exp_async(exp_gain: ExpGain, current_user: User, db: AsyncSession) -> Dict:
+    character, exp_gained = await gain_exp_async(exp_gain.character_id, exp_gain.exp, db, current_user)
+    return level_response(character, exp_gained)
+
+def level_response(character, exp_gained: int) -> Dict:
+    next_level_exp = get_next_level_exp(character.level)
     return {
         "character_id": character.id,
         "name": character.name,
@@ -188,34 +272,157 @@ def character_gain_exp(exp_gain: ExpGain, current_user: User = Depends(get_curre
         "exp": character.exp,
         "next_level_exp": next_level_exp,
         "level_up": character.level > 1,
-        "new_level": character.level
+        "new_level": character.level,
+        "exp_gained": exp_gained
     }
 
+# 批量发放经验值时读取的角色字段，以及结算后写回的字段
+GRANT_COLUMNS = (
+    Character.id, Character.name, Character.user_id, Character.class_type, Character.level, Character.exp,
+    Character.strength, Character.agility, Character.intelligence, Character.vitality,
+    Character.hp, Character.mp, Character.attack, Character.defense, Character.power,
+)
+# 战力不在其中，按等级差增量更新
+GRANT_UPDATE_FIELDS = (
+    "id", "level", "exp", "strength", "agility", "intelligence", "vitality",
+    "hp", "mp", "attack", "defense",
+)
+
+# 结算经验值并比较并交换写回
+def apply_grant(db: Session, character: SimpleNamespace, exp: int, **values) -> Optional[Dict]:
+    """
+    按 handle_level_up 结算 GRANT_COLUMNS 读取的角色行，用 UPDATE ... WHERE level/exp 未变 写回（不提交），
+    战力按等级差增量更新，values 为需要一并写入的其他列；
+    写回成功时 character 的战力更新为数据库中的新值并返回结算结果，比较失败返回None，由调用方重新读取后重试
+    """
+    statement, result = _grant_statement(character, exp, values)
+    return _grant_applied(character, result, db.execute(statement).first())
+
+# 结算经验值并比较并交换写回（异步会话）
+async def apply_grant_async(db: AsyncSession, character: SimpleNamespace, exp: int, **values) -> Optional[Dict]:
+    statement, result = _grant_statement(character, exp, values)
+    return _grant_applied(character, result, (await db.execute(statement)).first())
+
+def _grant_statement(character: SimpleNamespace, exp: int, values: Dict):
+    # 结算经验值，生成 WHERE level/exp 未变 的比较并交换语句
+    original_level, original_exp = character.level, character.exp
+    result = handle_level_up(character, exp)
+    changes = {field: getattr(character, field) for field in GRANT_UPDATE_FIELDS if field != "id"}
+    statement = (
+        update(Character)
+        .where(Character.id == character.id, Character.level == original_level, Character.exp == original_exp)
+        .values(power=Character.power + result["levels_gained"] * LEVEL_POWER, **values, **changes)
+        .returning(Character.power)
+        .execution_options(synchronize_session=False)
+    )
+    return statement, result
+
+def _grant_applied(character: SimpleNamespace, result: Dict, updated) -> Optional[Dict]:
+    if updated is None:
+        metrics.incr("exp_grant.conflicts")
+        return None
+    character.power = updated.power
+    return result
+
+# 批量获取经验值
+def grant_exp_batch(grants: List[ExpGain], db: Session, user_id: int = None) -> Dict:
+    """
+    为多个角色发放经验值（团队副本、公会活动奖励）
+    一次查询加载全部角色，按 handle_level_up 的规则结算，在同一事务中逐行用
+    UPDATE ... WHERE level = 原等级 AND exp = 原经验 写回（战力按等级差增量更新）；
+    并发的升级、领奖或穿戴导致比较失败的角色重新读取后重试，同一角色出现多次时经验值累加
+    指定 user_id 时只发放给该用户的角色，其余角色计入 missing
+    """
+    for grant in grants:
+        if grant.exp > MAX_EXP_PER_GAIN:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"单次经验值获取不能超过{MAX_EXP_PER_GAIN}"
+            )
+
+    exp_by_character: Dict[int, int] = {}
+    for grant in grants:
+        exp_by_character[grant.character_id] = exp_by_character.get(grant.character_id, 0) + grant.exp
+
+    def load(character_ids):
+        query = db.query(*GRANT_COLUMNS, User.username).join(User, User.id == Character.user_id).filter(
+            Character.id.in_(character_ids)
+        )
+        if user_id is not None:
+            query = query.filter(Character.user_id == user_id)
+        return query.all()
+
+    rows = load(exp_by_character)
+    found = [row.id for row in rows]
+
+    # 扣除每日经验额度（每个角色一次，重试时不重复扣除）
+    reservations = {character_id: exp_quota.reserve(db, character_id, exp_by_character[character_id]) for character_id in found}
+    results = {}
+    level_ups = []
+    level_events = []
+    try:
+        pending = rows
+        for _ in range(GRANT_RETRIES):
+            conflicts = []
+            for row in pending:
+                character = SimpleNamespace(**row._asdict())
+                granted = reservations[character.id].granted
+                result = apply_grant(db, character, granted)
+                if result is None:
+                    conflicts.append(character.id)
+                    continue
+                if result["level_up"]:
+                    level_ups.append(character)
+                    level_events.append(game_events.GameEvent(
+                        game_events.LEVEL_UP, character.id, amount=result["levels_gained"]
+                    ))
+                results[character.id] = {
+                    "character_id": character.id,
+                    "name": character.name,
+                    "level": character.level,
+                    "exp": character.exp,
+                    "next_level_exp": get_next_level_exp(character.level),
+                    "level_up": result["level_up"],
+                    "levels_gained": result["levels_gained"],
+                    "exp_gained": granted
+                }
+            if not conflicts:
+                break
+            pending = load(conflicts)
+        else:
+            raise HTTPException(status_code=409, detail="角色数据正在更新，请稍后重试")
+        db.commit()
+    except Exception:
+        db.rollback()
+        for reservation in reservations.values():
+            reservation.release()
+        raise
+
+    # 等级变化后同步排行榜
+    effective_stats.invalidate(*(character.id for character in level_ups))
+    for character in level_ups:
+        leaderboard.sync_character(character, db, character.username)
+    game_events.emit_many(level_events)
+
+    return {
+        "results": [results[character_id] for character_id in found],
+        "missing": [character_id for character_id in exp_by_character if character_id not in results]
+    }
+
+# 批量发放经验值
+@router.post("/gain-exp/batch", response_model=ExpGrantBatchResponse)
+def batch_gain_exp(batch: ExpGrantBatch, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """为当前用户的多个角色批量发放经验值，返回每个角色的升级结果"""
+    return grant_exp_batch(batch.grants, db, current_user.id)
+
 # 批量获取角色等级信息
 @router.get("/", response_model=Dict)
 def get_characters_level(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """获取当前用户所有角色的等级信息"""
     characters = db.query(Character).filter(Character.user_id == current_user.id).all()
-    
-    result = []
-    for character in characters:
-        next_level_exp = calculate_next_level_exp(character.level)
-        result.append({
-            "character_id": character.id,
-            "name": character.name,
-            "level": character.level,
-            "exp": character.exp,
-            "next_level_exp": next_level_exp,
-            "exp_percentage": min(100, (character.exp / next_level_exp) * 100),
-            # 属性信息
-            "strength": character.strength,
-            "agility": character.agility,
-            "intelligence": character.intelligence,
-            "vitality": character.vitality,
-            "hp": character.hp,
-            "mp": character.mp,
-            "attack": character.attack,
-            "defense": character.defense
-        })
-    
-    return {"characters": result}
+    return {"characters": [level_info(character) for character in characters]}
+
+# 批量获取角色等级信息（异步会话）
+async def get_characters_level_async(current_user: User, db: AsyncSession) -> Dict:
+    characters = (await db.scalars(select(Character).where(Character.user_id == current_user.id))).all()
+    return {"characters": [level_info(character) for character in characters]}
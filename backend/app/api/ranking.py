@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List
-from app.database import get_db
+from typing import Callable, List, Optional, Tuple
+from app import metrics, response_cache
+from app.database import SessionLocal, get_db
 from app.auth.dependencies import get_current_user
 from app.models.user import User
 from app.models.character import Character
-from app.models.equipment import EquipmentSlot, Equipment
+from app.services import leaderboard, ranking_snapshot
 
 # 创建路由器
 router = APIRouter(prefix="/ranking", tags=["ranking"])
@@ -18,147 +22,348 @@ class RankingItem(BaseModel):
     character_name: str
     user_id: int
     username: str
+    class_type: Optional[str] = None
     level: int
     power: int
 
 class RankingResponse(BaseModel):
     ranking: List[RankingItem]
-    personal_rank: int = None
+    personal_rank: Optional[int] = None
+    # 分页信息：排行榜总人数、下一页起始位置（没有下一页时为空）
+    total: Optional[int] = None
+    next_offset: Optional[int] = None
 
-# 计算角色战力
-def calculate_character_power(character: Character, db: Session) -> int:
-    """
-    计算角色战力
-    公式: 基础战力 + 等级战力 + 装备战力
-    基础战力: 100
-    等级战力: 等级 * 10
-    装备战力: 所有装备属性之和
-    """
-    # 基础战力
-    base_power = 100
-    # 等级战力
-    level_power = character.level * 10
-    # 装备战力
-    equipment_power = 0
-    
-    # 获取角色已穿戴的装备
-    equipment_slots = db.query(EquipmentSlot).filter(EquipmentSlot.character_id == character.id).all()
-    for slot in equipment_slots:
-        equipment = db.query(Equipment).filter(Equipment.id == slot.equipment_id).first()
-        if equipment:
-            equipment_power += equipment.attack
-            equipment_power += equipment.defense
-            equipment_power += equipment.strength
-            equipment_power += equipment.agility
-            equipment_power += equipment.intelligence
-            equipment_power += equipment.vitality
-    
-    # 总战力
-    total_power = base_power + level_power + equipment_power
-    return total_power
+# 排序规则：等级排行按等级、战力降序；战力排行按战力降序；并列时角色ID小者在前
+RANK_ORDER = {
+    "level": (Character.level, Character.power),
+    "power": (Character.power,),
+}
 
-# 获取等级排行榜
-@router.get("/level", response_model=RankingResponse)
-def get_level_ranking(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """获取等级排行榜"""
-    # 获取所有角色
-    characters = db.query(Character).all()
-    
-    # 计算每个角色的战力
-    character_data = []
-    for character in characters:
-        power = calculate_character_power(character, db)
-        character_data.append({
+# 解析排行榜筛选条件
+def parse_scope(class_type: Optional[str], bracket: Optional[str]) -> Optional[Tuple[int, int]]:
+    """校验职业/等级段筛选条件，返回等级段的 (起始等级, 结束等级)"""
+    if class_type and bracket:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="职业和等级段不能同时筛选"
+        )
+    if not bracket:
+        return None
+    try:
+        start, end = (int(part) for part in bracket.split("-"))
+    except ValueError:
+        start, end = 0, 0
+    if start < 1 or leaderboard.level_bracket(start) != bracket:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"无效的等级段，等级段以{leaderboard.BRACKET_SIZE}级为单位，如 1-{leaderboard.BRACKET_SIZE}"
+        )
+    return start, end
+
+def _rank_scope(board: str, class_type: str = None, level_range: Tuple[int, int] = None):
+    """排序列、排序规则和筛选条件"""
+    columns = RANK_ORDER[board]
+    order_by = [column.desc() for column in columns] + [Character.id]
+    scope = []
+    if class_type:
+        scope.append(Character.class_type == class_type)
+    if level_range:
+        scope.append(Character.level.between(*level_range))
+    return columns, order_by, scope
+
+
+def _ahead_of(columns, best: Character):
+    """构造 (c1, c2, ..., id) 字典序大于当前角色的条件"""
+    ahead = Character.id < best.id
+    for column in reversed(columns):
+        value = getattr(best, column.key)
+        ahead = or_(column > value, and_(column == value, ahead))
+    return ahead
+
+
+def _around_window(personal_rank: int, around_radius: int) -> Tuple[int, int]:
+    offset = max(personal_rank - 1 - around_radius, 0)
+    return offset, personal_rank + around_radius - offset
+
+
+def _ranking_rows(rows, offset: int) -> List[dict]:
+    return [
+        {
+            "rank": offset + i + 1,
             "character_id": character.id,
             "character_name": character.name,
             "user_id": character.user_id,
-            "username": db.query(User).filter(User.id == character.user_id).first().username,
+            "username": username,
+            "class_type": character.class_type,
             "level": character.level,
-            "power": power
-        })
+            "power": character.power or 0
+        }
+        for i, (character, username) in enumerate(rows)
+    ]
+
+
+# 从数据库读取排行榜
+def rank_from_database(db: Session, board: str, user_id: int, offset: int = 0, limit: int = 100,
+                       class_type: str = None, level_range: Tuple[int, int] = None,
+                       around_radius: int = None) -> Tuple[List[dict], int, Optional[int]]:
+    """
+    直接利用战力列和 (level, power) 索引排序，返回 (本页数据, 总人数, 个人排名)
+    前N名为一条 ORDER BY ... LIMIT 查询，个人排名为一条计数查询
+    指定 around_radius 时返回个人排名上下各 around_radius 名
+    """
+    columns, order_by, scope = _rank_scope(board, class_type, level_range)
+    
+    # 获取个人排名：先找到用户排名最高的角色，再统计排在它前面的角色数量
+    personal_rank = None
+    best = db.query(Character).filter(Character.user_id == user_id, *scope).order_by(*order_by).first()
+    if best:
+        personal_rank = db.query(func.count(Character.id)).filter(_ahead_of(columns, best), *scope).scalar() + 1
     
-    # 按等级排序，等级相同按经验值排序
-    character_data.sort(key=lambda x: (x["level"], x["power"]), reverse=True)
+    if around_radius is not None:
+        if personal_rank is None:
+            return [], 0, None
+        offset, limit = _around_window(personal_rank, around_radius)
     
-    # 生成排行榜
-    ranking = []
-    for i, data in enumerate(character_data[:100]):
-        ranking.append({
-            "rank": i + 1,
-            "character_id": data["character_id"],
-            "character_name": data["character_name"],
-            "user_id": data["user_id"],
-            "username": data["username"],
-            "level": data["level"],
-            "power": data["power"]
-        })
+    total = db.query(func.count(Character.id)).filter(*scope).scalar()
+    rows = db.query(Character, User.username).join(User, User.id == Character.user_id).filter(*scope).order_by(
+        *order_by
+    ).offset(offset).limit(limit).all()
+    return _ranking_rows(rows, offset), total, personal_rank
+
+# 从数据库读取排行榜（异步会话）
+async def rank_from_database_async(db: AsyncSession, board: str, user_id: int, offset: int = 0, limit: int = 100,
+                                   class_type: str = None, level_range: Tuple[int, int] = None,
+                                   around_radius: int = None) -> Tuple[List[dict], int, Optional[int]]:
+    """与 rank_from_database 相同的查询，通过异步会话执行"""
+    columns, order_by, scope = _rank_scope(board, class_type, level_range)
     
-    # 获取个人排名
     personal_rank = None
-    user_characters = [data for data in character_data if data["user_id"] == current_user.id]
-    if user_characters:
-        # 找到用户最高等级的角色
-        highest_level_character = max(user_characters, key=lambda x: (x["level"], x["power"]))
-        # 找到该角色在排行榜中的位置
-        for i, item in enumerate(character_data):
-            if item["character_id"] == highest_level_character["character_id"]:
-                personal_rank = i + 1
-                break
+    best = (await db.execute(
+        select(Character).where(Character.user_id == user_id, *scope).order_by(*order_by).limit(1)
+    )).scalars().first()
+    if best:
+        personal_rank = await db.scalar(select(func.count(Character.id)).where(_ahead_of(columns, best), *scope)) + 1
+    
+    if around_radius is not None:
+        if personal_rank is None:
+            return [], 0, None
+        offset, limit = _around_window(personal_rank, around_radius)
     
+    total = await db.scalar(select(func.count(Character.id)).where(*scope))
+    rows = (await db.execute(
+        select(Character, User.username).join(User, User.id == Character.user_id).where(*scope).order_by(
+            *order_by
+        ).offset(offset).limit(limit)
+    )).all()
+    return _ranking_rows(rows, offset), total, personal_rank
+
+# 从排行榜有序集合读取一页
+def leaderboard_page(db: Session, view: str, user_id: int, offset: int, limit: int) -> Optional[Tuple[List[dict], int, Optional[int]]]:
+    """实时模式：从Redis有序集合读取，排行榜未就绪或Redis不可用时返回None"""
+    if not leaderboard.ensure_ready(db):
+        return None
+    result = leaderboard.get_page(view, offset, limit)
+    if result is None:
+        return None
+    return (*result, leaderboard.get_personal_rank(view, user_id))
+
+
+# 从排行榜有序集合读取个人附近的排名
+def leaderboard_around(db: Session, view: str, user_id: int, radius: int) -> Optional[Tuple[List[dict], int, Optional[int]]]:
+    if not leaderboard.ensure_ready(db):
+        return None
+    return leaderboard.get_around(view, user_id, radius)
+
+
+def _with_session(read: Callable, *args):
+    # 在线程池中调用，排行榜需要重建时使用独立的同步会话
+    with SessionLocal() as db:
+        return read(db, *args)
+
+
+def _page_response(page: Tuple[List[dict], int, Optional[int]], offset: int, limit: int) -> dict:
+    ranking, total, personal_rank = page
+    next_offset = offset + limit
     return {
         "ranking": ranking,
-        "personal_rank": personal_rank
+        "personal_rank": personal_rank,
+        "total": total,
+        "next_offset": next_offset if next_offset < total else None
     }
 
-# 获取战力排行榜
-@router.get("/power", response_model=RankingResponse)
-def get_power_ranking(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """获取战力排行榜"""
-    # 获取所有角色
-    characters = db.query(Character).all()
-    
-    # 计算每个角色的战力
-    character_data = []
-    for character in characters:
-        power = calculate_character_power(character, db)
-        character_data.append({
-            "character_id": character.id,
-            "character_name": character.name,
-            "user_id": character.user_id,
-            "username": db.query(User).filter(User.id == character.user_id).first().username,
-            "level": character.level,
-            "power": power
-        })
+
+def _around_response(result: Tuple[List[dict], int, Optional[int]]) -> dict:
+    ranking, total, personal_rank = result
+    return {
+        "ranking": ranking,
+        "personal_rank": personal_rank,
+        "total": total
+    }
+
+
+async def _snapshot_async() -> ranking_snapshot.RankingSnapshot:
+    # 快照已加载时直接读取内存，首次构建在线程池中执行
+    return ranking_snapshot.current() or await run_in_threadpool(ranking_snapshot.get_snapshot)
+
+
+# 读取排行榜的一页
+def read_ranking_page(db: Session, board: str, user_id: int, offset: int, limit: int,
+                      class_type: Optional[str], bracket: Optional[str]) -> dict:
+    """
+    按名次分页读取排行榜
+    快照模式读取快照中的有序数组；实时模式读取Redis有序集合；Redis不可用时回退到数据库
+    """
+    level_range = parse_scope(class_type, bracket)
+    view = leaderboard.view_key(board, class_type, bracket)
     
-    # 按战力排序
-    character_data.sort(key=lambda x: x["power"], reverse=True)
+    if ranking_snapshot.enabled():
+        # 快照模式：直接读取定时生成的快照
+        board_view = ranking_snapshot.get_snapshot(db).view(view)
+        page = (board_view.page(offset, limit), board_view.total, board_view.personal_rank.get(user_id))
+    else:
+        # 实时模式：从排行榜有序集合读取
+        page = leaderboard_page(db, view, user_id, offset, limit)
+    if page is None:
+        # Redis不可用时回退到数据库查询
+        page = rank_from_database(db, board, user_id, offset, limit, class_type, level_range)
+    return _page_response(page, offset, limit)
+
+# 读取排行榜的一页（异步会话）
+async def read_ranking_page_async(db: AsyncSession, board: str, user_id: int, offset: int, limit: int,
+                                  class_type: Optional[str], bracket: Optional[str]) -> dict:
+    """与 read_ranking_page 相同，Redis读取在一次线程池调用中完成，数据库回退使用异步会话"""
+    level_range = parse_scope(class_type, bracket)
+    view = leaderboard.view_key(board, class_type, bracket)
     
-    # 生成排行榜
-    ranking = []
-    for i, data in enumerate(character_data[:100]):
-        ranking.append({
-            "rank": i + 1,
-            "character_id": data["character_id"],
-            "character_name": data["character_name"],
-            "user_id": data["user_id"],
-            "username": data["username"],
-            "level": data["level"],
-            "power": data["power"]
-        })
+    if ranking_snapshot.enabled():
+        board_view = (await _snapshot_async()).view(view)
+        page = (board_view.page(offset, limit), board_view.total, board_view.personal_rank.get(user_id))
+    else:
+        page = await run_in_threadpool(_with_session, leaderboard_page, view, user_id, offset, limit)
+    if page is None:
+        page = await rank_from_database_async(db, board, user_id, offset, limit, class_type, level_range)
+    return _page_response(page, offset, limit)
+
+# 读取个人附近的排名
+def read_ranking_around(db: Session, board: str, user_id: int, radius: int,
+                        class_type: Optional[str], bracket: Optional[str]) -> dict:
+    """读取用户最佳角色上下各 radius 名，数据来源与 read_ranking_page 相同"""
+    level_range = parse_scope(class_type, bracket)
+    view = leaderboard.view_key(board, class_type, bracket)
     
-    # 获取个人排名
-    personal_rank = None
-    user_characters = [data for data in character_data if data["user_id"] == current_user.id]
-    if user_characters:
-        # 找到用户最高战力的角色
-        highest_power_character = max(user_characters, key=lambda x: x["power"])
-        # 找到该角色在排行榜中的位置
-        for i, item in enumerate(character_data):
-            if item["character_id"] == highest_power_character["character_id"]:
-                personal_rank = i + 1
-                break
+    if ranking_snapshot.enabled():
+        board_view = ranking_snapshot.get_snapshot(db).view(view)
+        ranking, personal_rank = board_view.around(user_id, radius)
+        result = (ranking, board_view.total, personal_rank)
+    else:
+        result = leaderboard_around(db, view, user_id, radius)
+    if result is None:
+        result = rank_from_database(db, board, user_id, class_type=class_type,
+                                    level_range=level_range, around_radius=radius)
+    return _around_response(result)
+
+# 读取个人附近的排名（异步会话）
+async def read_ranking_around_async(db: AsyncSession, board: str, user_id: int, radius: int,
+                                    class_type: Optional[str], bracket: Optional[str]) -> dict:
+    level_range = parse_scope(class_type, bracket)
+    view = leaderboard.view_key(board, class_type, bracket)
     
+    if ranking_snapshot.enabled():
+        board_view = (await _snapshot_async()).view(view)
+        ranking, personal_rank = board_view.around(user_id, radius)
+        result = (ranking, board_view.total, personal_rank)
+    else:
+        result = await run_in_threadpool(_with_session, leaderboard_around, view, user_id, radius)
+    if result is None:
+        result = await rank_from_database_async(db, board, user_id, class_type=class_type,
+                                                level_range=level_range, around_radius=radius)
+    return _around_response(result)
+
+# 排行榜数据版本号
+def ranking_version(db: Session):
+    """快照模式下为快照版本，实时模式下为排行榜更新计数，用于响应缓存和 ETag"""
+    if ranking_snapshot.enabled():
+        return ranking_snapshot.get_snapshot(db).version
+    return response_cache.get_version("ranking")
+
+# 排行榜数据版本号（异步接口使用）
+async def ranking_version_async():
+    if ranking_snapshot.enabled():
+        return (await _snapshot_async()).version
+    return await response_cache.get_version_async("ranking")
+
+# 校验排行榜名称
+def check_board(board: str):
+    if board not in leaderboard.BOARDS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="排行榜不存在"
+        )
+
+# 获取等级排行榜
+@router.get("/level", response_model=RankingResponse)
+def get_level_ranking(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    class_type: Optional[str] = None,
+    bracket: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取等级排行榜，支持分页以及按职业、等级段筛选"""
+    return response_cache.cached_response(
+        request, "ranking", ranking_version(db), RankingResponse,
+        lambda: read_ranking_page(db, "level", current_user.id, offset, limit, class_type, bracket),
+        vary=current_user.id
+    )
+
+# 获取战力排行榜
+@router.get("/power", response_model=RankingResponse)
+def get_power_ranking(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    class_type: Optional[str] = None,
+    bracket: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取战力排行榜，支持分页以及按职业、等级段筛选"""
+    return response_cache.cached_response(
+        request, "ranking", ranking_version(db), RankingResponse,
+        lambda: read_ranking_page(db, "power", current_user.id, offset, limit, class_type, bracket),
+        vary=current_user.id
+    )
+
+# 获取个人附近的排名
+@router.get("/{board}/around-me", response_model=RankingResponse)
+def get_ranking_around_me(
+    request: Request,
+    board: str,
+    radius: int = Query(5, ge=0, le=50),
+    class_type: Optional[str] = None,
+    bracket: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取当前用户最佳角色上下各 radius 名的排行数据"""
+    check_board(board)
+    return response_cache.cached_response(
+        request, "ranking", ranking_version(db), RankingResponse,
+        lambda: read_ranking_around(db, board, current_user.id, radius, class_type, bracket),
+        vary=current_user.id
+    )
+
+# 排行榜快照状态
+@router.get("/snapshot")
+def get_snapshot_status(current_user: User = Depends(get_current_user)):
+    """获取当前排行榜快照的版本、生成时间和构建耗时"""
+    snapshot = ranking_snapshot.current()
     return {
-        "ranking": ranking,
-        "personal_rank": personal_rank
+        "enabled": ranking_snapshot.enabled(),
+        "interval": ranking_snapshot.SNAPSHOT_INTERVAL,
+        "version": snapshot.version if snapshot else None,
+        "built_at": snapshot.built_at if snapshot else None,
+        "build_seconds": metrics.snapshot()["timings"].get("ranking.snapshot.build_seconds")
     }
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from app import response_cache
 from app.database import get_db
-from app.models.shop import Product, Order, PaymentStatus
+from app.models.shop import Product, Order, PaymentStatus, ProductType
 from app.models.user import User
+from app.models.character import Character
+from app.services import catalog, game_events, inventory
 from app.schemas.shop import ProductCreate, ProductResponse, OrderCreate, OrderResponse, RechargeRequest, RechargeResponse
 from typing import List
 
@@ -17,6 +20,7 @@ def create_product(product_data: ProductCreate, db: Session = Depends(get_db)):
     db.add(product)
     db.commit()
     db.refresh(product)
+    catalog.invalidate("products")
     
     return {
         "id": product.id,
@@ -34,9 +38,19 @@ def create_product(product_data: ProductCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/products", response_model=List[ProductResponse])
-def get_products(db: Session = Depends(get_db)):
+def get_products(request: Request, db: Session = Depends(get_db)):
     """获取商品列表"""
-    products = db.query(Product).filter(Product.is_active == PaymentStatus.PENDING).all()
+    return response_cache.cached_response(
+        request, "products", response_cache.get_version("products"), List[ProductResponse], lambda: list_products(db)
+    )
+
+
+def list_products(db: Session):
+    """从商品目录缓存读取上架中的商品"""
+    products = [
+        product for product in catalog.get_catalog("products", db).items
+        if product.is_active == PaymentStatus.PENDING
+    ]
     
     return [{
         "id": product.id,
@@ -56,7 +70,7 @@ def get_products(db: Session = Depends(get_db)):
 @router.get("/products/{product_id}", response_model=ProductResponse)
 def get_product(product_id: int, db: Session = Depends(get_db)):
     """获取单个商品详情"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = catalog.get_catalog("products", db).get(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="商品不存在")
     
@@ -92,12 +106,19 @@ def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
     if product.is_active != PaymentStatus.PENDING:
         raise HTTPException(status_code=400, detail="商品未激活")
     
+    # 检查接收物品的角色是否属于该用户
+    if order_data.character_id is not None:
+        owner_id = db.query(Character.user_id).filter(Character.id == order_data.character_id).scalar()
+        if owner_id != order_data.user_id:
+            raise HTTPException(status_code=404, detail="角色不存在")
+    
     # 计算总价
     total_price = product.price * order_data.quantity
     
     # 创建订单
     order = Order(
         user_id=order_data.user_id,
+        character_id=order_data.character_id,
         product_id=order_data.product_id,
         quantity=order_data.quantity,
         total_price=total_price,
@@ -111,6 +132,7 @@ def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
     return {
         "id": order.id,
         "user_id": order.user_id,
+        "character_id": order.character_id,
         "product_id": order.product_id,
         "quantity": order.quantity,
         "total_price": order.total_price,
@@ -129,6 +151,7 @@ def get_user_orders(user_id: int, db: Session = Depends(get_db)):
     return [{
         "id": order.id,
         "user_id": order.user_id,
+        "character_id": order.character_id,
         "product_id": order.product_id,
         "quantity": order.quantity,
         "total_price": order.total_price,
@@ -151,14 +174,41 @@ def pay_order(order_id: int, db: Session = Depends(get_db)):
     if order.payment_status != PaymentStatus.PENDING:
         raise HTTPException(status_code=400, detail="订单状态不正确")
     
-    # 更新订单状态为已完成
-    order.payment_status = PaymentStatus.COMPLETED
+    # 物品类商品与订单状态在同一事务中放入角色背包
+    character_id = None
+    if order.product.type == ProductType.ITEM:
+        character_id = order.character_id or db.query(Character.id).filter(
+            Character.user_id == order.user_id
+        ).order_by(Character.id).limit(1).scalar()
+        if character_id is None:
+            raise HTTPException(status_code=400, detail="没有可接收物品的角色")
+        try:
+            inventory.add(db, character_id, {
+                inventory.product_key(order.product_id): order.quantity * (order.product.quantity or 1)
+            })
+        except inventory.InventoryError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="订单数量无效")
+    
+    # 更新订单状态为已完成（条件更新，并发支付同一订单时只有一次生效，物品不会重复发放）
+    paid = db.query(Order).filter(Order.id == order_id, Order.payment_status == PaymentStatus.PENDING).update(
+        {Order.payment_status: PaymentStatus.COMPLETED}, synchronize_session=False
+    )
+    if paid != 1:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="订单状态不正确")
     db.commit()
+    if character_id is not None:
+        inventory.invalidate(character_id)
     db.refresh(order)
     
+    # 推进购买类任务（作用于该用户的全部角色）
+    game_events.emit(game_events.PURCHASE, user_id=order.user_id, amount=order.quantity, target=order.product_id)
+    
     return {
         "id": order.id,
         "user_id": order.user_id,
+        "character_id": order.character_id,
         "product_id": order.product_id,
         "quantity": order.quantity,
         "total_price": order.total_price,
@@ -192,6 +242,7 @@ def recharge(recharge_data: RechargeRequest, db: Session = Depends(get_db)):
     db.add(recharge_product)
     db.commit()
     db.refresh(recharge_product)
+    catalog.invalidate("products")
     
     # 创建订单
     order = Order(
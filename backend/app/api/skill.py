@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from app import response_cache
 from app.database import get_db
 from app.auth.dependencies import get_current_user
 from app.models.user import User
 from app.models.character import Character
 from app.models.skill import Skill, CharacterSkill
+from app.services import catalog, effective_stats
 from pydantic import BaseModel
 from typing import List
 
@@ -62,13 +64,17 @@ def create_skill(skill: SkillCreate, db: Session = Depends(get_db)):
     db.add(db_skill)
     db.commit()
     db.refresh(db_skill)
+    catalog.invalidate("skills")
     return db_skill
 
 
 @router.get("/skills", response_model=List[SkillResponse])
-def get_skills(db: Session = Depends(get_db)):
+def get_skills(request: Request, db: Session = Depends(get_db)):
     """获取所有技能"""
-    return db.query(Skill).all()
+    return response_cache.cached_response(
+        request, "skills", response_cache.get_version("skills"), List[SkillResponse],
+        lambda: catalog.get_catalog("skills", db).items
+    )
 
 
 @router.get("/characters/{character_id}/skills", response_model=List[CharacterSkillResponse])
@@ -89,7 +95,7 @@ def learn_skill(character_id: int, skill_data: CharacterSkillBase, db: Session =
         raise HTTPException(status_code=404, detail="角色不存在")
 
     # 检查技能是否存在
-    skill = db.query(Skill).filter(Skill.id == skill_data.skill_id).first()
+    skill = catalog.get_catalog("skills", db).get(skill_data.skill_id)
     if not skill:
         raise HTTPException(status_code=404, detail="技能不存在")
 
@@ -114,6 +120,7 @@ def learn_skill(character_id: int, skill_data: CharacterSkillBase, db: Session =
     )
     db.add(character_skill)
     db.commit()
+    effective_stats.invalidate(character_id)
     db.refresh(character_skill)
     return character_skill
 
@@ -143,5 +150,6 @@ def upgrade_skill(upgrade_data: CharacterSkillUpgrade, db: Session = Depends(get
     character_skill.skill_level += 1
     character_skill.experience = 0  # 重置经验值
     db.commit()
+    effective_stats.invalidate(character_skill.character_id)
     db.refresh(character_skill)
     return character_skill
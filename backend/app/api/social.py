@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.social import Friend, ChatMessage
 from app.models.user import User
+from app.services import game_events
 from app.schemas.social import FriendRequest, FriendResponse, MessageRequest, MessageResponse
 from typing import List
 
@@ -61,6 +62,12 @@ def accept_friend_request(friend_data: FriendRequest, db: Session = Depends(get_
     db.commit()
     db.refresh(friend_request)
     
+    # 双方都推进添加好友类任务
+    game_events.emit_many([
+        game_events.GameEvent(game_events.FRIEND_ADDED, user_id=friend_request.user_id),
+        game_events.GameEvent(game_events.FRIEND_ADDED, user_id=friend_request.friend_id)
+    ])
+    
     return {
         "id": friend_request.id,
         "user_id": friend_request.user_id,
@@ -1,14 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import exists, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased, joinedload
+from app import metrics, response_cache
 from app.database import get_db
 from app.models.character import Character
-from app.models.task import Task, CharacterTask, TaskStatus
-from pydantic import BaseModel
-from typing import List
-from datetime import datetime, timedelta
+from app.models.user import User
+from app.models.task import Task, CharacterTask, TaskPrerequisite, TaskStatus
+from app.api.level import GRANT_COLUMNS, apply_grant
+from app.services import catalog, effective_stats, exp_quota, game_events, idempotency, inventory, leaderboard, quest_graph, task_progress
+from pydantic import BaseModel, Field
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Union
+from datetime import datetime
 
 router = APIRouter()
 
+# 单次上报的最大事件数
+MAX_EVENT_REPORTS = 100
+# 领奖时角色行比较并交换更新的重试次数
+REWARD_RETRIES = 5
+
+# 任务响应片段缓存：(任务目录, {任务ID: 任务响应字典})，目录重新加载后重建
+_task_fragments = (None, {})
+
 
 class TaskBase(BaseModel):
     name: str
@@ -20,14 +36,19 @@ class TaskBase(BaseModel):
     item_reward: str = ""
     target_count: int = 1
     reset_daily: bool = False
+    # 任务目标事件（见 game_events.EVENT_TYPES），为空时只能由客户端上报进度
+    objective_event: Optional[str] = None
+    objective_target: Optional[str] = None
 
 
 class TaskCreate(TaskBase):
-    pass
+    # 前置任务ID；不指定时主线任务接在最后一个主线任务之后，其他任务没有前置任务
+    prerequisite_ids: Optional[List[int]] = None
 
 
 class TaskResponse(TaskBase):
     id: int
+    prerequisite_ids: List[int] = []
 
     class Config:
         from_attributes = True
@@ -54,85 +75,222 @@ class CharacterTaskResponse(BaseModel):
         from_attributes = True
 
 
+class GameEventReport(BaseModel):
+    type: str
+    amount: int = Field(1, ge=1)
+    target: Optional[str] = None
+
+
+class GameEventBatch(BaseModel):
+    events: List[GameEventReport] = Field(..., min_length=1, max_length=MAX_EVENT_REPORTS)
+
+
+class RewardClaimResponse(BaseModel):
+    character_id: int
+    # 本次领取的任务ID
+    claimed: List[int]
+    exp_gained: int
+    gold_gained: int
+    items: List[str]
+    level: Optional[int] = None
+    exp: Optional[int] = None
+    level_up: bool
+    levels_gained: int
+    # 因本次领奖解锁的后续任务ID
+    unlocked: List[int] = []
+
+
+class CharacterTaskCompact(BaseModel):
+    """精简的角色任务（供轮询进度的客户端使用，任务详情通过 /tasks 获取）"""
+    id: int
+    task_id: int
+    status: str
+    progress: int
+
+
+CharacterTaskList = Union[List[CharacterTaskResponse], List[CharacterTaskCompact]]
+
+
 @router.post("/tasks", response_model=TaskResponse)
 def create_task(task: TaskCreate, db: Session = Depends(get_db)):
     """创建新任务"""
-    db_task = Task(**task.dict())
+    if task.objective_event is not None and task.objective_event not in game_events.EVENT_TYPES:
+        raise HTTPException(status_code=400, detail="未知的任务目标事件")
+
+    # 装备奖励（equipment:<装备ID>）必须是已存在的装备
+    reward_equipment_id = inventory.equipment_id_of(task.item_reward or "")
+    if reward_equipment_id is not None and catalog.get_catalog("equipment", db).get(reward_equipment_id) is None:
+        raise HTTPException(status_code=400, detail="奖励装备不存在")
+
+    # 前置任务只能是已存在的任务，新任务不会形成环
+    if task.prerequisite_ids is None:
+        prerequisite_ids = quest_graph.default_prerequisites(task.type, db)
+    else:
+        prerequisite_ids = tuple(sorted(set(task.prerequisite_ids)))
+        existing = {task_id for (task_id,) in db.query(Task.id).filter(Task.id.in_(prerequisite_ids))}
+        if len(existing) < len(prerequisite_ids):
+            raise HTTPException(status_code=400, detail="前置任务不存在")
+
+    db_task = Task(**task.dict(exclude={"prerequisite_ids"}))
     db.add(db_task)
+    db.flush()
+    db.add_all(TaskPrerequisite(task_id=db_task.id, prerequisite_id=prerequisite_id) for prerequisite_id in prerequisite_ids)
     db.commit()
     db.refresh(db_task)
-    # 返回字典格式的数据
-    return {
-        "id": db_task.id,
-        "name": db_task.name,
-        "description": db_task.description,
-        "type": db_task.type,
-        "required_level": db_task.required_level,
-        "exp_reward": db_task.exp_reward,
-        "gold_reward": db_task.gold_reward,
-        "item_reward": db_task.item_reward or "",
-        "target_count": db_task.target_count,
-        "reset_daily": db_task.reset_daily
-    }
+    catalog.invalidate("tasks")
+    return serialize_task(db_task, prerequisite_ids)
 
 
 @router.get("/tasks", response_model=List[TaskResponse])
-def get_tasks(db: Session = Depends(get_db)):
+def get_tasks(request: Request, db: Session = Depends(get_db)):
     """获取所有任务"""
-    tasks = db.query(Task).all()
-    # 返回字典格式的数据列表
-    return [
-        {
-            "id": task.id,
-            "name": task.name,
-            "description": task.description,
-            "type": task.type,
-            "required_level": task.required_level,
-            "exp_reward": task.exp_reward,
-            "gold_reward": task.gold_reward,
-            "item_reward": task.item_reward or "",
-            "target_count": task.target_count,
-            "reset_daily": task.reset_daily
-        }
-        for task in tasks
-    ]
+    return response_cache.cached_response(
+        request, "tasks", response_cache.get_version("tasks"), List[TaskResponse], lambda: list_tasks(db)
+    )
+
+
+def list_tasks(db: Session):
+    """从任务目录缓存读取所有任务"""
+    return list(task_fragments(db).values())
 
 
-@router.get("/characters/{character_id}/tasks", response_model=List[CharacterTaskResponse])
-def get_character_tasks(character_id: int, db: Session = Depends(get_db)):
-    """获取角色的所有任务"""
+# 序列化任务
+def serialize_task(task, prerequisite_ids=()) -> Dict:
+    """任务记录（ORM对象或目录记录）转换为响应字典"""
+    return {
+        "id": task.id,
+        "name": task.name,
+        "description": task.description,
+        "type": task.type,
+        "required_level": task.required_level,
+        "exp_reward": task.exp_reward,
+        "gold_reward": task.gold_reward,
+        "item_reward": task.item_reward or "",
+        "target_count": task.target_count,
+        "reset_daily": task.reset_daily,
+        "objective_event": task.objective_event,
+        "objective_target": task.objective_target,
+        "prerequisite_ids": list(prerequisite_ids)
+    }
+
+
+# 获取任务响应片段
+def task_fragments(db: Session) -> Dict[int, Dict]:
+    """每个任务的响应字典只在任务目录加载时构建一次，序列化角色任务时直接引用"""
+    global _task_fragments
+    tasks = catalog.get_catalog("tasks", db)
+    cached_catalog, fragments = _task_fragments
+    if cached_catalog is not tasks:
+        prerequisites = quest_graph.get_graph(db).prerequisites
+        fragments = {task.id: serialize_task(task, prerequisites.get(task.id, ())) for task in tasks.items}
+        _task_fragments = (tasks, fragments)
+    return fragments
+
+
+def cached_task_fragments() -> Optional[Dict[int, Dict]]:
+    """任务目录已加载且响应片段已构建时返回片段，否则返回None（不访问数据库）"""
+    cached_catalog, fragments = _task_fragments
+    if cached_catalog is not None and cached_catalog is catalog.cached("tasks"):
+        return fragments
+    return None
+
+
+# 序列化角色任务
+def serialize_character_task(character_task: CharacterTask, db: Session, progress: int = None) -> Dict:
+    """任务详情优先使用目录中的响应片段，目录尚未包含该任务时使用已加载的任务"""
+    fragment = task_fragments(db).get(character_task.task_id) or serialize_task(character_task.task)
+    return {
+        "id": character_task.id,
+        "character_id": character_task.character_id,
+        "task_id": character_task.task_id,
+        "status": character_task.status,
+        "progress": character_task.progress if progress is None else progress,
+        "task": fragment
+    }
+
+
+@router.get("/characters/{character_id}/tasks", response_model=CharacterTaskList)
+def get_character_tasks(character_id: int, compact: bool = False, db: Session = Depends(get_db)):
+    """获取角色的所有任务，compact=true 时只返回任务ID、状态和进度"""
     character = db.query(Character).filter(Character.id == character_id).first()
     if not character:
         raise HTTPException(status_code=404, detail="角色不存在")
     
-    # 检查并重置日常任务
-    reset_daily_tasks(character_id, db)
-    
     # 获取或创建角色的任务列表
-    update_character_tasks(character_id, db)
+    update_character_tasks(character_id, db, character)
+    
+    # 只读取需要的列，任务详情来自任务目录，不逐条加载任务
+    rows = db.query(
+        CharacterTask.id, CharacterTask.task_id, CharacterTask.status, CharacterTask.progress
+    ).filter(CharacterTask.character_id == character_id).order_by(CharacterTask.id).all()
+    
+    # 尚未写回数据库的最新进度
+    buffered = task_progress.pending(row.id for row in rows if row.status == TaskStatus.ACCEPTED)
     
-    # 返回字典格式的数据列表
+    if compact:
+        return compact_task_list(rows, buffered)
+    
+    fragments = task_fragments(db)
+    missing = {row.task_id for row in rows} - fragments.keys()
+    if missing:
+        # 其他进程新建的任务尚未进入本进程的目录
+        fragments = {**fragments, **{task.id: serialize_task(task) for task in db.query(Task).filter(Task.id.in_(missing))}}
+    return task_list(character_id, rows, buffered, fragments)
+
+
+# 获取角色的所有任务（异步会话）
+async def get_character_tasks_async(character_id: int, compact: bool, db: AsyncSession):
+    """
+    与 get_character_tasks 相同，查询和任务同步通过异步会话执行，缓冲进度使用异步Redis客户端；
+    任务目录未加载时在线程池中加载一次
+    """
+    character = await db.get(Character, character_id)
+    if not character:
+        raise HTTPException(status_code=404, detail="角色不存在")
+    
+    tasks = catalog.cached("tasks") or await run_in_threadpool(catalog.get_catalog, "tasks")
+    await update_character_tasks_async(character, db, tasks.version)
+    
+    rows = (await db.execute(
+        select(CharacterTask.id, CharacterTask.task_id, CharacterTask.status, CharacterTask.progress)
+        .where(CharacterTask.character_id == character_id).order_by(CharacterTask.id)
+    )).all()
+    buffered = await task_progress.pending_async(row.id for row in rows if row.status == TaskStatus.ACCEPTED)
+    
+    if compact:
+        return compact_task_list(rows, buffered)
+    
+    fragments = cached_task_fragments() or await run_in_threadpool(task_fragments, None)
+    missing = {row.task_id for row in rows} - fragments.keys()
+    if missing:
+        loaded = await db.scalars(select(Task).where(Task.id.in_(missing)))
+        fragments = {**fragments, **{task.id: serialize_task(task) for task in loaded}}
+    return task_list(character_id, rows, buffered, fragments)
+
+
+def compact_task_list(rows, buffered: Dict[int, int]) -> List[Dict]:
+    return [
+        {
+            "id": row.id,
+            "task_id": row.task_id,
+            "status": row.status,
+            "progress": buffered.get(row.id, row.progress)
+        }
+        for row in rows
+    ]
+
+
+def task_list(character_id: int, rows, buffered: Dict[int, int], fragments: Dict[int, Dict]) -> List[Dict]:
     return [
         {
-            "id": character_task.id,
-            "character_id": character_task.character_id,
-            "task_id": character_task.task_id,
-            "status": character_task.status,
-            "progress": character_task.progress,
-            "task": {
-                "id": character_task.task.id,
-                "name": character_task.task.name,
-                "description": character_task.task.description,
-                "type": character_task.task.type,
-                "required_level": character_task.task.required_level,
-                "exp_reward": character_task.task.exp_reward,
-                "gold_reward": character_task.task.gold_reward,
-                "item_reward": character_task.task.item_reward or "",
-                "target_count": character_task.task.target_count,
-                "reset_daily": character_task.task.reset_daily
-            }
+            "id": row.id,
+            "character_id": character_id,
+            "task_id": row.task_id,
+            "status": row.status,
+            "progress": buffered.get(row.id, row.progress),
+            "task": fragments[row.task_id]
         }
-        for character_task in character.tasks
+        for row in rows
     ]
 
 
@@ -145,7 +303,7 @@ def accept_task(character_id: int, task_data: CharacterTaskBase, db: Session = D
         raise HTTPException(status_code=404, detail="角色不存在")
 
     # 检查任务是否存在
-    task = db.query(Task).filter(Task.id == task_data.task_id).first()
+    task = catalog.get_catalog("tasks", db).get(task_data.task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
 
@@ -170,8 +328,7 @@ def accept_task(character_id: int, task_data: CharacterTaskBase, db: Session = D
     character_task.status = TaskStatus.ACCEPTED
     character_task.accepted_at = datetime.utcnow()
     db.commit()
-    db.refresh(character_task)
-    return character_task
+    return serialize_character_task(character_task, db)
 
 
 @router.post("/characters/{character_id}/tasks/complete", response_model=CharacterTaskResponse)
@@ -183,7 +340,7 @@ def complete_task(character_id: int, task_data: CharacterTaskBase, db: Session =
         raise HTTPException(status_code=404, detail="角色不存在")
 
     # 查找角色的任务
-    character_task = db.query(CharacterTask).filter(
+    character_task = db.query(CharacterTask).options(joinedload(CharacterTask.task)).filter(
         CharacterTask.character_id == character_id,
         CharacterTask.task_id == task_data.task_id
     ).first()
@@ -204,42 +361,180 @@ def complete_task(character_id: int, task_data: CharacterTaskBase, db: Session =
     character_task.status = TaskStatus.COMPLETED
     character_task.completed_at = datetime.utcnow()
     db.commit()
-    db.refresh(character_task)
-    return character_task
+    return serialize_character_task(character_task, db)
+
+
+# 解锁后续任务
+def unlock_successors(character_id: int, level: int, rewarded_task_ids: List[int], db: Session) -> List[int]:
+    """
+    只检查刚领奖任务的直接后续任务：前置任务全部领奖且等级满足的，批量创建可接取记录
+    等级暂不满足的后续任务在角色升级后的任务同步中补齐
+    """
+    graph = quest_graph.get_graph(db)
+    successors = graph.successors(rewarded_task_ids)
+    if not successors:
+        return []
+
+    tasks = catalog.get_catalog("tasks", db)
+    required = {prerequisite_id for task_id in successors for prerequisite_id in graph.prerequisites[task_id]}
+    statuses = dict(db.query(CharacterTask.task_id, CharacterTask.status).filter(
+        CharacterTask.character_id == character_id,
+        CharacterTask.task_id.in_(required | set(successors))
+    ).all())
+    unlocked = [
+        task_id for task_id in successors
+        if task_id not in statuses
+        and tasks.get(task_id) is not None and (tasks.get(task_id).required_level or 0) <= level
+        and all(statuses.get(prerequisite_id) == TaskStatus.REWARDED for prerequisite_id in graph.prerequisites[task_id])
+    ]
+    if unlocked:
+        db.execute(insert(CharacterTask), [
+            {"character_id": character_id, "task_id": task_id, "status": TaskStatus.AVAILABLE, "progress": 0}
+            for task_id in unlocked
+        ])
+        metrics.incr("quest_graph.unlocked", len(unlocked))
+    return unlocked
+
+
+# 领取奖励（单个或全部已完成任务）
+def claim_rewards(character_id: int, task_ids: Optional[List[int]], db: Session) -> Dict:
+    """
+    在一个事务中领取奖励：先用条件 UPDATE（status='completed'）把任务标记为已领奖，
+    只为更新成功的任务发放奖励，并发的重复领取不会重复发放；
+    经验值经每日上限后按 handle_level_up 结算，金币累加，角色行用比较并交换更新
+    """
+    conditions = [CharacterTask.character_id == character_id, CharacterTask.status == TaskStatus.COMPLETED]
+    if task_ids is not None:
+        conditions.append(CharacterTask.task_id.in_(task_ids))
+    claimed = db.execute(
+        update(CharacterTask)
+        .where(*conditions)
+        .values(status=TaskStatus.REWARDED, rewarded_at=datetime.utcnow())
+        .returning(CharacterTask.id, CharacterTask.task_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not claimed:
+        db.rollback()
+        return {"character_task_ids": [], "claimed": [], "exp_gained": 0, "gold_gained": 0, "items": [],
+                "level_up": False, "levels_gained": 0, "unlocked": []}
+
+    # 汇总奖励
+    tasks = catalog.get_catalog("tasks", db)
+    rewards = [tasks.get(row.task_id) or db.get(Task, row.task_id) for row in claimed]
+    exp = sum(task.exp_reward or 0 for task in rewards)
+    gold = sum(task.gold_reward or 0 for task in rewards)
+    # 物品奖励放入背包，同种物品合并为一次写入
+    items = [task.item_reward for task in rewards if task.item_reward]
+
+    # 扣除每日经验额度
+    reservation = exp_quota.reserve(db, character_id, exp)
+    try:
+        for _ in range(REWARD_RETRIES):
+            row = db.query(*GRANT_COLUMNS, User.username).join(User, User.id == Character.user_id).filter(
+                Character.id == character_id
+            ).one()
+            character = SimpleNamespace(**row._asdict())
+            # 金币和战力以增量写入，不覆盖并发的装备、消费等更新
+            result = apply_grant(db, character, reservation.granted, gold=func.coalesce(Character.gold, 0) + gold)
+            if result is not None:
+                break
+            metrics.incr("task_reward.conflicts")
+        else:
+            raise HTTPException(status_code=409, detail="角色数据正在更新，请稍后重试")
+        unlocked = unlock_successors(character_id, character.level, [row.task_id for row in claimed], db)
+        if items:
+            inventory.add(db, character_id, inventory.count_items(items))
+        db.commit()
+    except Exception:
+        db.rollback()
+        reservation.release()
+        raise
+    metrics.incr("task_reward.claimed", len(claimed))
+    if items:
+        inventory.invalidate(character_id)
+
+    # 等级变化后同步排行榜，并推进升级类任务
+    if result["level_up"]:
+        effective_stats.invalidate(character_id)
+        leaderboard.sync_character(character, db, character.username)
+        game_events.emit(game_events.LEVEL_UP, character_id, amount=result["levels_gained"])
+
+    return {
+        "character_task_ids": [row.id for row in claimed],
+        "claimed": [row.task_id for row in claimed],
+        "exp_gained": reservation.granted,
+        "gold_gained": gold,
+        "items": items,
+        "level": character.level,
+        "exp": character.exp,
+        "level_up": result["level_up"],
+        "levels_gained": result["levels_gained"],
+        "unlocked": unlocked
+    }
 
 
 @router.post("/characters/{character_id}/tasks/reward", response_model=CharacterTaskResponse)
-def claim_reward(character_id: int, task_data: CharacterTaskBase, db: Session = Depends(get_db)):
-    """角色领取任务奖励"""
+def claim_reward(
+    character_id: int,
+    task_data: CharacterTaskBase,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """角色领取任务奖励，客户端重试时使用同一个 Idempotency-Key"""
     # 检查角色是否存在
-    character = db.query(Character).filter(Character.id == character_id).first()
-    if not character:
+    if not db.query(Character.id).filter(Character.id == character_id).first():
         raise HTTPException(status_code=404, detail="角色不存在")
 
-    # 查找角色的任务
-    character_task = db.query(CharacterTask).filter(
-        CharacterTask.character_id == character_id,
-        CharacterTask.task_id == task_data.task_id
-    ).first()
-
-    if not character_task:
-        raise HTTPException(status_code=404, detail="任务不存在")
-
-    # 检查任务状态
-    if character_task.status != TaskStatus.COMPLETED:
-        raise HTTPException(status_code=400, detail="任务尚未完成")
+    scope = f"task_reward:{character_id}:{task_data.task_id}"
+    replay = idempotency.begin(scope, idempotency_key)
+    if replay == idempotency.PENDING:
+        raise HTTPException(status_code=409, detail="请求正在处理中")
+    if replay is not None:
+        return replay
+
+    try:
+        result = claim_rewards(character_id, [task_data.task_id], db)
+        if not result["claimed"]:
+            task_status = db.query(CharacterTask.status).filter(
+                CharacterTask.character_id == character_id,
+                CharacterTask.task_id == task_data.task_id
+            ).scalar()
+            if task_status is None:
+                raise HTTPException(status_code=404, detail="任务不存在")
+            if task_status == TaskStatus.REWARDED:
+                raise HTTPException(status_code=400, detail="奖励已领取")
+            raise HTTPException(status_code=400, detail="任务尚未完成")
+        character_task = db.get(CharacterTask, result["character_task_ids"][0])
+        response = serialize_character_task(character_task, db)
+    except Exception:
+        idempotency.abort(scope, idempotency_key)
+        raise
+    idempotency.complete(scope, idempotency_key, response)
+    return response
+
+
+@router.post("/characters/{character_id}/tasks/reward-all", response_model=RewardClaimResponse)
+def claim_all_rewards(character_id: int, idempotency_key: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """一次领取角色全部已完成任务的奖励"""
+    if not db.query(Character.id).filter(Character.id == character_id).first():
+        raise HTTPException(status_code=404, detail="角色不存在")
 
-    # 发放奖励
-    task = character_task.task
-    character.exp += task.exp_reward
-    # 这里可以添加金币和物品奖励的逻辑
+    scope = f"task_reward_all:{character_id}"
+    replay = idempotency.begin(scope, idempotency_key)
+    if replay == idempotency.PENDING:
+        raise HTTPException(status_code=409, detail="请求正在处理中")
+    if replay is not None:
+        return replay
 
-    # 更新任务状态为已领取奖励
-    character_task.status = TaskStatus.REWARDED
-    character_task.rewarded_at = datetime.utcnow()
-    db.commit()
-    db.refresh(character_task)
-    return character_task
+    try:
+        result = claim_rewards(character_id, None, db)
+    except Exception:
+        idempotency.abort(scope, idempotency_key)
+        raise
+    del result["character_task_ids"]
+    result["character_id"] = character_id
+    idempotency.complete(scope, idempotency_key, result)
+    return result
 
 
 @router.post("/characters/{character_id}/tasks/progress", response_model=CharacterTaskResponse)
@@ -251,7 +546,7 @@ def update_task_progress(character_id: int, progress_data: CharacterTaskProgress
         raise HTTPException(status_code=404, detail="角色不存在")
 
     # 查找角色的任务
-    character_task = db.query(CharacterTask).filter(
+    character_task = db.query(CharacterTask).options(joinedload(CharacterTask.task)).filter(
         CharacterTask.id == progress_data.character_task_id,
         CharacterTask.character_id == character_id
     ).first()
@@ -265,69 +560,104 @@ def update_task_progress(character_id: int, progress_data: CharacterTaskProgress
 
     # 更新任务进度
     task = character_task.task
-    character_task.progress = min(progress_data.progress, task.target_count)
+    progress = min(progress_data.progress, task.target_count)
+    
+    # 进行中的任务只写入缓冲区，由后台任务批量写回数据库
+    if (character_task.status == TaskStatus.ACCEPTED and progress < task.target_count
+            and task_progress.record(character_task.id, progress)):
+        return serialize_character_task(character_task, db, progress)
     
+    character_task.progress = progress
     # 如果进度达到目标，自动完成任务
     if character_task.progress >= task.target_count and character_task.status == TaskStatus.ACCEPTED:
         character_task.status = TaskStatus.COMPLETED
         character_task.completed_at = datetime.utcnow()
 
     db.commit()
-    db.refresh(character_task)
-    return character_task
+    task_progress.discard(character_task.id)
+    return serialize_character_task(character_task, db)
+
+
+@router.post("/characters/{character_id}/events")
+def report_events(character_id: int, batch: GameEventBatch, db: Session = Depends(get_db)):
+    """上报角色的游戏事件（如击杀），推进对应目标的已接取任务"""
+    character = db.query(Character.id).filter(Character.id == character_id).first()
+    if not character:
+        raise HTTPException(status_code=404, detail="角色不存在")
+
+    for event in batch.events:
+        if event.type not in game_events.CLIENT_EVENTS:
+            raise HTTPException(status_code=400, detail=f"不支持上报的事件类型: {event.type}")
+
+    game_events.emit_many(
+        game_events.GameEvent(event.type, character_id=character_id, amount=event.amount, target=event.target)
+        for event in batch.events
+    )
+    return {"accepted": len(batch.events)}
 
 
 # 辅助函数：更新角色的任务列表
-def update_character_tasks(character_id: int, db: Session):
-    """为角色创建可用的任务记录"""
+def update_character_tasks(character_id: int, db: Session, character: Character = None):
+    """
+    为角色创建可用的任务记录
+    角色等级和任务目录版本与上次同步时相同则跳过；
+    否则用一条 INSERT ... SELECT（反连接）批量补齐缺失的任务记录
+    """
     # 获取角色
-    character = db.query(Character).filter(Character.id == character_id).first()
+    character = character or db.query(Character).filter(Character.id == character_id).first()
     if not character:
         return
 
-    # 获取所有适合角色等级的任务
-    available_tasks = db.query(Task).filter(Task.required_level <= character.level).all()
-
-    for task in available_tasks:
-        # 检查角色是否已有该任务
-        existing_task = db.query(CharacterTask).filter(
-            CharacterTask.character_id == character_id,
-            CharacterTask.task_id == task.id
-        ).first()
-
-        if not existing_task:
-            # 创建新的任务记录
-            new_character_task = CharacterTask(
-                character_id=character_id,
-                task_id=task.id,
-                status=TaskStatus.AVAILABLE,
-                progress=0
-            )
-            db.add(new_character_task)
+    version = catalog.get_catalog("tasks", db).version
+    if character.task_sync_level == character.level and character.task_sync_version == version:
+        metrics.incr("task_sync.skipped")
+        return
 
-    db.commit()
+    with metrics.timer("task_sync.seconds"):
+        result = db.execute(_insert_missing_tasks(character))
+        # 记录同步水位
+        character.task_sync_level = character.level
+        character.task_sync_version = version
+        db.commit()
+    metrics.incr("task_sync.inserted", max(result.rowcount, 0))
 
 
-# 辅助函数：重置日常任务
-def reset_daily_tasks(character_id: int, db: Session):
-    """重置角色的日常任务"""
-    # 获取角色的所有日常任务
-    character_tasks = db.query(CharacterTask).join(Task).filter(
-        CharacterTask.character_id == character_id,
-        Task.type == "daily",
-        Task.reset_daily == True
-    ).all()
+# 为角色创建可用的任务记录（异步会话）
+async def update_character_tasks_async(character: Character, db: AsyncSession, version: int):
+    if character.task_sync_level == character.level and character.task_sync_version == version:
+        metrics.incr("task_sync.skipped")
+        return
 
-    for character_task in character_tasks:
-        # 检查是否需要重置（24小时前领取奖励）
-        if character_task.rewarded_at:
-            time_since_reward = datetime.utcnow() - character_task.rewarded_at
-            if time_since_reward >= timedelta(hours=24):
-                # 重置任务
-                character_task.status = TaskStatus.AVAILABLE
-                character_task.progress = 0
-                character_task.accepted_at = None
-                character_task.completed_at = None
-                character_task.rewarded_at = None
+    with metrics.timer("task_sync.seconds"):
+        result = await db.execute(_insert_missing_tasks(character))
+        character.task_sync_level = character.level
+        character.task_sync_version = version
+        await db.commit()
+    metrics.incr("task_sync.inserted", max(result.rowcount, 0))
+
+
+def _insert_missing_tasks(character: Character):
+    # 适合角色等级、前置任务均已领奖、且角色尚无记录的任务
+    prerequisite_task = aliased(CharacterTask)
+    missing_tasks = select(
+        literal(character.id),
+        Task.id,
+        literal(TaskStatus.AVAILABLE, CharacterTask.status.type),
+        literal(0)
+    ).where(
+        Task.required_level <= character.level,
+        ~exists().where(
+            CharacterTask.character_id == character.id,
+            CharacterTask.task_id == Task.id
+        ),
+        ~exists().where(
+            TaskPrerequisite.task_id == Task.id,
+            ~exists().where(
+                prerequisite_task.character_id == character.id,
+                prerequisite_task.task_id == TaskPrerequisite.prerequisite_id,
+                prerequisite_task.status == TaskStatus.REWARDED
+            )
+        )
+    )
+    return insert(CharacterTask).from_select(["character_id", "task_id", "status", "progress"], missing_tasks)
 
-    db.commit()
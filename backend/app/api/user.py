@@ -6,7 +6,7 @@ from typing import Optional
 from datetime import timedelta
 from app.database import get_db
 from app.auth.jwt import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user, invalidate_user
 from app.models.user import User
 
 # 创建路由器
@@ -119,6 +119,11 @@ def get_user_info(current_user: User = Depends(get_current_user)):
 @router.put("/info", response_model=UserResponse)
 def update_user_info(user_update: UserUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """更新用户信息"""
+    # current_user 是缓存的用户快照，修改时需要从数据库加载
+    user = db.query(User).filter(User.id == current_user.id).first()
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+
     # 更新邮箱
     if user_update.email:
         # 检查邮箱是否已被其他用户使用
@@ -128,14 +133,15 @@ def update_user_info(user_update: UserUpdate, current_user: User = Depends(get_c
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="邮箱已被使用"
             )
-        current_user.email = user_update.email
+        user.email = user_update.email
     
     # 更新密码
     if user_update.password:
-        current_user.password_hash = get_password_hash(user_update.password)
+        user.password_hash = get_password_hash(user_update.password)
     
     # 保存更新
     db.commit()
-    db.refresh(current_user)
+    db.refresh(user)
+    invalidate_user(user.id)
     
-    return current_user
+    return user
@@ -1,39 +1,127 @@
+import hashlib
+import os
+import time
+from typing import NamedTuple, Optional
+from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
+from app import metrics
+from app.database import SessionLocal
 from app.auth.jwt import verify_token
 from app.models.user import User
+from app.response_cache import LRUCache
+
+# 加载环境变量
+load_dotenv()
+
+# 用户信息缓存秒数（过期后重新查库，修改用户信息时主动失效）
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+# 已解码令牌缓存秒数（不会超过令牌本身的过期时间）
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
 
 # OAuth2密码Bearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/login")
 
+
+class UserSnapshot(NamedTuple):
+    """已认证用户的轻量快照，接口只需要用户ID、用户名和邮箱"""
+    id: int
+    username: str
+    email: str
+
+
+# 令牌哈希 -> 用户ID，用户ID -> 用户快照
+_token_cache = LRUCache(AUTH_CACHE_SIZE)
+_user_cache = LRUCache(AUTH_CACHE_SIZE)
+
+
+def _decode(token: str) -> Optional[int]:
+    """解析令牌得到用户ID，结果按令牌哈希缓存"""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    user_id = _token_cache.get(key)
+    if user_id is not None:
+        metrics.incr("auth.token_cache.hit")
+        return user_id
+
+    metrics.incr("auth.token_cache.miss")
+    payload = verify_token(token)
+    if payload is None or payload.get("user_id") is None:
+        return None
+    user_id = int(payload["user_id"])
+    ttl = AUTH_TOKEN_CACHE_TTL
+    if payload.get("exp") is not None:
+        ttl = min(ttl, int(payload["exp"] - time.time()))
+    if ttl > 0:
+        _token_cache.set(key, user_id, ttl)
+    return user_id
+
+
+# 加载用户快照
+def load_user(user_id: int) -> Optional[UserSnapshot]:
+    """优先读取缓存，未命中时查询数据库"""
+    user = _user_cache.get(user_id)
+    if user is not None:
+        metrics.incr("auth.user_cache.hit")
+        return user
+
+    metrics.incr("auth.user_cache.miss")
+    db = SessionLocal()
+    try:
+        row = db.query(User.id, User.username, User.email).filter(User.id == user_id).first()
+    finally:
+        db.close()
+    if row is None:
+        return None
+    user = UserSnapshot(row.id, row.username, row.email)
+    _user_cache.set(user_id, user, AUTH_USER_CACHE_TTL)
+    return user
+
+
+# 使用户缓存失效
+def invalidate_user(user_id: int):
+    """修改用户信息后调用"""
+    _user_cache.delete(user_id)
+
+
 # 获取当前用户
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """获取当前用户"""
+def get_current_user(token: str = Depends(oauth2_scheme)) -> UserSnapshot:
+    """获取当前用户，缓存命中时无需访问数据库"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    # 验证令牌
-    payload = verify_token(token)
-    if payload is None:
-        raise credentials_exception
-    
-    # 获取用户ID
-    user_id = payload.get("user_id")
+
+    # 验证令牌并获取用户ID
+    user_id = _decode(token)
     if user_id is None:
         raise credentials_exception
-    
-    # 从数据库中获取用户
-    user = db.query(User).filter(User.id == user_id).first()
+
+    # 获取用户
+    user = load_user(user_id)
     if user is None:
         raise credentials_exception
-    
+
     return user
 
+# 获取当前用户（异步接口使用）
+async def get_current_user_async(token: str = Depends(oauth2_scheme)) -> UserSnapshot:
+    """与 get_current_user 相同，缓存命中时不占用线程池，未命中时才在线程池中查库"""
+    user_id = _decode(token)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = _user_cache.get(user_id)
+    if user is not None:
+        metrics.incr("auth.user_cache.hit")
+        return user
+    return await run_in_threadpool(get_current_user, token)
+
 # 获取当前活跃用户
 def get_current_active_user(current_user: User = Depends(get_current_user)):
     """获取当前活跃用户"""
@@ -49,6 +49,6 @@ def verify_token(token: str):
         user_id: int = payload.get("sub")
         if user_id is None:
             return None
-        return {"user_id": user_id}
+        return {"user_id": user_id, "exp": payload.get("exp")}
     except JWTError:
         return None
@@ -1,19 +1,116 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from dotenv import load_dotenv
 import os
 
-# 使用SQLite数据库（开发环境）
-DATABASE_URL = "sqlite:///./web_game.db"
+# 加载环境变量
+load_dotenv()
+
+# 数据库地址：开发环境默认使用SQLite，生产环境配置为 postgresql://...
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./web_game.db")
+
+# 连接池配置
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# 连接最长使用时间（秒），避免使用被数据库或中间件断开的连接
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# SQLite 参数：WAL 模式下读写互不阻塞，synchronous=NORMAL 在 WAL 下仍能保证一致性
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # 写锁被占用时最多等待的毫秒数，而不是立即报 database is locked
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+}
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+# 设置SQLite连接参数
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """新建连接时执行 PRAGMA（连接钩子）"""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """按数据库类型生成引擎参数"""
+    options = {
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        # 内存数据库只能使用单个连接，不设置连接池大小
+        if ":memory:" in url:
+            return options
+        # aiosqlite 默认不使用连接池，显式指定后每次请求无需重新打开数据库文件
+        if is_async:
+            options["poolclass"] = AsyncAdaptedQueuePool
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return options
+
 
 # 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def create_db_engine(url: str = DATABASE_URL) -> Engine:
+    """创建同步引擎，SQLite 连接在建立时应用 SQLITE_PRAGMAS"""
+    db_engine = create_engine(url, **engine_options(url))
+    if is_sqlite(url):
+        event.listen(db_engine, "connect", apply_sqlite_pragmas)
+    return db_engine
+
+
+engine = create_db_engine()
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 是否启用异步数据库（热点接口改为 async def + AsyncSession，数据库访问不再占用线程池）
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+# 异步驱动：本地 SQLite 使用 aiosqlite，生产 PostgreSQL 使用 asyncpg
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_url(url: str) -> str:
+    """将同步数据库地址转换为对应异步驱动的地址"""
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+# 创建异步数据库引擎
+def create_async_db_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    """创建异步引擎（需要安装对应的异步驱动），连接参数与同步引擎相同"""
+    db_engine = create_async_engine(to_async_url(url), **engine_options(url, is_async=True))
+    if is_sqlite(url):
+        event.listen(db_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return db_engine
+
+
+# 异步引擎和会话工厂，只在启用时创建
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    async_engine = create_async_db_engine()
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 创建基类
 Base = declarative_base()
 
@@ -24,3 +121,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# 依赖项：获取异步数据库会话
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
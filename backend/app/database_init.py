@@ -1,7 +1,65 @@
-from app.database import engine, Base
-from app.models import user, character, skill, equipment, task, social, shop  # 导入所有模型，确保它们被注册
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from app.database import engine, Base, SessionLocal
+from app.models import user, character, skill, equipment, task, social, shop, inventory  # 导入所有模型，确保它们被注册
+from app.services.inventory import backfill_equipped
+from app.services.power import backfill_power
+from app.services.quest_graph import backfill_main_chain
+
+# 为已存在的表补齐新增的列和索引
+def upgrade_db():
+    """
+    create_all 只会创建缺失的表，已存在的表需要在这里补齐模型中新增的列和索引
+    新增列一律允许为空，数据由对应的回填工具补齐
+    """
+    added = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+                added.append(f"{table.name}.{column.name}")
+                print(f"已添加列 {table.name}.{column.name}")
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            if table.name == "equipment_slots" and "uq_equipment_slots_character_slot" not in existing_indexes:
+                # 唯一索引创建前清理同一槽位的重复记录（保留最新一条）
+                removed = conn.execute(text(
+                    "DELETE FROM equipment_slots WHERE id NOT IN "
+                    "(SELECT MAX(id) FROM equipment_slots GROUP BY character_id, slot_type)"
+                )).rowcount
+                if removed:
+                    added.append("equipment_slots.deduplicated")
+                    print(f"已清理 {removed} 条重复的装备槽位记录")
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        if "tasks" in existing_tables:
+            linked = backfill_main_chain(conn)
+            if linked:
+                added.append("task_prerequisites.backfilled")
+                print(f"已为 {linked} 个主线任务补齐前置任务")
+        if "equipment_slots" in existing_tables:
+            filled = backfill_equipped(conn)
+            if filled:
+                added.append("inventory_items.backfilled")
+                print(f"已为已穿戴的装备补齐 {filled} 件背包实例")
+    return added
 
 # 创建所有表
 def init_db():
     Base.metadata.create_all(bind=engine)
+    added = upgrade_db()
+    # 新增的冗余列需要回填，清理重复槽位后战力也需要重新计算
+    if "characters.power" in added or "equipment_slots.deduplicated" in added:
+        db = SessionLocal()
+        try:
+            backfill_power(db)
+        finally:
+            db.close()
     print("数据库表创建成功！")
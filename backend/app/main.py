@@ -1,10 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import router
-from app.database import engine, Base
+from app.database import DB_ASYNC, async_engine, engine
+from app.database_init import init_db
+from app.services import catalog, daily_reset, game_events, ranking_snapshot, task_progress
+from app import metrics
 
 # 创建数据库表
-Base.metadata.create_all(bind=engine)
+init_db()
+metrics.set_gauge("db.async", int(DB_ASYNC))
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -35,3 +39,33 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+# 运行指标
+@app.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
+
+# 启动后台任务
+@app.on_event("startup")
+def start_background_jobs():
+    ranking_snapshot.start_scheduler()
+    catalog.start_subscriber()
+    task_progress.start_flusher()
+    daily_reset.start_scheduler()
+    game_events.start_dispatcher()
+
+# 停止后台任务
+@app.on_event("shutdown")
+def stop_background_jobs():
+    ranking_snapshot.stop_scheduler()
+    catalog.stop_subscriber()
+    task_progress.stop_flusher()
+    daily_reset.stop_scheduler()
+    game_events.stop_dispatcher()
+
+
+# 关闭数据库连接池
+@app.on_event("shutdown")
+async def close_database():
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
@@ -0,0 +1,58 @@
+import threading
+import time
+from typing import Dict
+
+# 进程内指标注册表（计数器、数值、耗时）
+_lock = threading.Lock()
+_counters: Dict[str, int] = {}
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+
+
+def incr(name: str, value: int = 1):
+    """计数器加一（或加指定值）"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float):
+    """设置数值型指标"""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float):
+    """记录一次耗时"""
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "total": 0.0, "last": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["last"] = seconds
+        timing["max"] = max(timing["max"], seconds)
+
+
+class timer:
+    """耗时统计上下文管理器: with timer("name"): ..."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        observe(self.name, self.seconds)
+        return False
+
+
+def snapshot() -> Dict:
+    """导出当前所有指标"""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {name: dict(timing) for name, timing in _timings.items()},
+        }
@@ -1,17 +1,22 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Character(Base):
     __tablename__ = "characters"
+    __table_args__ = (
+        Index("ix_characters_level_power", "level", "power"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     level = Column(Integer, default=1)
     exp = Column(Integer, default=0)
+    gold = Column(Integer, default=0)  # 金币（任务奖励等）
     class_type = Column(String(50), nullable=True)  # 职业类型
+    region = Column(String(32), nullable=True)  # 所属区服，决定每日任务重置的时区
     # 基础属性
     strength = Column(Integer, default=10)  # 力量
     agility = Column(Integer, default=10)   # 敏捷
@@ -22,6 +27,11 @@ class Character(Base):
     mp = Column(Integer, default=50)   # 魔法值
     attack = Column(Integer, default=10)  # 攻击力
     defense = Column(Integer, default=5)   # 防御力
+    # 战力（冗余存储，由升级、穿戴、卸下装备时增量维护）
+    power = Column(Integer, default=110, index=True)  # 初始战力 = 基础100 + 1级*10
+    # 任务同步水位：上次同步任务列表时的角色等级和任务目录版本
+    task_sync_level = Column(Integer, nullable=True)
+    task_sync_version = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -29,3 +39,12 @@ class Character(Base):
     user = relationship("User", backref="characters")
     skills = relationship("CharacterSkill", back_populates="character")
     tasks = relationship("CharacterTask", back_populates="character")
+
+
+class CharacterDailyExp(Base):
+    """角色每日已获得经验值（Redis不可用时的每日经验上限记录）"""
+    __tablename__ = "character_daily_exp"
+
+    character_id = Column(Integer, ForeignKey("characters.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # 游戏时区的日期
+    amount = Column(Integer, default=0, nullable=False)
@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Equipment(Base):
     __tablename__ = "equipment"
+    __table_args__ = (
+        # 装备目录查询（按类型/稀有度/等级筛选，按 (排序字段, id) 键集分页）使用的复合索引
+        Index("ix_equipment_type_rarity_level", "type", "rarity", "level", "id"),
+        Index("ix_equipment_rarity_level", "rarity", "level", "id"),
+        Index("ix_equipment_level_id", "level", "id"),
+        # 按属性排序和属性下限筛选
+        *(Index(f"ix_equipment_{stat}_id", stat, "id") for stat in ("attack", "defense", "strength", "agility", "intelligence", "vitality")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
@@ -29,6 +37,10 @@ class Equipment(Base):
     
 class EquipmentSlot(Base):
     __tablename__ = "equipment_slots"
+    __table_args__ = (
+        # 每个角色的每个槽位只能穿戴一件装备，穿戴时按该索引 upsert
+        Index("uq_equipment_slots_character_slot", "character_id", "slot_type", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     character_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+class InventoryItem(Base):
+    """
+    角色背包中的物品
+    可堆叠物品（耐久度为空）每个角色每种物品一行，用 quantity 计数；
+    装备是独立实例，每件一行（quantity 为 1），各自记录耐久度
+    """
+    __tablename__ = "inventory_items"
+    __table_args__ = (
+        # 可堆叠物品每个角色只有一行，添加时按该索引 upsert 数量
+        Index(
+            "uq_inventory_items_stack", "character_id", "item_key", unique=True,
+            sqlite_where=text("durability IS NULL"), postgresql_where=text("durability IS NULL")
+        ),
+        Index("ix_inventory_items_character_equipment", "character_id", "equipment_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    character_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
+    # 物品标识：装备为 equipment:<装备ID>，商城物品为 product:<商品ID>，任务奖励等为物品名
+    item_key = Column(String(100), nullable=False)
+    equipment_id = Column(Integer, ForeignKey("equipment.id"), nullable=True)
+    quantity = Column(Integer, nullable=False, default=1)
+    durability = Column(Integer, nullable=True)  # 耐久度，仅装备实例有值
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # 关系
+    character = relationship("Character", backref="inventory_items")
+    equipment = relationship("Equipment")
@@ -39,6 +39,8 @@ class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # 接收物品的角色，为空时发放给该用户最早创建的角色
+    character_id = Column(Integer, ForeignKey("characters.id"), nullable=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, default=1)
     total_price = Column(Float, nullable=False)
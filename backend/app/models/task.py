@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum as SQLEnum, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum as SQLEnum, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -31,6 +31,9 @@ class Task(Base):
     item_reward = Column(String, nullable=True)
     target_count = Column(Integer, default=1)
     reset_daily = Column(Boolean, default=False)
+    # 任务目标：推进进度的游戏事件类型，以及事件对象（为空时任意对象均可）
+    objective_event = Column(String(32), nullable=True)
+    objective_target = Column(String(64), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -38,8 +41,19 @@ class Task(Base):
     character_tasks = relationship("CharacterTask", back_populates="task")
 
 
+class TaskPrerequisite(Base):
+    """任务前置关系（有向无环图的边）：完成并领取 prerequisite_id 的奖励后才能解锁 task_id"""
+    __tablename__ = "task_prerequisites"
+
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    prerequisite_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True, index=True)
+
+
 class CharacterTask(Base):
     __tablename__ = "character_tasks"
+    __table_args__ = (
+        Index("ix_character_tasks_character_task", "character_id", "task_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     character_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
@@ -1,4 +1,7 @@
 import redis
+import redis.asyncio
+import uuid
+from typing import Optional
 from dotenv import load_dotenv
 import os
 
@@ -14,6 +17,34 @@ redis_pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
 # 创建Redis客户端
 redis_client = redis.Redis(connection_pool=redis_pool)
 
+# 异步Redis客户端（异步接口使用，连接池在首次使用的事件循环中创建）
+async_redis_client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
+
+# 释放锁脚本：锁的值仍是自己的令牌时才删除，避免删除超时后被其他进程获得的锁
+_release_lock_script = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+# 获取分布式锁
+def acquire_lock(key: str, ttl: int) -> Optional[str]:
+    """SET NX EX 获取锁，成功返回令牌（释放时使用），锁已被占用返回None；Redis错误由调用方处理"""
+    token = uuid.uuid4().hex
+    if redis_client.set(key, token, nx=True, ex=ttl):
+        return token
+    return None
+
+# 释放分布式锁
+def release_lock(key: str, token: str) -> bool:
+    """比较令牌后删除，锁已超时或被其他进程持有时不删除"""
+    try:
+        return bool(_release_lock_script(keys=[key], args=[token], client=redis_client))
+    except redis.RedisError as e:
+        print(f"Redis release lock error: {e}")
+        return False
+
 # 缓存操作类
 class RedisCache:
     @staticmethod
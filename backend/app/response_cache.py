@@ -0,0 +1,219 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from app import metrics
+from app.redis import RedisCache, async_redis_client, redis_client
+
+# 加载环境变量
+load_dotenv()
+
+# 进程内缓存容量与默认过期时间（秒）
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "60"))
+# 是否同时把响应体写入Redis，供其他进程复用
+RESPONSE_CACHE_REDIS = os.getenv("RESPONSE_CACHE_REDIS", "false").lower() in ("1", "true", "yes")
+
+# 数据版本号键名，数据变化时递增，旧版本的缓存自然失效
+VERSION_KEY = "cache:version:{namespace}"
+# Redis中的响应缓存键名
+BODY_KEY = "cache:response:{key}"
+
+
+class LRUCache:
+    """线程安全的LRU缓存，每个条目带过期时间"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = LRUCache(RESPONSE_CACHE_SIZE)
+# Redis不可用时使用的进程内版本号
+_local_versions: Dict[str, int] = {}
+_adapters: Dict[Any, TypeAdapter] = {}
+
+
+# 获取数据版本号
+def get_version(namespace: str) -> int:
+    try:
+        return int(redis_client.get(VERSION_KEY.format(namespace=namespace)) or 0)
+    except Exception:
+        return _local_versions.get(namespace, 0)
+
+
+# 获取数据版本号（异步接口使用）
+async def get_version_async(namespace: str) -> int:
+    try:
+        return int(await async_redis_client.get(VERSION_KEY.format(namespace=namespace)) or 0)
+    except Exception:
+        return _local_versions.get(namespace, 0)
+
+
+# 递增数据版本号
+def bump(namespace: str) -> int:
+    """数据发生变化时调用，使该命名空间下的所有缓存响应失效"""
+    _local_versions[namespace] = _local_versions.get(namespace, 0) + 1
+    try:
+        return redis_client.incr(VERSION_KEY.format(namespace=namespace))
+    except Exception as e:
+        print(f"Redis incr error: {e}")
+        return _local_versions[namespace]
+
+
+def _serialize(model: Any, data: Any) -> bytes:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(model)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+
+def _cache_key(request: Request, namespace: str, version: Any, vary: Any) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    key = f"{namespace}:{version}:{request.url.path}?{query}"
+    if vary is not None:
+        key += f"#{vary}"
+    return key
+
+
+def _decode_body(raw: Optional[str]) -> Optional[Tuple[str, bytes]]:
+    if not raw:
+        return None
+    etag, body = raw.split("\n", 1)
+    return etag, body.encode()
+
+
+def _encode_body(entry: Tuple[str, bytes]) -> str:
+    etag, body = entry
+    return f"{etag}\n{body.decode()}"
+
+
+def _build_entry(namespace: str, model: Any, data: Any) -> Tuple[str, bytes]:
+    metrics.incr(f"response_cache.{namespace}.miss")
+    body = _serialize(model, data)
+    return '"' + hashlib.sha1(body).hexdigest() + '"', body
+
+
+def _load(key: str) -> Optional[Tuple[str, bytes]]:
+    entry = _cache.get(key)
+    if entry is None and RESPONSE_CACHE_REDIS:
+        entry = _decode_body(RedisCache.get(BODY_KEY.format(key=key)))
+    return entry
+
+
+def _store(key: str, entry: Tuple[str, bytes], ttl: int):
+    _cache.set(key, entry, ttl)
+    if RESPONSE_CACHE_REDIS:
+        RedisCache.set(BODY_KEY.format(key=key), _encode_body(entry), ttl)
+
+
+async def _load_async(key: str) -> Optional[Tuple[str, bytes]]:
+    entry = _cache.get(key)
+    if entry is None and RESPONSE_CACHE_REDIS:
+        try:
+            entry = _decode_body(await async_redis_client.get(BODY_KEY.format(key=key)))
+        except Exception as e:
+            print(f"Redis get error: {e}")
+    return entry
+
+
+async def _store_async(key: str, entry: Tuple[str, bytes], ttl: int):
+    _cache.set(key, entry, ttl)
+    if RESPONSE_CACHE_REDIS:
+        try:
+            await async_redis_client.set(BODY_KEY.format(key=key), _encode_body(entry), ex=ttl)
+        except Exception as e:
+            print(f"Redis set error: {e}")
+
+
+def _respond(request: Request, namespace: str, entry: Tuple[str, bytes]) -> Response:
+    etag, body = entry
+    headers = {
+        "ETag": etag,
+        # 客户端可以缓存，但每次使用前需要携带 If-None-Match 重新校验
+        "Cache-Control": "private, no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        metrics.incr(f"response_cache.{namespace}.not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# 返回可缓存的响应
+def cached_response(
+    request: Request,
+    namespace: str,
+    version: Any,
+    model: Any,
+    build: Callable[[], Any],
+    vary: Any = None,
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> Response:
+    """
+    按 路由 + 查询参数 + 数据版本号 (+ 用户) 缓存序列化后的响应体
+    命中时直接返回缓存的字节，客户端携带相同 ETag 时返回 304
+    build 只在未命中时调用，其返回值按 model 校验并序列化
+    """
+    key = _cache_key(request, namespace, version, vary)
+    entry = _load(key)
+    if entry is None:
+        entry = _build_entry(namespace, model, build())
+        _store(key, entry, ttl)
+    else:
+        metrics.incr(f"response_cache.{namespace}.hit")
+    return _respond(request, namespace, entry)
+
+
+# 返回可缓存的响应（异步接口使用）
+async def cached_response_async(
+    request: Request,
+    namespace: str,
+    version: Any,
+    model: Any,
+    build: Callable[[], Awaitable[Any]],
+    vary: Any = None,
+    ttl: int = RESPONSE_CACHE_TTL,
+) -> Response:
+    """与 cached_response 相同，build 为协程函数，Redis读写使用异步客户端"""
+    key = _cache_key(request, namespace, version, vary)
+    entry = await _load_async(key)
+    if entry is None:
+        entry = _build_entry(namespace, model, await build())
+        await _store_async(key, entry, ttl)
+    else:
+        metrics.incr(f"response_cache.{namespace}.hit")
+    return _respond(request, namespace, entry)
@@ -31,6 +31,8 @@ class ProductResponse(ProductBase):
 class OrderBase(BaseModel):
     product_id: int
     quantity: int = 1
+    # 接收物品的角色（可选）
+    character_id: Optional[int] = None
 
 
 class OrderCreate(OrderBase):
@@ -0,0 +1,179 @@
+import bisect
+import threading
+from collections import namedtuple
+from typing import Dict, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from app import metrics, response_cache
+from app.database import SessionLocal
+from app.redis import redis_client
+from app.models.equipment import Equipment
+from app.models.shop import Product
+from app.models.skill import Skill
+from app.models.task import Task
+
+# 跨进程失效通知频道
+INVALIDATE_CHANNEL = "catalog:invalidate"
+
+
+class CatalogSpec(NamedTuple):
+    model: type
+    # 分类字段与等级要求字段
+    type_attr: str
+    level_attr: str
+
+
+# 静态配置数据（目录）定义，名称同时作为响应缓存的命名空间
+CATALOG_SPECS: Dict[str, CatalogSpec] = {
+    "skills": CatalogSpec(Skill, "type", "required_level"),
+    "tasks": CatalogSpec(Task, "type", "required_level"),
+    "equipment": CatalogSpec(Equipment, "type", "level"),
+    "products": CatalogSpec(Product, "type", "level_requirement"),
+}
+
+# 每个目录的行记录类型（不可变的 namedtuple，字段与表的列一致）
+RECORD_TYPES = {
+    name: namedtuple(f"{spec.model.__name__}Record", [column.key for column in spec.model.__table__.columns])
+    for name, spec in CATALOG_SPECS.items()
+}
+
+
+class Catalog(NamedTuple):
+    """某类静态数据的不可变内存索引"""
+    version: int
+    # 按ID排序的全部记录
+    items: Tuple
+    by_id: Dict[int, tuple]
+    by_type: Dict[str, Tuple]
+    # 按等级要求升序排列的记录及对应的等级列表，用于二分查找
+    by_level: Tuple
+    levels: Tuple[int, ...]
+
+    def get(self, item_id: int):
+        return self.by_id.get(item_id)
+
+    def of_type(self, item_type: str) -> Tuple:
+        return self.by_type.get(item_type, ())
+
+    def available(self, level: int) -> Tuple:
+        """等级要求不超过 level 的全部记录"""
+        return self.by_level[:bisect.bisect_right(self.levels, level)]
+
+
+_catalogs: Dict[str, Catalog] = {}
+# 失效计数，加载期间发生失效时丢弃加载结果，避免缓存旧数据
+_generations: Dict[str, int] = {name: 0 for name in CATALOG_SPECS}
+_lock = threading.Lock()
+_stop_event = threading.Event()
+_subscriber: Optional[threading.Thread] = None
+
+
+# 从数据库加载目录
+def load_catalog(name: str, db: Session) -> Catalog:
+    """一次查询加载整张表并建立 ID、分类、等级索引"""
+    spec = CATALOG_SPECS[name]
+    record_type = RECORD_TYPES[name]
+    version = response_cache.get_version(name)
+    with metrics.timer(f"catalog.{name}.load_seconds"):
+        rows = db.query(spec.model).order_by(spec.model.id).all()
+        items = tuple(record_type._make(getattr(row, field) for field in record_type._fields) for row in rows)
+        by_type = {}
+        for item in items:
+            by_type.setdefault(getattr(item, spec.type_attr), []).append(item)
+        by_level = tuple(sorted(items, key=lambda item: getattr(item, spec.level_attr) or 0))
+        catalog = Catalog(
+            version=version,
+            items=items,
+            by_id={item.id: item for item in items},
+            by_type={item_type: tuple(group) for item_type, group in by_type.items()},
+            by_level=by_level,
+            levels=tuple(getattr(item, spec.level_attr) or 0 for item in by_level),
+        )
+    return catalog
+
+
+# 获取目录（读穿透缓存）
+def get_catalog(name: str, db: Session = None) -> Catalog:
+    """返回进程内缓存的目录，未加载或已失效时从数据库加载"""
+    catalog = _catalogs.get(name)
+    if catalog is not None:
+        metrics.incr(f"catalog.{name}.hit")
+        return catalog
+
+    metrics.incr(f"catalog.{name}.miss")
+    generation = _generations[name]
+    owns_session = db is None
+    db = db or SessionLocal()
+    try:
+        catalog = load_catalog(name, db)
+    finally:
+        if owns_session:
+            db.close()
+    with _lock:
+        if _generations[name] == generation:
+            _catalogs[name] = catalog
+    return catalog
+
+
+def cached(name: str) -> Optional[Catalog]:
+    """本进程已加载的目录，未加载或已失效时返回None（不访问数据库）"""
+    return _catalogs.get(name)
+
+
+def _drop(name: str):
+    with _lock:
+        _generations[name] += 1
+        _catalogs.pop(name, None)
+
+
+# 使目录失效
+def invalidate(name: str):
+    """
+    新增或修改静态数据后调用：递增版本号、清除本进程缓存，
+    并通过 Redis 发布订阅通知其他进程
+    """
+    response_cache.bump(name)
+    _drop(name)
+    try:
+        redis_client.publish(INVALIDATE_CHANNEL, name)
+    except Exception as e:
+        print(f"Redis publish error: {e}")
+
+
+def _listen():
+    while not _stop_event.is_set():
+        pubsub = None
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATE_CHANNEL)
+            # 订阅（或重连）成功后清空缓存，防止断线期间错过通知
+            for name in CATALOG_SPECS:
+                _drop(name)
+            while not _stop_event.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message["data"] in CATALOG_SPECS:
+                    _drop(message["data"])
+        except Exception as e:
+            print(f"Catalog subscriber error: {e}")
+            _stop_event.wait(5)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+# 启动失效通知订阅
+def start_subscriber():
+    """启动后台线程订阅目录失效通知"""
+    global _subscriber
+    if _subscriber is not None and _subscriber.is_alive():
+        return
+    _stop_event.clear()
+    _subscriber = threading.Thread(target=_listen, name="catalog-subscriber", daemon=True)
+    _subscriber.start()
+
+
+# 停止失效通知订阅
+def stop_subscriber():
+    _stop_event.set()
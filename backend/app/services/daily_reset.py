@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+import redis
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+from app import metrics
+from app.database import SessionLocal
+from app.redis import acquire_lock, redis_client, release_lock
+from app.models.character import Character
+from app.models.task import Task, CharacterTask, TaskStatus, TaskType
+from app.services.exp_quota import GAME_TZ, game_today, load_timezone, next_midnight
+
+# 加载环境变量
+load_dotenv()
+
+# 每批重置的任务记录数，分批提交避免长时间锁表
+BATCH_SIZE = int(os.getenv("DAILY_RESET_BATCH_SIZE", "1000"))
+# 调度线程的最长休眠时间（秒），用于补跑失败或错过的重置
+CHECK_INTERVAL = int(os.getenv("DAILY_RESET_CHECK_INTERVAL", "300"))
+# 区服时区，格式 "cn=Asia/Shanghai,eu=Europe/Berlin"；未配置的区服使用 GAME_TIMEZONE
+REGION_TIMEZONES = os.getenv("GAME_REGION_TIMEZONES", "")
+
+# 重置锁的超时时间（秒），持有锁的进程中途退出时锁自动过期，由其他进程补跑
+LOCK_TTL = int(os.getenv("DAILY_RESET_LOCK_TTL", "600"))
+
+# 当天已完成重置的标记，在重置全部提交后写入
+DONE_KEY = "daily_reset:{region}:{day}"
+# 重置锁，多进程部署时同一区服同一时间只由一个进程执行
+LOCK_KEY = "daily_reset:{region}:lock"
+
+# 默认区服（未设置区服或区服未配置时区的角色）
+DEFAULT_REGION = "default"
+
+
+def _parse_regions(raw: str) -> Dict[str, object]:
+    regions = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        region, name = (part.strip() for part in item.split("=", 1))
+        if region and region != DEFAULT_REGION:
+            regions[region] = load_timezone(name)
+    return regions
+
+
+REGION_TZ = _parse_regions(REGION_TIMEZONES)
+
+# 本进程已完成的重置: {区服: 日期}，Redis不可用时防止重复执行
+_completed: Dict[str, date] = {}
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def zones() -> List[Tuple[str, object]]:
+    """全部区服及其时区，默认区服在前"""
+    return [(DEFAULT_REGION, GAME_TZ)] + list(REGION_TZ.items())
+
+
+def reset_cutoff(tz) -> datetime:
+    """时区 tz 中当天0点对应的UTC时间（领奖时间早于该时刻的任务需要重置）"""
+    midnight = datetime.combine(game_today(tz), datetime.min.time(), tzinfo=tz)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _region_filter(region: str):
+    if region != DEFAULT_REGION:
+        return Character.region == region
+    if not REGION_TZ:
+        return None
+    return or_(Character.region.is_(None), Character.region.notin_(list(REGION_TZ)))
+
+
+# 重置某个区服的日常任务
+def reset_region(region: str, db: Session = None) -> int:
+    """
+    按主键分批：每批先查出一段待重置的记录ID，再用一条 UPDATE 重置并提交
+    UPDATE 中重复领奖时间条件，查询之后才领奖的任务不会被误重置
+    """
+    tz = GAME_TZ if region == DEFAULT_REGION else REGION_TZ[region]
+    cutoff = reset_cutoff(tz)
+    conditions = [
+        CharacterTask.task_id.in_(select(Task.id).where(Task.type == TaskType.DAILY, Task.reset_daily == True)),
+        CharacterTask.rewarded_at.isnot(None),
+        CharacterTask.rewarded_at < cutoff,
+    ]
+    region_filter = _region_filter(region)
+    if region_filter is not None:
+        conditions.append(CharacterTask.character_id.in_(select(Character.id).where(region_filter)))
+
+    owns_session = db is None
+    db = db or SessionLocal()
+    total = 0
+    last_id = 0
+    metrics.set_gauge(f"daily_reset.{region}.running", 1)
+    metrics.set_gauge(f"daily_reset.{region}.processed", 0)
+    try:
+        with metrics.timer("daily_reset.seconds"):
+            while True:
+                ids = db.scalars(
+                    select(CharacterTask.id)
+                    .where(CharacterTask.id > last_id, *conditions)
+                    .order_by(CharacterTask.id)
+                    .limit(BATCH_SIZE)
+                ).all()
+                if not ids:
+                    break
+                result = db.execute(
+                    update(CharacterTask)
+                    .where(CharacterTask.id.in_(ids), *conditions)
+                    .values(
+                        status=TaskStatus.AVAILABLE,
+                        progress=0,
+                        accepted_at=None,
+                        completed_at=None,
+                        rewarded_at=None
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                total += result.rowcount
+                last_id = ids[-1]
+                metrics.incr("daily_reset.rows", result.rowcount)
+                metrics.incr("daily_reset.batches")
+                metrics.set_gauge(f"daily_reset.{region}.processed", total)
+        metrics.set_gauge(f"daily_reset.{region}.last_run", time.time())
+        return total
+    finally:
+        metrics.set_gauge(f"daily_reset.{region}.running", 0)
+        if owns_session:
+            db.close()
+
+
+# 执行到期的重置
+def run_due(db: Session = None) -> Dict[str, int]:
+    """
+    对当天（按各区服时区）尚未重置的区服执行重置，返回各区服重置的记录数
+    重置条件只依赖领奖时间，重复执行是安全的；启动时调用即可补上停机期间错过的重置
+    """
+    results = {}
+    for region, tz in zones():
+        day = game_today(tz)
+        if _completed.get(region) == day:
+            continue
+        key = DONE_KEY.format(region=region, day=day)
+        lock_key = LOCK_KEY.format(region=region)
+        token = None
+        try:
+            if redis_client.exists(key):
+                # 其他进程已完成
+                _completed[region] = day
+                continue
+            token = acquire_lock(lock_key, LOCK_TTL)
+            if token is None:
+                # 其他进程正在执行，完成前不写入标记，下次检查时再确认
+                continue
+        except redis.RedisError as e:
+            print(f"Daily reset lock error: {e}")
+        try:
+            results[region] = reset_region(region, db)
+            # 重置全部提交后才写入完成标记，中途退出时由下次检查补跑
+            try:
+                redis_client.set(key, os.getpid(), ex=2 * 86400)
+            except redis.RedisError as e:
+                print(f"Daily reset lock error: {e}")
+        except Exception:
+            metrics.incr("daily_reset.errors")
+            raise
+        finally:
+            if token is not None:
+                release_lock(lock_key, token)
+        _completed[region] = day
+    return results
+
+
+def _seconds_until_next_reset() -> float:
+    now = time.time()
+    upcoming = min(next_midnight(game_today(tz), tz) for _, tz in zones())
+    return max(min(upcoming - now, CHECK_INTERVAL), 1)
+
+
+def _run():
+    while True:
+        try:
+            run_due()
+        except Exception as e:
+            print(f"Daily reset error: {e}")
+        if _stop_event.wait(_seconds_until_next_reset()):
+            return
+
+
+# 启动每日重置调度
+def start_scheduler():
+    """启动后台线程：立即补跑当天的重置，之后在各区服0点执行"""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop_event.clear()
+    _worker = threading.Thread(target=_run, name="daily-task-reset", daemon=True)
+    _worker.start()
+
+
+# 停止每日重置调度
+def stop_scheduler():
+    _stop_event.set()
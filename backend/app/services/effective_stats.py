@@ -0,0 +1,179 @@
+import os
+import redis
+from typing import Dict, Iterable, NamedTuple
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import metrics
+from app.redis import redis_client
+from app.models.character import Character
+from app.models.equipment import Equipment, EquipmentSlot
+from app.models.skill import CharacterSkill
+from app.services import catalog
+
+# 加载环境变量
+load_dotenv()
+
+# 缓存保存时间（秒），穿戴、卸下、升级和技能升级时会主动失效
+EFFECTIVE_STATS_TTL = int(os.getenv("EFFECTIVE_STATS_TTL", "3600"))
+# 技能被动加成比例：每级技能提供 基础伤害 * 比例 攻击、基础防御 * 比例 防御、基础治疗 * 比例 体力
+SKILL_PASSIVE_RATE = float(os.getenv("SKILL_PASSIVE_RATE", "0.1"))
+
+# 缓存键名，值为按 STAT_ATTRIBUTES 顺序以逗号分隔的属性值
+KEY = "effective_stats:{character_id}"
+
+# 参与汇总的属性
+STAT_ATTRIBUTES = ("attack", "defense", "strength", "agility", "intelligence", "vitality")
+
+
+class EffectiveStats(NamedTuple):
+    """角色最终属性：自身属性 + 装备加成 + 技能被动加成"""
+    attack: float
+    defense: float
+    strength: float
+    agility: float
+    intelligence: float
+    vitality: float
+
+    def encode(self) -> str:
+        return ",".join(str(value) for value in self)
+
+    @classmethod
+    def decode(cls, value: str) -> "EffectiveStats":
+        return cls(*(float(item) for item in value.split(",")))
+
+
+# 从数据库汇总最终属性
+def compute_many(character_ids: Iterable[int], db: Session) -> Dict[int, EffectiveStats]:
+    """
+    三条查询完成：角色自身属性、按角色分组的装备属性之和、已学技能；
+    技能数据取自技能目录，不存在的角色不在结果中
+    """
+    character_ids = list(character_ids)
+    if not character_ids:
+        return {}
+    totals = {
+        row.id: {attribute: getattr(row, attribute) or 0 for attribute in STAT_ATTRIBUTES}
+        for row in db.query(Character.id, *(getattr(Character, attribute) for attribute in STAT_ATTRIBUTES)).filter(
+            Character.id.in_(character_ids)
+        )
+    }
+    if not totals:
+        return {}
+
+    # 装备加成
+    equipment_rows = db.query(
+        EquipmentSlot.character_id,
+        *(func.coalesce(func.sum(getattr(Equipment, attribute)), 0).label(attribute) for attribute in STAT_ATTRIBUTES)
+    ).join(
+        Equipment, Equipment.id == EquipmentSlot.equipment_id
+    ).filter(
+        EquipmentSlot.character_id.in_(list(totals))
+    ).group_by(EquipmentSlot.character_id)
+    for row in equipment_rows:
+        add_attributes(totals[row.character_id], row)
+
+    add_skill_bonus(totals, db)
+    return {character_id: EffectiveStats(**stats) for character_id, stats in totals.items()}
+
+
+# 累加一组属性
+def add_attributes(stats: Dict[str, float], source):
+    """source 为装备记录或查询行，缺失的属性按0计"""
+    for attribute in STAT_ATTRIBUTES:
+        stats[attribute] += getattr(source, attribute) or 0
+
+
+# 累加技能被动加成
+def add_skill_bonus(totals: Dict[int, Dict[str, float]], db: Session):
+    """一条查询读取 totals 中角色的已学技能，技能数据取自技能目录"""
+    skills = catalog.get_catalog("skills", db)
+    skill_rows = db.query(CharacterSkill.character_id, CharacterSkill.skill_id, CharacterSkill.skill_level).filter(
+        CharacterSkill.character_id.in_(list(totals))
+    )
+    for character_id, skill_id, skill_level in skill_rows:
+        skill = skills.get(skill_id)
+        if skill is None:
+            continue
+        rate = (skill_level or 1) * SKILL_PASSIVE_RATE
+        stats = totals[character_id]
+        stats["attack"] += (skill.base_damage or 0) * rate
+        stats["defense"] += (skill.base_defense or 0) * rate
+        stats["vitality"] += (skill.base_healing or 0) * rate
+
+
+# 按已知的整套装备计算最终属性
+def loadout_stats(character: Character, equipment_ids: Iterable[int], db: Session) -> EffectiveStats:
+    """
+    自身属性取自已加载的角色对象，装备属性取自装备目录，只查询一次已学技能；
+    穿戴时在提交前调用，结果与 compute_many 一致
+    """
+    stats = {attribute: getattr(character, attribute) or 0 for attribute in STAT_ATTRIBUTES}
+    equipment_catalog = catalog.get_catalog("equipment", db)
+    for equipment_id in equipment_ids:
+        equipment = equipment_catalog.get(equipment_id)
+        if equipment is not None:
+            add_attributes(stats, equipment)
+    add_skill_bonus({character.id: stats}, db)
+    return EffectiveStats(**stats)
+
+
+# 批量获取最终属性
+def get_many(character_ids: Iterable[int], db: Session) -> Dict[int, EffectiveStats]:
+    """先用一次 MGET 读取缓存，未命中的角色一起计算后写回；Redis不可用时直接计算"""
+    character_ids = list(dict.fromkeys(character_ids))
+    if not character_ids:
+        return {}
+    keys = [KEY.format(character_id=character_id) for character_id in character_ids]
+    try:
+        cached = redis_client.mget(keys)
+    except redis.RedisError as e:
+        print(f"Effective stats cache error: {e}")
+        return compute_many(character_ids, db)
+
+    result = {
+        character_id: EffectiveStats.decode(value)
+        for character_id, value in zip(character_ids, cached) if value
+    }
+    missing = [character_id for character_id in character_ids if character_id not in result]
+    metrics.incr("effective_stats.hits", len(result))
+    if not missing:
+        return result
+    metrics.incr("effective_stats.misses", len(missing))
+
+    computed = compute_many(missing, db)
+    result.update(computed)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for character_id, stats in computed.items():
+            pipe.set(KEY.format(character_id=character_id), stats.encode(), ex=EFFECTIVE_STATS_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Effective stats cache error: {e}")
+    return result
+
+
+# 获取单个角色的最终属性
+def get(character_id: int, db: Session):
+    """角色不存在时返回None"""
+    return get_many([character_id], db).get(character_id)
+
+
+# 写入单个角色的最终属性
+def store(character_id: int, stats: EffectiveStats):
+    """调用方已在内存中算出最终属性时直接写入缓存，省去失效后重新汇总的查询"""
+    try:
+        redis_client.set(KEY.format(character_id=character_id), stats.encode(), ex=EFFECTIVE_STATS_TTL)
+    except redis.RedisError as e:
+        print(f"Effective stats cache error: {e}")
+
+
+# 使最终属性缓存失效
+def invalidate(*character_ids: int):
+    """在穿戴、卸下装备，升级，学习或升级技能的事务提交后调用"""
+    if not character_ids:
+        return
+    try:
+        redis_client.delete(*(KEY.format(character_id=character_id) for character_id in character_ids))
+    except redis.RedisError as e:
+        print(f"Effective stats cache error: {e}")
@@ -0,0 +1,111 @@
+from typing import Dict, NamedTuple, Optional
+from sqlalchemy import delete, func, update
+from sqlalchemy.orm import Session
+from app import metrics
+from app.models.equipment import EquipmentSlot
+from app.services import effective_stats
+from app.services.power import refresh_power
+
+# 装备槽位
+SLOT_TYPES = ("武器", "头盔", "胸甲", "手套", "靴子", "饰品1", "饰品2")
+
+
+class EquippedSlot(NamedTuple):
+    id: int
+    slot_type: str
+    equipment_id: int
+
+
+class EquipResult(NamedTuple):
+    """穿戴结果：穿戴后的全部槽位、最终属性与战力"""
+    slots: Dict[str, EquippedSlot]
+    stats: effective_stats.EffectiveStats
+    power: int
+
+
+# 支持 ON CONFLICT 的 insert 构造函数
+def dialect_insert(db: Session):
+    """PostgreSQL / SQLite 返回方言 insert，其他数据库返回None，由调用方改用先更新后插入"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+# 按 (角色, 槽位) 唯一索引写入槽位
+def upsert_slots(db: Session, character_id: int, loadout: Dict[str, int]) -> Dict[str, int]:
+    """
+    一条 INSERT ... ON CONFLICT (character_id, slot_type) DO UPDATE 替换多个槽位（不提交），
+    返回 {槽位: 槽位记录ID}；并发穿戴同一槽位时由唯一索引保证不会产生重复记录
+    """
+    rows = [
+        {"character_id": character_id, "slot_type": slot_type, "equipment_id": equipment_id}
+        for slot_type, equipment_id in loadout.items()
+    ]
+    insert = dialect_insert(db)
+    if insert is not None:
+        statement = insert(EquipmentSlot).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[EquipmentSlot.character_id, EquipmentSlot.slot_type],
+            set_={"equipment_id": statement.excluded.equipment_id, "updated_at": func.now()}
+        ).returning(EquipmentSlot.id, EquipmentSlot.slot_type)
+        return {slot_type: slot_id for slot_id, slot_type in db.execute(statement)}
+
+    # 不支持 ON CONFLICT 的数据库：先更新已有槽位，再插入其余槽位
+    for row in rows:
+        db.execute(
+            update(EquipmentSlot)
+            .where(EquipmentSlot.character_id == character_id, EquipmentSlot.slot_type == row["slot_type"])
+            .values(equipment_id=row["equipment_id"])
+            .execution_options(synchronize_session=False)
+        )
+    existing = dict(db.query(EquipmentSlot.slot_type, EquipmentSlot.id).filter(
+        EquipmentSlot.character_id == character_id,
+        EquipmentSlot.slot_type.in_(loadout)
+    ).all())
+    for row in rows:
+        if row["slot_type"] not in existing:
+            slot = EquipmentSlot(**row)
+            db.add(slot)
+            db.flush()
+            existing[row["slot_type"]] = slot.id
+    return existing
+
+
+# 穿戴装备（单件或整套）
+def equip(db: Session, character, loadout: Dict[str, Optional[int]]) -> EquipResult:
+    """
+    一个事务完成：读取当前槽位、upsert 新槽位、删除装备ID为空的槽位、按装备重新计算战力，然后提交一次；
+    最终属性在提交前按穿戴后的槽位在内存中算出，提交后直接写入缓存
+    """
+    character_id = character.id
+    with metrics.timer("equip.seconds"):
+        current = {
+            row.slot_type: EquippedSlot(row.id, row.slot_type, row.equipment_id)
+            for row in db.query(EquipmentSlot.id, EquipmentSlot.slot_type, EquipmentSlot.equipment_id).filter(
+                EquipmentSlot.character_id == character_id
+            )
+        }
+        equipped = {slot_type: equipment_id for slot_type, equipment_id in loadout.items() if equipment_id is not None}
+        removed = [slot_type for slot_type, equipment_id in loadout.items() if equipment_id is None]
+        slot_ids = upsert_slots(db, character_id, equipped) if equipped else {}
+        if removed:
+            db.execute(
+                delete(EquipmentSlot)
+                .where(EquipmentSlot.character_id == character_id, EquipmentSlot.slot_type.in_(removed))
+                .execution_options(synchronize_session=False)
+            )
+        power = refresh_power(db, character_id)
+        slots = {slot_type: slot for slot_type, slot in current.items() if slot_type not in removed}
+        for slot_type, equipment_id in equipped.items():
+            slots[slot_type] = EquippedSlot(slot_ids[slot_type], slot_type, equipment_id)
+        stats = effective_stats.loadout_stats(character, (slot.equipment_id for slot in slots.values()), db)
+        db.commit()
+    metrics.incr("equip.slots", len(loadout))
+
+    effective_stats.store(character_id, stats)
+    return EquipResult(slots, stats, power)
@@ -0,0 +1,105 @@
+import base64
+import json
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from app import metrics
+from app.models.equipment import Equipment
+
+# 可排序的字段
+SORT_FIELDS = ("id", "level", "price", "attack", "defense", "strength", "agility", "intelligence", "vitality")
+# 可按最小值筛选的属性
+STAT_FIELDS = ("attack", "defense", "strength", "agility", "intelligence", "vitality")
+# 每页数量上限
+MAX_LIMIT = 100
+
+# 返回的列（不加载 created_at / updated_at）
+_COLUMNS = (
+    Equipment.id, Equipment.name, Equipment.type, Equipment.level, Equipment.rarity,
+    Equipment.attack, Equipment.defense, Equipment.strength, Equipment.agility,
+    Equipment.intelligence, Equipment.vitality, Equipment.durability, Equipment.price,
+)
+
+
+class EquipmentPage(NamedTuple):
+    """一页查询结果；next_cursor 为空表示没有下一页"""
+    items: List
+    next_cursor: Optional[str]
+
+
+# 编码分页游标
+def encode_cursor(value, equipment_id: int) -> str:
+    """游标为上一页最后一条记录的 (排序值, ID)"""
+    return base64.urlsafe_b64encode(json.dumps([value, equipment_id]).encode()).decode().rstrip("=")
+
+
+# 解码分页游标
+def decode_cursor(cursor: str):
+    """格式错误或排序值不是标量时抛出 ValueError"""
+    try:
+        value, equipment_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if type(equipment_id) is not int or type(value) not in (int, float, str):
+        raise ValueError("invalid cursor")
+    return value, equipment_id
+
+
+# 按条件查询装备目录
+def search(
+    db: Session,
+    type: Optional[str] = None,
+    rarity: Optional[str] = None,
+    min_level: Optional[int] = None,
+    max_level: Optional[int] = None,
+    min_stats: Optional[Dict[str, int]] = None,
+    sort: str = "id",
+    descending: bool = False,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> EquipmentPage:
+    """
+    筛选条件全部下推到SQL，按 (排序字段, ID) 做键集分页：
+    翻页时用 WHERE (排序字段, ID) > (游标值, 游标ID) 定位，不使用 OFFSET，任意页的代价都相同；
+    类型、稀有度、等级和按属性排序均有对应的复合索引；
+    排序字段为空的装备无法与游标比较，按该字段排序时不返回
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"invalid sort field: {sort}")
+    limit = max(1, min(limit, MAX_LIMIT))
+    sort_column = getattr(Equipment, sort)
+
+    query = db.query(*_COLUMNS)
+    if type is not None:
+        query = query.filter(Equipment.type == type)
+    if rarity is not None:
+        query = query.filter(Equipment.rarity == rarity)
+    if min_level is not None:
+        query = query.filter(Equipment.level >= min_level)
+    if max_level is not None:
+        query = query.filter(Equipment.level <= max_level)
+    for stat, minimum in (min_stats or {}).items():
+        if minimum is not None:
+            query = query.filter(getattr(Equipment, stat) >= minimum)
+
+    if sort == "id":
+        key, order = Equipment.id, (Equipment.id,)
+    else:
+        # (NULL, ID) 与游标比较的结果为 NULL，会使翻页提前结束
+        query = query.filter(sort_column.isnot(None))
+        key, order = tuple_(sort_column, Equipment.id), (sort_column, Equipment.id)
+    if cursor is not None:
+        value, last_id = decode_cursor(cursor)
+        position = last_id if sort == "id" else tuple_(value, last_id)
+        query = query.filter(key < position if descending else key > position)
+    query = query.order_by(*(column.desc() if descending else column for column in order))
+
+    with metrics.timer("equipment_search.seconds"):
+        # 多取一条用于判断是否还有下一页
+        rows = query.limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort), last.id)
+    return EquipmentPage(items, next_cursor)
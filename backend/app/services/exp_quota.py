@@ -0,0 +1,281 @@
+import os
+import redis
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import metrics
+from app.redis import async_redis_client, redis_client
+from app.models.character import CharacterDailyExp
+
+# 加载环境变量
+load_dotenv()
+
+# 每日经验值上限
+DAILY_EXP_LIMIT = int(os.getenv("DAILY_EXP_LIMIT", "10000"))
+# 游戏时区，每日额度在该时区的0点重置
+GAME_TIMEZONE = os.getenv("GAME_TIMEZONE", "Asia/Shanghai")
+
+# 每日已获得经验值计数器，0点自动过期
+QUOTA_KEY = "exp_quota:{day}:{character_id}"
+# 已合并到计数器中的数据库记录用量（Redis不可用期间的发放）
+RECORDED_KEY = "exp_quota_recorded:{day}:{character_id}"
+# 当天Redis故障的次数：曾回退到数据库记录的进程在Redis恢复后递增，所有进程据此得知需要合并数据库用量
+OUTAGE_KEY = "exp_quota_outage:{day}"
+# 角色计数器已合并到第几次故障
+MERGED_KEY = "exp_quota_merged:{day}:{character_id}"
+
+# 预占脚本：KEYS = [计数器, 已合并用量, 故障次数, 已合并故障次数]
+# ARGV = [申请值, 上限, 过期时间, 数据库记录用量（可为空）, 是否递增故障次数, 读取数据库用量时的故障次数]
+# 返回 {实际获得值, 故障次数}；未提供数据库用量且计数器不存在、或计数器尚未合并最近一次故障时
+# 实际获得值为 -1，由调用方读取数据库后重试；
+# 提供数据库用量时，计数器不存在则以其为初值（SET NX 语义），存在则只累加尚未合并的差额
+RESERVE_LUA = """
+if ARGV[5] == '1' then
+    redis.call('INCR', KEYS[3])
+    redis.call('EXPIREAT', KEYS[3], ARGV[3])
+end
+local outage = tonumber(redis.call('GET', KEYS[3]) or '0')
+local recorded = ARGV[4]
+if recorded == '' then
+    if redis.call('EXISTS', KEYS[1]) == 0 or tonumber(redis.call('GET', KEYS[4]) or '0') < outage then
+        return {-1, outage}
+    end
+elseif redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], recorded, 'EXAT', ARGV[3])
+    redis.call('SET', KEYS[2], recorded, 'EXAT', ARGV[3])
+else
+    local delta = tonumber(recorded) - tonumber(redis.call('GET', KEYS[2]) or '0')
+    if delta > 0 then
+        redis.call('INCRBY', KEYS[1], delta)
+        redis.call('SET', KEYS[2], recorded, 'EXAT', ARGV[3])
+    end
+end
+if recorded ~= '' then
+    redis.call('SET', KEYS[4], ARGV[6], 'EXAT', ARGV[3])
+end
+local amount = tonumber(ARGV[1])
+local used = redis.call('INCRBY', KEYS[1], amount)
+local over = used - tonumber(ARGV[2])
+if over <= 0 then
+    return {amount, outage}
+end
+local refund = math.min(over, amount)
+redis.call('DECRBY', KEYS[1], refund)
+return {amount - refund, outage}
+"""
+RESERVE_SCRIPT = redis_client.register_script(RESERVE_LUA)
+RESERVE_SCRIPT_ASYNC = async_redis_client.register_script(RESERVE_LUA)
+
+# 本进程在Redis不可用期间回退到数据库记录的日期，Redis恢复后第一次预占时递增当天的故障次数
+_outage_days = set()
+
+# 数据库记录的乐观更新重试次数
+SQL_RETRIES = 5
+
+
+def load_timezone(name: str):
+    """按名称加载时区，未知时区返回None（使用服务器本地时间）"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"未知时区 {name}，使用服务器本地时间")
+        return None
+
+
+GAME_TZ = load_timezone(GAME_TIMEZONE)
+
+
+def game_today(tz=GAME_TZ) -> date:
+    """游戏时区的当天日期"""
+    return datetime.now(tz).date()
+
+
+def next_midnight(day: date, tz=GAME_TZ) -> int:
+    """游戏时区中 day 的下一个0点（时间戳）"""
+    return int(datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz).timestamp())
+
+
+class ExpReservation(NamedTuple):
+    """经验额度预占结果"""
+    character_id: int
+    day: date
+    # 实际可获得的经验值（额度不足时少于申请值）
+    granted: int
+    # 额度记录在Redis中；记录在数据库中时随事务回滚，无需归还
+    in_redis: bool
+
+    def release(self):
+        """发放失败（事务未提交）时归还额度"""
+        if not self.in_redis or self.granted <= 0:
+            return
+        try:
+            redis_client.decrby(QUOTA_KEY.format(day=self.day, character_id=self.character_id), self.granted)
+        except redis.RedisError as e:
+            print(f"Exp quota release error: {e}")
+
+    async def release_async(self):
+        """与 release 相同，使用异步Redis客户端"""
+        if not self.in_redis or self.granted <= 0:
+            return
+        try:
+            await async_redis_client.decrby(QUOTA_KEY.format(day=self.day, character_id=self.character_id), self.granted)
+        except redis.RedisError as e:
+            print(f"Exp quota release error: {e}")
+
+
+def _used_statement(character_id: int, day: date):
+    return select(CharacterDailyExp.amount).where(
+        CharacterDailyExp.character_id == character_id,
+        CharacterDailyExp.day == day
+    )
+
+
+def _used_in_database(db: Session, character_id: int, day: date) -> int:
+    return db.scalar(_used_statement(character_id, day)) or 0
+
+
+async def _used_in_database_async(db: AsyncSession, character_id: int, day: date) -> int:
+    return await db.scalar(_used_statement(character_id, day)) or 0
+
+
+def _script_keys(character_id: int, day: date):
+    return [
+        QUOTA_KEY.format(day=day, character_id=character_id),
+        RECORDED_KEY.format(day=day, character_id=character_id),
+        OUTAGE_KEY.format(day=day),
+        MERGED_KEY.format(day=day, character_id=character_id),
+    ]
+
+
+def _script_args(day: date, amount: int, recorded="", outage: int = 0):
+    mark = "" if recorded != "" or day not in _outage_days else "1"
+    return [amount, DAILY_EXP_LIMIT, next_midnight(day), recorded, mark, outage]
+
+
+def _reserve_in_redis(db: Session, character_id: int, day: date, amount: int) -> int:
+    """
+    在脚本中原子地累加并检查上限，超出部分立即归还，计数器始终等于实际发放总量
+    当天第一次预占、或任一进程在Redis故障期间回退到数据库记录后，读取数据库用量合并一次，其余情况只访问Redis
+    """
+    keys = _script_keys(character_id, day)
+    granted, outage = RESERVE_SCRIPT(keys=keys, args=_script_args(day, amount))
+    _outage_days.discard(day)
+    if granted < 0:
+        recorded = _used_in_database(db, character_id, day)
+        granted, _ = RESERVE_SCRIPT(keys=keys, args=_script_args(day, amount, recorded, outage))
+    return granted
+
+
+async def _reserve_in_redis_async(db: AsyncSession, character_id: int, day: date, amount: int) -> int:
+    keys = _script_keys(character_id, day)
+    granted, outage = await RESERVE_SCRIPT_ASYNC(keys=keys, args=_script_args(day, amount))
+    _outage_days.discard(day)
+    if granted < 0:
+        recorded = await _used_in_database_async(db, character_id, day)
+        granted, _ = await RESERVE_SCRIPT_ASYNC(keys=keys, args=_script_args(day, amount, recorded, outage))
+    return granted
+
+
+def _reserve_in_database(db: Session, character_id: int, day: date, amount: int) -> int:
+    """
+    Redis不可用时在数据库中记录，条件更新（比较并交换）保证并发正确
+    不提交事务，与经验值的修改一起由调用方提交
+    """
+    for _ in range(SQL_RETRIES):
+        used = db.query(CharacterDailyExp.amount).filter(
+            CharacterDailyExp.character_id == character_id,
+            CharacterDailyExp.day == day
+        ).scalar()
+        if used is None:
+            try:
+                with db.begin_nested():
+                    db.add(CharacterDailyExp(character_id=character_id, day=day, amount=0))
+            except IntegrityError:
+                # 其他请求已创建当天记录
+                pass
+            continue
+
+        granted = max(0, min(amount, DAILY_EXP_LIMIT - used))
+        if granted == 0:
+            return 0
+        result = db.execute(
+            update(CharacterDailyExp)
+            .where(
+                CharacterDailyExp.character_id == character_id,
+                CharacterDailyExp.day == day,
+                CharacterDailyExp.amount == used
+            )
+            .values(amount=used + granted)
+        )
+        if result.rowcount == 1:
+            return granted
+    metrics.incr("exp_quota.conflicts")
+    return 0
+
+
+# 预占每日经验额度
+def reserve(db: Session, character_id: int, amount: int) -> ExpReservation:
+    """
+    所有经验来源在发放前调用，返回实际可获得的经验值
+    正常情况下只访问Redis，不增加数据库写入；Redis不可用时回退到数据库记录
+    """
+    day = game_today()
+    if amount <= 0:
+        return ExpReservation(character_id, day, amount, False)
+    try:
+        granted = _reserve_in_redis(db, character_id, day, amount)
+        in_redis = True
+    except redis.RedisError as e:
+        print(f"Exp quota error: {e}")
+        metrics.incr("exp_quota.fallback")
+        granted = _reserve_in_database(db, character_id, day, amount)
+        in_redis = False
+        _outage_days.add(day)
+    if granted < amount:
+        metrics.incr("exp_quota.capped")
+    return ExpReservation(character_id, day, granted, in_redis)
+
+
+# 预占每日经验额度（异步会话）
+async def reserve_async(db: AsyncSession, character_id: int, amount: int) -> ExpReservation:
+    """与 reserve 相同，使用异步Redis客户端；回退到数据库记录时在异步会话的同一事务中执行"""
+    day = game_today()
+    if amount <= 0:
+        return ExpReservation(character_id, day, amount, False)
+    try:
+        granted = await _reserve_in_redis_async(db, character_id, day, amount)
+        in_redis = True
+    except redis.RedisError as e:
+        print(f"Exp quota error: {e}")
+        metrics.incr("exp_quota.fallback")
+        granted = await db.run_sync(_reserve_in_database, character_id, day, amount)
+        in_redis = False
+        _outage_days.add(day)
+    if granted < amount:
+        metrics.incr("exp_quota.capped")
+    return ExpReservation(character_id, day, granted, in_redis)
+
+
+# 查询今日已获得经验值
+def used_today(db: Session, character_id: int) -> int:
+    day = game_today()
+    try:
+        used = int(redis_client.get(QUOTA_KEY.format(day=day, character_id=character_id)) or 0)
+        return used or _used_in_database(db, character_id, day)
+    except redis.RedisError:
+        return _used_in_database(db, character_id, day)
+
+
+# 查询今日已获得经验值（异步会话）
+async def used_today_async(db: AsyncSession, character_id: int) -> int:
+    day = game_today()
+    try:
+        used = int(await async_redis_client.get(QUOTA_KEY.format(day=day, character_id=character_id)) or 0)
+        return used or await _used_in_database_async(db, character_id, day)
+    except redis.RedisError:
+        return await _used_in_database_async(db, character_id, day)
@@ -0,0 +1,337 @@
+import json
+import os
+import threading
+import redis
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, case, literal, update
+from sqlalchemy.orm import Session
+from app import metrics
+from app.database import SessionLocal
+from app.redis import acquire_lock, redis_client, release_lock
+from app.models.character import Character
+from app.models.task import CharacterTask, TaskStatus
+from app.services import catalog, task_progress
+
+# 加载环境变量
+load_dotenv()
+
+# 事件分发间隔（秒），0 表示不排队，触发事件时立即应用
+FLUSH_INTERVAL = float(os.getenv("GAME_EVENT_FLUSH_INTERVAL", "1"))
+# 每批应用的事件数
+BATCH_SIZE = int(os.getenv("GAME_EVENT_BATCH_SIZE", "1000"))
+# 同一批次最多应用的次数（含重放），仍失败时移入死信队列，不再阻塞后续事件
+MAX_ATTEMPTS = int(os.getenv("GAME_EVENT_MAX_ATTEMPTS", "5"))
+
+# 游戏事件类型（任务目标 objective_event 的取值）
+KILL = "kill"
+LEVEL_UP = "level_up"
+EQUIP = "equip"
+PURCHASE = "purchase"
+FRIEND_ADDED = "friend_added"
+EVENT_TYPES = (KILL, LEVEL_UP, EQUIP, PURCHASE, FRIEND_ADDED)
+# 允许客户端（战斗服）上报的事件，其余事件只由服务端接口触发
+CLIENT_EVENTS = (KILL,)
+
+# 待应用的事件队列与分发锁
+QUEUE_KEY = "game_events:queue"
+DISPATCH_LOCK_KEY = "game_events:dispatch_lock"
+# 正在应用的批次，提交后删除；分发中途失败或进程崩溃时保留，下次分发时重放
+PROCESSING_KEY = "game_events:processing"
+# 正在应用的批次的编号和已应用次数
+BATCH_KEY = "game_events:batch"
+BATCH_SEQ_KEY = "game_events:batch_seq"
+# 批次中已在进度缓冲中累加的任务，重放时不重复累加
+APPLIED_KEY = "game_events:applied:{batch_id}"
+# 超过最大应用次数的事件
+DEAD_LETTER_KEY = "game_events:dead_letter"
+
+# 取出一批事件脚本：KEYS = [队列, 正在应用的批次, 批次信息, 批次编号]，ARGV = [批次大小]
+# 没有未完成的批次时原子地从队首取出最多 ARGV[1] 个事件作为新批次；
+# 返回 {批次编号, 已应用次数（含本次）, 事件...}，队列为空时返回空列表
+TAKE_BATCH_SCRIPT = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    local events = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+    if #events == 0 then
+        return {}
+    end
+    redis.call('LTRIM', KEYS[1], #events, -1)
+    redis.call('RPUSH', KEYS[2], unpack(events))
+    redis.call('DEL', KEYS[3])
+end
+if redis.call('HEXISTS', KEYS[3], 'id') == 0 then
+    redis.call('HSET', KEYS[3], 'id', redis.call('INCR', KEYS[4]))
+end
+local attempts = redis.call('HINCRBY', KEYS[3], 'attempts', 1)
+return {redis.call('HGET', KEYS[3], 'id'), attempts, unpack(redis.call('LRANGE', KEYS[2], 0, -1))}
+""")
+
+# 达到目标的任务：写入进度并自动完成（只更新仍处于已接取状态的任务）
+_COMPLETE_TASKS = (
+    update(CharacterTask.__table__)
+    .where(
+        CharacterTask.__table__.c.id == bindparam("b_id"),
+        CharacterTask.__table__.c.status == TaskStatus.ACCEPTED
+    )
+    .values(progress=bindparam("b_progress"), status=TaskStatus.COMPLETED, completed_at=bindparam("b_completed_at"))
+)
+# 进度缓冲不可用时直接在数据库中累加进度并封顶，达到目标的任务同时完成
+_progress = CharacterTask.__table__.c.progress + bindparam("b_amount")
+_reached = _progress >= bindparam("b_target")
+_INCREMENT_PROGRESS = (
+    update(CharacterTask.__table__)
+    .where(
+        CharacterTask.__table__.c.id == bindparam("b_id"),
+        CharacterTask.__table__.c.status == TaskStatus.ACCEPTED
+    )
+    .values(
+        progress=case((_reached, bindparam("b_target")), else_=_progress),
+        status=case(
+            (_reached, literal(TaskStatus.COMPLETED, CharacterTask.__table__.c.status.type)),
+            else_=CharacterTask.__table__.c.status
+        ),
+        completed_at=case((_reached, bindparam("b_completed_at")), else_=CharacterTask.__table__.c.completed_at)
+    )
+)
+
+# 任务目标索引缓存：(任务目录, {(事件类型, 目标): 任务ID元组})，目录重新加载后重建
+_objective_index = (None, {})
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+class GameEvent(NamedTuple):
+    """游戏事件；只有 user_id 的事件作用于该用户的全部角色"""
+    type: str
+    character_id: Optional[int] = None
+    user_id: Optional[int] = None
+    amount: int = 1
+    # 事件对象（怪物、装备、商品ID等），任务目标未指定对象时匹配任意对象
+    target: Optional[str] = None
+
+
+def enabled() -> bool:
+    """是否通过队列批量应用事件"""
+    return FLUSH_INTERVAL > 0
+
+
+# 获取任务目标索引
+def objective_index(db: Session = None) -> Dict[Tuple[str, Optional[str]], Tuple[int, ...]]:
+    """按 (事件类型, 目标对象) 索引设置了目标事件的任务，随任务目录一起重建"""
+    global _objective_index
+    tasks = catalog.get_catalog("tasks", db)
+    cached_catalog, index = _objective_index
+    if cached_catalog is not tasks:
+        grouped = {}
+        for task in tasks.items:
+            if task.objective_event:
+                grouped.setdefault((task.objective_event, task.objective_target or None), []).append(task.id)
+        index = {key: tuple(task_ids) for key, task_ids in grouped.items()}
+        _objective_index = (tasks, index)
+    return index
+
+
+# 触发游戏事件
+def emit(event_type: str, character_id: int = None, user_id: int = None, amount: int = 1, target=None):
+    emit_many([GameEvent(event_type, character_id, user_id, amount, None if target is None else str(target))])
+
+
+# 批量触发游戏事件
+def emit_many(events: Iterable[GameEvent]):
+    """事件写入Redis队列由后台批量应用；关闭队列或Redis不可用时立即应用"""
+    events = [event for event in events if event.amount > 0]
+    if not events:
+        return
+    if enabled():
+        try:
+            redis_client.rpush(QUEUE_KEY, *(json.dumps(event._asdict()) for event in events))
+            metrics.incr("game_events.queued", len(events))
+            return
+        except redis.RedisError as e:
+            print(f"Game event queue error: {e}")
+    db = SessionLocal()
+    try:
+        apply_events(events, db)
+    except Exception as e:
+        metrics.incr("game_events.errors")
+        print(f"Game event apply error: {e}")
+    finally:
+        db.close()
+
+
+def _increments(events: List[GameEvent], db: Session) -> Dict[Tuple[int, int], int]:
+    """把事件展开为 {(角色ID, 任务ID): 进度增量}，每个事件只查找索引中匹配的任务"""
+    index = objective_index(db)
+    user_ids = {event.user_id for event in events if event.character_id is None and event.user_id is not None}
+    characters_of_user: Dict[int, List[int]] = {}
+    if user_ids and index:
+        for character_id, user_id in db.query(Character.id, Character.user_id).filter(Character.user_id.in_(user_ids)):
+            characters_of_user.setdefault(user_id, []).append(character_id)
+
+    increments: Dict[Tuple[int, int], int] = {}
+    for event in events:
+        task_ids = index.get((event.type, None), ())
+        if event.target is not None:
+            task_ids += index.get((event.type, event.target), ())
+        if not task_ids:
+            continue
+        if event.character_id is not None:
+            character_ids = (event.character_id,)
+        else:
+            character_ids = characters_of_user.get(event.user_id, ())
+        for character_id in character_ids:
+            for task_id in task_ids:
+                key = (character_id, task_id)
+                increments[key] = increments.get(key, 0) + event.amount
+    return increments
+
+
+# 批量应用游戏事件
+def apply_events(events: Iterable[GameEvent], db: Session, batch_id: str = None) -> int:
+    """
+    一次查询取出受影响的已接取任务，累加进度：
+    进度在进度缓冲中原子累加，达到目标的任务直接写库并完成；
+    进度缓冲不可用时在数据库中累加，返回更新的任务数
+    指定 batch_id（队列中的批次）时缓冲中的累加按批次幂等，Redis错误直接抛出，由分发重放该批次
+    """
+    events = list(events)
+    with metrics.timer("game_events.apply_seconds"):
+        increments = _increments(events, db)
+        metrics.incr("game_events.applied", len(events))
+        if not increments:
+            return 0
+
+        tasks = catalog.get_catalog("tasks", db)
+        rows = db.query(
+            CharacterTask.id, CharacterTask.character_id, CharacterTask.task_id, CharacterTask.progress
+        ).filter(
+            CharacterTask.character_id.in_({character_id for character_id, _ in increments}),
+            CharacterTask.task_id.in_({task_id for _, task_id in increments}),
+            CharacterTask.status == TaskStatus.ACCEPTED
+        ).all()
+
+        now = datetime.utcnow()
+        entries = []
+        for row in rows:
+            amount = increments.get((row.character_id, row.task_id))
+            task = tasks.get(row.task_id)
+            if amount and task is not None:
+                entries.append((row.id, row.progress, amount, task.target_count))
+
+        if batch_id is not None and task_progress.enabled():
+            buffered = task_progress.increment_many(APPLIED_KEY.format(batch_id=batch_id), entries)
+        else:
+            buffered = {}
+            for character_task_id, progress, amount, target in entries:
+                progress = task_progress.increment(character_task_id, progress, amount, target)
+                if progress is not None:
+                    buffered[character_task_id] = progress
+
+        completed = []
+        incremented = []
+        updated = len(entries)
+        for character_task_id, _, amount, target in entries:
+            progress = buffered.get(character_task_id)
+            if progress is None:
+                incremented.append({"b_id": character_task_id, "b_amount": amount, "b_target": target, "b_completed_at": now})
+            elif progress >= target:
+                completed.append({"b_id": character_task_id, "b_progress": progress, "b_completed_at": now})
+
+        if completed:
+            db.execute(_COMPLETE_TASKS, completed)
+        if incremented:
+            db.execute(_INCREMENT_PROGRESS, incremented)
+        db.commit()
+        for params in completed:
+            task_progress.discard(params["b_id"])
+    metrics.incr("game_events.tasks_updated", updated)
+    metrics.incr("game_events.tasks_completed", len(completed))
+    return updated
+
+
+# 分发队列中的事件
+def dispatch(db: Session = None) -> int:
+    """
+    每次原子地把一批事件从队列移入正在应用的批次，应用并提交后才删除批次，直到队列为空
+    上一次分发中途失败或崩溃留下的批次会先被重放（进度缓冲中的累加按批次幂等，不会重复计数），事件不会丢失；
+    同一批次应用 MAX_ATTEMPTS 次仍失败时移入死信队列
+    """
+    try:
+        token = acquire_lock(DISPATCH_LOCK_KEY, max(int(FLUSH_INTERVAL * 30), 30))
+        if token is None:
+            return 0
+    except redis.RedisError as e:
+        print(f"Game event dispatch error: {e}")
+        return 0
+
+    owns_session = db is None
+    db = db or SessionLocal()
+    count = 0
+    try:
+        while True:
+            batch = TAKE_BATCH_SCRIPT(keys=[QUEUE_KEY, PROCESSING_KEY, BATCH_KEY, BATCH_SEQ_KEY], args=[BATCH_SIZE])
+            if not batch:
+                return count
+            batch_id, attempts, raw_events = batch[0], int(batch[1]), batch[2:]
+            if attempts > 1:
+                metrics.incr("game_events.replayed", len(raw_events))
+            if attempts > MAX_ATTEMPTS:
+                _dead_letter(batch_id, raw_events)
+                continue
+            try:
+                apply_events([GameEvent(**json.loads(raw)) for raw in raw_events], db, batch_id)
+            except Exception:
+                db.rollback()
+                metrics.incr("game_events.errors")
+                raise
+            _finish(batch_id)
+            count += len(raw_events)
+    finally:
+        if owns_session:
+            db.close()
+        release_lock(DISPATCH_LOCK_KEY, token)
+
+
+def _finish(batch_id: str):
+    redis_client.delete(PROCESSING_KEY, BATCH_KEY, APPLIED_KEY.format(batch_id=batch_id))
+
+
+def _dead_letter(batch_id: str, raw_events: List[str]):
+    """多次应用失败的批次移入死信队列，保留原始事件供排查后重新入队"""
+    pipe = redis_client.pipeline()
+    pipe.rpush(DEAD_LETTER_KEY, *raw_events)
+    pipe.delete(PROCESSING_KEY, BATCH_KEY, APPLIED_KEY.format(batch_id=batch_id))
+    pipe.execute()
+    metrics.incr("game_events.dead_lettered", len(raw_events))
+    print(f"Game event batch {batch_id} moved to dead letter queue ({len(raw_events)} events)")
+
+
+def _run():
+    while not _stop_event.wait(FLUSH_INTERVAL):
+        try:
+            dispatch()
+        except Exception as e:
+            print(f"Game event dispatch error: {e}")
+
+
+# 启动事件分发
+def start_dispatcher():
+    """启动后台线程，按 GAME_EVENT_FLUSH_INTERVAL 周期批量应用事件"""
+    global _worker
+    if not enabled() or (_worker is not None and _worker.is_alive()):
+        return
+    _stop_event.clear()
+    _worker = threading.Thread(target=_run, name="game-event-dispatcher", daemon=True)
+    _worker.start()
+
+
+# 停止事件分发
+def stop_dispatcher():
+    """停止后台线程并应用队列中剩余的事件"""
+    _stop_event.set()
+    if enabled():
+        try:
+            dispatch()
+        except Exception as e:
+            print(f"Game event dispatch error: {e}")
@@ -0,0 +1,60 @@
+import json
+import os
+import redis
+from typing import Any, Optional
+from dotenv import load_dotenv
+from app import metrics
+from app.redis import redis_client, release_lock
+
+# 加载环境变量
+load_dotenv()
+
+# 幂等键保存时间（秒），客户端在此期间用同一个键重试会直接得到第一次的结果
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# 处理中标记的过期时间（秒），按请求超时设置；处理请求的进程崩溃后客户端在此之后即可重试
+IDEMPOTENCY_PENDING_TTL = int(os.getenv("IDEMPOTENCY_PENDING_TTL", "60"))
+
+# 幂等键: {作用域}:{客户端提供的键}
+KEY = "idempotency:{scope}:{key}"
+# 第一次请求仍在处理中
+PENDING = "__pending__"
+
+
+# 占用幂等键
+def begin(scope: str, key: Optional[str]) -> Any:
+    """
+    返回 None 表示由本请求处理；返回 PENDING 表示同一个键的请求仍在处理中；
+    否则返回第一次请求保存的结果。未提供键或Redis不可用时总是返回 None
+    """
+    if not key:
+        return None
+    name = KEY.format(scope=scope, key=key)
+    try:
+        if redis_client.set(name, PENDING, nx=True, ex=IDEMPOTENCY_PENDING_TTL):
+            return None
+        stored = redis_client.get(name)
+    except redis.RedisError as e:
+        print(f"Idempotency error: {e}")
+        return None
+    if stored is None or stored == PENDING:
+        return PENDING
+    metrics.incr("idempotency.replayed")
+    return json.loads(stored)
+
+
+# 保存处理结果
+def complete(scope: str, key: Optional[str], result: Any):
+    if not key:
+        return
+    try:
+        redis_client.set(KEY.format(scope=scope, key=key), json.dumps(result, default=str), ex=IDEMPOTENCY_TTL)
+    except redis.RedisError as e:
+        print(f"Idempotency error: {e}")
+
+
+# 释放幂等键
+def abort(scope: str, key: Optional[str]):
+    """处理失败时删除处理中标记，允许客户端用同一个键重试；已保存的结果不会被删除"""
+    if not key:
+        return
+    release_lock(KEY.format(scope=scope, key=key), PENDING)
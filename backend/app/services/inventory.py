@@ -0,0 +1,337 @@
+import json
+import os
+import redis
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app import metrics
+from app.redis import redis_client
+from app.models.equipment import Equipment, EquipmentSlot
+from app.models.inventory import InventoryItem
+from app.services import catalog
+from app.services.equip import dialect_insert
+
+# 加载环境变量
+load_dotenv()
+
+# 背包缓存保存时间（秒），背包变化时主动失效
+INVENTORY_CACHE_TTL = int(os.getenv("INVENTORY_CACHE_TTL", "3600"))
+
+# 单次添加的装备实例数上限
+MAX_INSTANCES = int(os.getenv("INVENTORY_MAX_INSTANCES", "1000"))
+
+# 背包缓存键名
+KEY = "inventory:{character_id}"
+
+# 物品标识前缀
+EQUIPMENT_PREFIX = "equipment:"
+PRODUCT_PREFIX = "product:"
+
+
+class InventoryError(ValueError):
+    """物品不存在或数量不足，调用方应回滚事务"""
+
+
+class InventoryView(NamedTuple):
+    """背包的紧凑视图"""
+    # {物品标识: 数量}
+    stacks: Dict[str, int]
+    # 装备实例 (实例ID, 物品标识, 耐久度)
+    instances: List[Tuple[int, str, int]]
+
+
+def equipment_key(equipment_id: int) -> str:
+    return f"{EQUIPMENT_PREFIX}{equipment_id}"
+
+
+def product_key(product_id: int) -> str:
+    return f"{PRODUCT_PREFIX}{product_id}"
+
+
+def equipment_id_of(item_key: str) -> Optional[int]:
+    """装备物品标识对应的装备ID，非装备返回None"""
+    if item_key.startswith(EQUIPMENT_PREFIX):
+        try:
+            return int(item_key[len(EQUIPMENT_PREFIX):])
+        except ValueError:
+            return None
+    return None
+
+
+def _split(items: Dict[str, int]) -> Tuple[Dict[str, int], Dict[int, int]]:
+    """把 {物品标识: 数量} 拆成可堆叠物品和 {装备ID: 件数}"""
+    stacks, equipment = {}, {}
+    for item_key, quantity in items.items():
+        if quantity <= 0:
+            raise InventoryError(f"invalid quantity for {item_key}: {quantity}")
+        equipment_id = equipment_id_of(item_key)
+        if equipment_id is None:
+            stacks[item_key] = quantity
+        else:
+            equipment[equipment_id] = quantity
+    return stacks, equipment
+
+
+# 添加物品
+def add(db: Session, character_id: int, items: Dict[str, int]):
+    """
+    批量添加物品（不提交）：
+    可堆叠物品用一条 INSERT ... ON CONFLICT DO UPDATE SET quantity = quantity + excluded.quantity 合并到已有堆叠，
+    装备按件数生成带耐久度的实例，用一条多行 INSERT 写入
+    """
+    stacks, equipment = _split(items)
+    if stacks:
+        _add_stacks(db, character_id, stacks)
+    if equipment:
+        if sum(equipment.values()) > MAX_INSTANCES:
+            raise InventoryError(f"too many equipment instances (max {MAX_INSTANCES})")
+        equipment_catalog = catalog.get_catalog("equipment", db)
+        rows = []
+        for equipment_id, count in equipment.items():
+            template = equipment_catalog.get(equipment_id)
+            if template is None:
+                raise InventoryError(f"unknown equipment: {equipment_id}")
+            rows.extend(
+                {
+                    "character_id": character_id, "item_key": equipment_key(equipment_id),
+                    "equipment_id": equipment_id, "quantity": 1, "durability": 100 if template.durability is None else template.durability,
+                }
+                for _ in range(count)
+            )
+        db.execute(insert(InventoryItem), rows)
+    metrics.incr("inventory.added", sum(items.values()))
+
+
+def _add_stacks(db: Session, character_id: int, stacks: Dict[str, int]):
+    rows = [
+        {"character_id": character_id, "item_key": item_key, "quantity": quantity}
+        for item_key, quantity in stacks.items()
+    ]
+    upsert = dialect_insert(db)
+    if upsert is not None:
+        statement = upsert(InventoryItem).values(rows)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[InventoryItem.character_id, InventoryItem.item_key],
+            index_where=InventoryItem.durability.is_(None),
+            set_={"quantity": InventoryItem.quantity + statement.excluded.quantity}
+        ))
+        return
+
+    # 不支持 ON CONFLICT 的数据库：先累加已有堆叠，再插入其余物品
+    existing = {
+        item_key for (item_key,) in db.query(InventoryItem.item_key).filter(
+            InventoryItem.character_id == character_id,
+            InventoryItem.durability.is_(None),
+            InventoryItem.item_key.in_(stacks)
+        )
+    }
+    if existing:
+        db.execute(
+            update(InventoryItem)
+            .where(
+                InventoryItem.character_id == character_id,
+                InventoryItem.durability.is_(None),
+                InventoryItem.item_key.in_(existing)
+            )
+            .values(quantity=InventoryItem.quantity + case(stacks, value=InventoryItem.item_key))
+            .execution_options(synchronize_session=False)
+        )
+    new_rows = [row for row in rows if row["item_key"] not in existing]
+    if new_rows:
+        db.execute(insert(InventoryItem), new_rows)
+
+
+def _remove_stacks(db: Session, character_id: int, stacks: Dict[str, int]):
+    """一条条件 UPDATE 扣减全部堆叠，任一物品数量不足时抛出 InventoryError，数量归零的堆叠随后删除"""
+    amount = case(stacks, value=InventoryItem.item_key)
+    updated = db.execute(
+        update(InventoryItem)
+        .where(
+            InventoryItem.character_id == character_id,
+            InventoryItem.durability.is_(None),
+            InventoryItem.item_key.in_(stacks),
+            InventoryItem.quantity >= amount
+        )
+        .values(quantity=InventoryItem.quantity - amount)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if updated != len(stacks):
+        raise InventoryError("insufficient items")
+    db.execute(
+        delete(InventoryItem)
+        .where(InventoryItem.character_id == character_id, InventoryItem.quantity <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# 角色拥有的装备实例数
+def owned_equipment(db: Session, character_id: int, equipment_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """一条分组查询返回 {装备ID: 实例数}，穿戴不消耗实例，已穿戴的装备也计入"""
+    query = db.query(InventoryItem.equipment_id, func.count()).filter(
+        InventoryItem.character_id == character_id,
+        InventoryItem.equipment_id.isnot(None),
+        InventoryItem.durability.isnot(None)
+    )
+    if equipment_ids is not None:
+        query = query.filter(InventoryItem.equipment_id.in_(list(equipment_ids)))
+    return dict(query.group_by(InventoryItem.equipment_id).all())
+
+
+def _check_equipped(db: Session, character_id: int):
+    """移走实例后，已穿戴的每件装备仍需有对应的实例，否则抛出 InventoryError"""
+    equipped = dict(db.query(EquipmentSlot.equipment_id, func.count()).filter(
+        EquipmentSlot.character_id == character_id
+    ).group_by(EquipmentSlot.equipment_id).all())
+    if not equipped:
+        return
+    owned = owned_equipment(db, character_id, equipped)
+    if any(owned.get(equipment_id, 0) < count for equipment_id, count in equipped.items()):
+        raise InventoryError("equipment instance is equipped")
+
+
+def _check_instances(items: Dict[str, int]):
+    if any(equipment_id_of(item_key) is not None for item_key in items):
+        raise InventoryError("equipment must be referenced by instance id")
+
+
+# 移除物品
+def remove(db: Session, character_id: int, items: Optional[Dict[str, int]] = None, instance_ids: Iterable[int] = ()):
+    """批量移除可堆叠物品（按数量）和装备实例（按实例ID），不提交；任一项不足时抛出 InventoryError"""
+    items = items or {}
+    instance_ids = list(set(instance_ids))
+    _check_instances(items)
+    stacks, _ = _split(items)
+    if stacks:
+        _remove_stacks(db, character_id, stacks)
+    if instance_ids:
+        deleted = db.execute(
+            delete(InventoryItem)
+            .where(
+                InventoryItem.id.in_(instance_ids),
+                InventoryItem.character_id == character_id,
+                InventoryItem.durability.isnot(None)
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if deleted != len(instance_ids):
+            raise InventoryError("unknown instance")
+        _check_equipped(db, character_id)
+    metrics.incr("inventory.removed", sum(stacks.values()) + len(instance_ids))
+
+
+# 在角色之间转移物品
+def move(db: Session, from_character_id: int, to_character_id: int,
+         items: Optional[Dict[str, int]] = None, instance_ids: Iterable[int] = ()):
+    """扣减来源角色的堆叠后合并到目标角色，装备实例直接改归属，不提交"""
+    items = items or {}
+    instance_ids = list(set(instance_ids))
+    _check_instances(items)
+    stacks, _ = _split(items)
+    if stacks:
+        _remove_stacks(db, from_character_id, stacks)
+        _add_stacks(db, to_character_id, stacks)
+    if instance_ids:
+        moved = db.execute(
+            update(InventoryItem)
+            .where(
+                InventoryItem.id.in_(instance_ids),
+                InventoryItem.character_id == from_character_id,
+                InventoryItem.durability.isnot(None)
+            )
+            .values(character_id=to_character_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if moved != len(instance_ids):
+            raise InventoryError("unknown instance")
+        _check_equipped(db, from_character_id)
+    metrics.incr("inventory.moved", sum(stacks.values()) + len(instance_ids))
+
+
+# 为已穿戴的装备补齐背包实例
+def backfill_equipped(conn: Connection) -> int:
+    """
+    背包上线前穿戴的装备没有对应的实例，按槽位数补齐缺少的实例（耐久度取装备模板），
+    已有足够实例时不做修改，返回新增的实例数
+    """
+    equipped = conn.execute(
+        select(EquipmentSlot.character_id, EquipmentSlot.equipment_id, func.count(), func.coalesce(Equipment.durability, 100))
+        .join(Equipment, Equipment.id == EquipmentSlot.equipment_id)
+        .group_by(EquipmentSlot.character_id, EquipmentSlot.equipment_id, Equipment.durability)
+    ).all()
+    if not equipped:
+        return 0
+    owned = {
+        (character_id, equipment_id): count
+        for character_id, equipment_id, count in conn.execute(
+            select(InventoryItem.character_id, InventoryItem.equipment_id, func.count())
+            .where(InventoryItem.equipment_id.isnot(None), InventoryItem.durability.isnot(None))
+            .group_by(InventoryItem.character_id, InventoryItem.equipment_id)
+        )
+    }
+    rows = [
+        {
+            "character_id": character_id, "item_key": equipment_key(equipment_id),
+            "equipment_id": equipment_id, "quantity": 1, "durability": durability,
+        }
+        for character_id, equipment_id, count, durability in equipped
+        for _ in range(count - owned.get((character_id, equipment_id), 0))
+    ]
+    if rows:
+        conn.execute(insert(InventoryItem), rows)
+    return len(rows)
+
+
+# 物品列表转为 {物品标识: 数量}
+def count_items(item_keys: Iterable[str]) -> Dict[str, int]:
+    return dict(Counter(item_keys))
+
+
+# 从数据库加载背包
+def load(character_id: int, db: Session) -> InventoryView:
+    stacks, instances = {}, []
+    rows = db.query(InventoryItem.id, InventoryItem.item_key, InventoryItem.quantity, InventoryItem.durability).filter(
+        InventoryItem.character_id == character_id
+    ).order_by(InventoryItem.id)
+    for item_id, item_key, quantity, durability in rows:
+        if durability is None:
+            stacks[item_key] = quantity
+        else:
+            instances.append((item_id, item_key, durability))
+    return InventoryView(stacks, instances)
+
+
+# 获取背包
+def get(character_id: int, db: Session) -> InventoryView:
+    """优先读取缓存；未命中时从数据库加载并写回，Redis不可用时直接查询"""
+    key = KEY.format(character_id=character_id)
+    try:
+        cached = redis_client.get(key)
+    except redis.RedisError as e:
+        print(f"Inventory cache error: {e}")
+        return load(character_id, db)
+    if cached:
+        metrics.incr("inventory.cache_hits")
+        stacks, instances = json.loads(cached)
+        return InventoryView(stacks, [tuple(instance) for instance in instances])
+
+    metrics.incr("inventory.cache_misses")
+    view = load(character_id, db)
+    try:
+        redis_client.set(key, json.dumps([view.stacks, view.instances], ensure_ascii=False), ex=INVENTORY_CACHE_TTL)
+    except redis.RedisError as e:
+        print(f"Inventory cache error: {e}")
+    return view
+
+
+# 使背包缓存失效
+def invalidate(*character_ids: int):
+    """在背包变化的事务提交后调用"""
+    if not character_ids:
+        return
+    try:
+        redis_client.delete(*(KEY.format(character_id=character_id) for character_id in character_ids))
+    except redis.RedisError as e:
+        print(f"Inventory cache error: {e}")
@@ -0,0 +1,407 @@
+import json
+import redis
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app import metrics, response_cache
+from app.redis import acquire_lock, redis_client, release_lock
+from app.models.character import Character
+from app.services.power import calculate_character_power, character_power_query
+
+# 排行榜类型
+LEVEL_BOARD = "level"
+POWER_BOARD = "power"
+BOARDS = (LEVEL_BOARD, POWER_BOARD)
+
+# 有序集合键名前缀，完整键名如 leaderboard:level、leaderboard:power:class:战士、leaderboard:level:bracket:1-10
+KEY_PREFIX = "leaderboard:"
+# 角色展示信息（角色名、玩家名、职业、等级、战力）
+META_KEY = "leaderboard:meta"
+# 玩家拥有的角色集合
+USER_KEY = "leaderboard:user:{user_id}"
+# 当前存在的所有排行榜视图
+VIEWS_KEY = "leaderboard:views"
+# 重建完成标记
+READY_KEY = "leaderboard:ready"
+# 重建锁，同一时间只有一个进程重建；持有期间的角色更新记录在 DIRTY_KEY 中，替换前重新读取
+REBUILD_LOCK_KEY = "leaderboard:rebuild_lock"
+DIRTY_KEY = "leaderboard:rebuild_dirty"
+# 重建时写入的临时键后缀
+REBUILD_SUFFIX = ":rebuild"
+
+# 重建锁超时时间（秒），重建进程中途退出时锁自动过期
+REBUILD_LOCK_TTL = 600
+# 替换临时键时因并发更新而重试的次数
+SWAP_RETRIES = 10
+
+# 排行榜展示数量
+TOP_LIMIT = 100
+# 等级段跨度，1-10、11-20 ... 91-100
+BRACKET_SIZE = 10
+
+# 等级排行分数 = 等级 * 基数 + 战力，保证等级相同时按战力排序
+LEVEL_SCORE_BASE = 10 ** 10
+
+
+def level_score(level: int, power: int) -> int:
+    """计算等级排行分数"""
+    return level * LEVEL_SCORE_BASE + power
+
+
+def level_bracket(level: int) -> str:
+    """角色等级所在的等级段，如 1-10"""
+    start = (level - 1) // BRACKET_SIZE * BRACKET_SIZE + 1
+    return f"{start}-{start + BRACKET_SIZE - 1}"
+
+
+def view_key(board: str, class_type: str = None, bracket: str = None) -> str:
+    """
+    排行榜视图名：全服榜为 level/power，
+    职业榜为 level:class:<职业>，等级段榜为 level:bracket:<等级段>
+    """
+    if class_type:
+        return f"{board}:class:{class_type}"
+    if bracket:
+        return f"{board}:bracket:{bracket}"
+    return board
+
+
+def character_views(data: Dict) -> Dict[str, int]:
+    """角色所在的全部排行榜视图及对应分数"""
+    scores = {
+        LEVEL_BOARD: level_score(data["level"], data["power"]),
+        POWER_BOARD: data["power"],
+    }
+    views = {}
+    for board, score in scores.items():
+        views[view_key(board)] = score
+        if data.get("class_type"):
+            views[view_key(board, class_type=data["class_type"])] = score
+        views[view_key(board, bracket=level_bracket(data["level"]))] = score
+    return views
+
+
+def _meta(data: Dict) -> str:
+    return json.dumps({
+        "character_name": data["character_name"],
+        "user_id": data["user_id"],
+        "username": data["username"],
+        "class_type": data.get("class_type"),
+        "level": data["level"],
+        "power": data["power"],
+    }, ensure_ascii=False)
+
+
+def _state(character_id: int) -> Tuple[Optional[str], bool]:
+    """一次往返读取角色当前的展示信息和是否正在重建"""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hget(META_KEY, character_id)
+    pipe.exists(REBUILD_LOCK_KEY)
+    old_meta, rebuilding = pipe.execute()
+    return old_meta, bool(rebuilding)
+
+
+def _snapshot_mode() -> bool:
+    # 快照模式下排行榜只从快照读取，不维护有序集合
+    from app.services import ranking_snapshot
+    return ranking_snapshot.enabled()
+
+
+# 更新单个角色的排行榜数据
+def update_character(character: Character, power: int, username: str = None) -> bool:
+    """
+    将角色的等级和战力写入排行榜有序集合
+    在升级、穿戴装备、卸下装备后调用；等级段变化时从旧视图中移除
+    """
+    if _snapshot_mode():
+        return True
+    if username is None:
+        username = character.user.username
+    data = {
+        "character_id": character.id,
+        "character_name": character.name,
+        "user_id": character.user_id,
+        "username": username,
+        "class_type": character.class_type,
+        "level": character.level,
+        "power": power,
+    }
+    views = character_views(data)
+    try:
+        old_meta, rebuilding = _state(character.id)
+        pipe = redis_client.pipeline()
+        if rebuilding:
+            pipe.sadd(DIRTY_KEY, character.id)
+        if old_meta:
+            for view in character_views(json.loads(old_meta)):
+                if view not in views:
+                    pipe.zrem(KEY_PREFIX + view, character.id)
+        for view, score in views.items():
+            pipe.zadd(KEY_PREFIX + view, {character.id: score})
+        pipe.sadd(VIEWS_KEY, *views)
+        pipe.hset(META_KEY, character.id, _meta(data))
+        pipe.sadd(USER_KEY.format(user_id=character.user_id), character.id)
+        pipe.execute()
+        return True
+    except redis.RedisError as e:
+        print(f"Leaderboard update error: {e}")
+        return False
+    finally:
+        response_cache.bump("ranking")
+
+
+# 同步角色的排行榜数据
+def sync_character(character: Character, db: Session, username: str = None) -> bool:
+    """将角色当前的等级和战力同步到排行榜，战力列未回填时实时计算"""
+    power = character.power
+    if power is None:
+        power = calculate_character_power(character, db)
+    return update_character(character, power, username)
+
+
+# 从排行榜中移除角色
+def remove_character(character_id: int, user_id: int) -> bool:
+    """删除角色时从排行榜中移除"""
+    if _snapshot_mode():
+        return True
+    try:
+        old_meta, rebuilding = _state(character_id)
+        pipe = redis_client.pipeline()
+        if rebuilding:
+            pipe.sadd(DIRTY_KEY, character_id)
+        if old_meta:
+            for view in character_views(json.loads(old_meta)):
+                pipe.zrem(KEY_PREFIX + view, character_id)
+        pipe.hdel(META_KEY, character_id)
+        pipe.srem(USER_KEY.format(user_id=user_id), character_id)
+        pipe.execute()
+        return True
+    except redis.RedisError as e:
+        print(f"Leaderboard remove error: {e}")
+        return False
+    finally:
+        response_cache.bump("ranking")
+
+
+def _write_rebuild(pipe, rows: Iterable, views: set, user_keys: set):
+    """把角色行写入重建用的临时键"""
+    for row in rows:
+        data = row._asdict()
+        data["power"] = int(data["power"])
+        for view, score in character_views(data).items():
+            views.add(view)
+            pipe.zadd(KEY_PREFIX + view + REBUILD_SUFFIX, {data["character_id"]: score})
+        pipe.hset(META_KEY + REBUILD_SUFFIX, data["character_id"], _meta(data))
+        user_key = USER_KEY.format(user_id=data["user_id"])
+        user_keys.add(user_key)
+        pipe.sadd(user_key + REBUILD_SUFFIX, data["character_id"])
+
+
+def _rewrite_dirty(db: Session, character_ids: List[str], views: set, user_keys: set):
+    """重新读取重建期间更新过的角色：先从临时键中移除旧数据，再写入数据库中的最新数据"""
+    pipe = redis_client.pipeline(transaction=False)
+    for character_id, meta in zip(character_ids, redis_client.hmget(META_KEY + REBUILD_SUFFIX, character_ids)):
+        if meta is None:
+            continue
+        data = json.loads(meta)
+        for view in character_views(data):
+            pipe.zrem(KEY_PREFIX + view + REBUILD_SUFFIX, character_id)
+        pipe.hdel(META_KEY + REBUILD_SUFFIX, character_id)
+        pipe.srem(USER_KEY.format(user_id=data["user_id"]) + REBUILD_SUFFIX, character_id)
+    _write_rebuild(pipe, character_power_query(db, [int(character_id) for character_id in character_ids]), views, user_keys)
+    pipe.execute()
+
+
+def _swap(db: Session, views: set, user_keys: set, old_views: set) -> Optional[int]:
+    """
+    把临时键原子替换为正式键，删除不再存在的视图和玩家角色集合，返回角色数；
+    替换前重新写入重建期间更新过的角色，替换时又有更新则重试
+    """
+    old_user_keys = {
+        key for key in redis_client.scan_iter(match=USER_KEY.format(user_id="*"))
+        if not key.endswith(REBUILD_SUFFIX)
+    }
+    for _ in range(SWAP_RETRIES):
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(DIRTY_KEY)
+                dirty = pipe.smembers(DIRTY_KEY)
+                if dirty:
+                    pipe.unwatch()
+                    redis_client.srem(DIRTY_KEY, *dirty)
+                    _rewrite_dirty(db, list(dirty), views, user_keys)
+                    continue
+                # 临时键只由持有重建锁的进程写入；重新写入后可能为空（角色已删除），对应的正式键直接删除
+                names = [KEY_PREFIX + view for view in views] + sorted(user_keys) + [META_KEY]
+                check = redis_client.pipeline(transaction=False)
+                for name in names:
+                    check.exists(name + REBUILD_SUFFIX)
+                count = redis_client.hlen(META_KEY + REBUILD_SUFFIX)
+                pipe.multi()
+                for name, exists in zip(names, check.execute()):
+                    if exists:
+                        pipe.rename(name + REBUILD_SUFFIX, name)
+                    else:
+                        pipe.delete(name)
+                for view in old_views - views:
+                    pipe.delete(KEY_PREFIX + view)
+                for user_key in old_user_keys - user_keys:
+                    pipe.delete(user_key)
+                pipe.delete(VIEWS_KEY)
+                if views:
+                    pipe.sadd(VIEWS_KEY, *views)
+                pipe.set(READY_KEY, count)
+                pipe.execute()
+                return count
+            except redis.WatchError:
+                continue
+    return None
+
+
+# 全量重建排行榜
+def rebuild(db: Session, batch_size: int = 1000) -> Optional[int]:
+    """
+    从数据库全量重建排行榜，用于冷启动或数据修复，返回角色数；其他进程正在重建时返回None
+    先写入临时键，完成后再原子替换，重建期间排行榜仍可正常读取；
+    重建期间更新过的角色在替换前重新读取，不会被旧数据覆盖
+    """
+    token = acquire_lock(REBUILD_LOCK_KEY, REBUILD_LOCK_TTL)
+    if token is None:
+        return None
+    try:
+        with metrics.timer("leaderboard.rebuild_seconds"):
+            return _rebuild(db, batch_size)
+    finally:
+        release_lock(REBUILD_LOCK_KEY, token)
+
+
+def _rebuild(db: Session, batch_size: int) -> Optional[int]:
+    views = set()
+    user_keys = set()
+
+    old_views = redis_client.smembers(VIEWS_KEY)
+    stale = list(redis_client.scan_iter(match=KEY_PREFIX + "*" + REBUILD_SUFFIX))
+    redis_client.delete(DIRTY_KEY, *stale)
+    # 批量战力查询，一条SQL流式读取全部角色
+    pipe = redis_client.pipeline(transaction=False)
+    batch = []
+    for row in character_power_query(db).order_by(Character.id).yield_per(batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            _write_rebuild(pipe, batch, views, user_keys)
+            pipe.execute()
+            batch = []
+    _write_rebuild(pipe, batch, views, user_keys)
+    pipe.execute()
+
+    count = _swap(db, views, user_keys, old_views)
+    if count is None:
+        metrics.incr("leaderboard.rebuild_conflicts")
+        return None
+    response_cache.bump("ranking")
+    return count
+
+
+# 确保排行榜已初始化
+def ensure_ready(db: Session) -> bool:
+    """
+    排行榜尚未构建时由一个进程执行全量重建；
+    其他进程正在重建或Redis不可用时返回False，由调用方从数据库读取
+    """
+    try:
+        if redis_client.exists(READY_KEY):
+            return True
+        return rebuild(db) is not None
+    except redis.RedisError as e:
+        print(f"Leaderboard rebuild error: {e}")
+        return False
+
+
+# 标记排行榜需要重建
+def invalidate():
+    """删除就绪标记，下次读取时从数据库全量重建"""
+    try:
+        redis_client.delete(READY_KEY)
+    except redis.RedisError as e:
+        print(f"Leaderboard invalidate error: {e}")
+
+
+def _entries(character_ids: List[str], start_rank: int) -> List[Dict]:
+    if not character_ids:
+        return []
+    metas = redis_client.hmget(META_KEY, character_ids)
+    entries = []
+    for i, (character_id, meta) in enumerate(zip(character_ids, metas)):
+        if meta is None:
+            continue
+        entries.append({
+            "rank": start_rank + i,
+            "character_id": int(character_id),
+            **json.loads(meta),
+        })
+    return entries
+
+
+# 分页读取排行榜
+def get_page(view: str, offset: int = 0, limit: int = TOP_LIMIT) -> Optional[Tuple[List[Dict], int]]:
+    """按名次分页读取排行榜，返回 (本页数据, 总人数)，复杂度 O(log N + limit)"""
+    try:
+        character_ids = redis_client.zrevrange(KEY_PREFIX + view, offset, offset + limit - 1)
+        total = redis_client.zcard(KEY_PREFIX + view)
+        return _entries(character_ids, offset + 1), total
+    except redis.RedisError as e:
+        print(f"Leaderboard read error: {e}")
+        return None
+
+
+# 获取排行榜前N名
+def get_top(view: str, limit: int = TOP_LIMIT) -> Optional[List[Dict]]:
+    """获取排行榜前N名"""
+    page = get_page(view, 0, limit)
+    return page[0] if page is not None else None
+
+
+# 获取玩家个人排名
+def get_personal_rank(view: str, user_id: int) -> Optional[int]:
+    """获取玩家排名最高的角色的名次，复杂度 O(log N)"""
+    try:
+        character_ids = redis_client.smembers(USER_KEY.format(user_id=user_id))
+        if not character_ids:
+            return None
+        pipe = redis_client.pipeline()
+        for character_id in character_ids:
+            pipe.zrevrank(KEY_PREFIX + view, character_id)
+        ranks = [rank for rank in pipe.execute() if rank is not None]
+    except redis.RedisError as e:
+        print(f"Leaderboard read error: {e}")
+        return None
+    return min(ranks) + 1 if ranks else None
+
+
+# 获取玩家附近的排名
+def get_around(view: str, user_id: int, radius: int) -> Optional[Tuple[List[Dict], int, Optional[int]]]:
+    """获取玩家最佳角色上下各 radius 名的排行数据，返回 (数据, 总人数, 个人排名)"""
+    rank = get_personal_rank(view, user_id)
+    if rank is None:
+        return [], 0, None
+    start = max(rank - 1 - radius, 0)
+    page = get_page(view, start, rank - start + radius)
+    if page is None:
+        return None
+    return page[0], page[1], rank
+
+
+if __name__ == "__main__":
+    # 命令行全量重建: python -m app.services.leaderboard
+    from app.database import SessionLocal
+    from app.database_init import init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        total = rebuild(db)
+        if total is None:
+            print("其他进程正在重建排行榜")
+        else:
+            print(f"排行榜重建完成，共 {total} 个角色")
+    finally:
+        db.close()
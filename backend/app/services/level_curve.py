@@ -0,0 +1,121 @@
+import bisect
+from itertools import accumulate
+from typing import Dict, List, NamedTuple, Tuple
+
+# 等级上限
+MAX_LEVEL = 100
+
+# 基础属性
+ATTRIBUTES = ("strength", "agility", "intelligence", "vitality")
+
+# 职业属性成长系数
+CLASS_GROWTH_BONUSES = {
+    "warrior": {"strength": 1.5, "vitality": 1.3, "agility": 0.8, "intelligence": 0.5},
+    "mage": {"intelligence": 1.5, "agility": 0.8, "vitality": 0.7, "strength": 0.5},
+    "archer": {"agility": 1.5, "strength": 1.0, "intelligence": 0.7, "vitality": 0.8},
+    "thief": {"agility": 1.4, "intelligence": 0.9, "strength": 0.9, "vitality": 0.8},
+    "priest": {"intelligence": 1.3, "vitality": 1.1, "strength": 0.6, "agility": 0.7}
+}
+DEFAULT_GROWTH_BONUS = {"strength": 1.0, "agility": 1.0, "intelligence": 1.0, "vitality": 1.0}
+
+
+# 计算升级所需经验值
+def calculate_next_level_exp(current_level: int) -> int:
+    """
+    计算升级所需经验值
+    公式: 基础经验值 * 等级因子
+    基础经验值: 1000
+    等级因子: 1.5 ^ (等级-1)
+    """
+    base_exp = 1000
+    level_factor = 1.5 ** (current_level - 1)
+    return int(base_exp * level_factor)
+
+# 根据职业类型获取属性成长系数
+def get_class_growth_bonus(class_type: str) -> Dict[str, float]:
+    """
+    根据职业类型获取属性成长系数
+    """
+    return CLASS_GROWTH_BONUSES.get(class_type.lower(), DEFAULT_GROWTH_BONUS)
+
+# 计算属性成长值
+def calculate_attribute_growth(current_level: int, base_growth: float, class_bonus: float) -> int:
+    """
+    计算属性成长值
+    公式: 基础成长值 * 等级因子 * 职业系数
+    """
+    base_growth_value = 2
+    level_factor = 1 + (current_level - 1) * 0.05  # 等级越高，成长越高
+    total_growth = base_growth_value * level_factor * class_bonus
+    return int(total_growth)
+
+
+# 以下表格在导入时一次性生成，下标为等级（下标0不使用）
+
+# 各等级升级所需经验值
+NEXT_LEVEL_EXP: Tuple[int, ...] = tuple(
+    [0] + [calculate_next_level_exp(level) for level in range(1, MAX_LEVEL + 1)]
+)
+
+# 从1级0经验升到各等级所需的累计经验值，CUMULATIVE_EXP[1] = 0
+CUMULATIVE_EXP: Tuple[int, ...] = (0,) + tuple(accumulate(NEXT_LEVEL_EXP[1:MAX_LEVEL], initial=0))
+
+
+def _growth_table(bonus: Dict[str, float]) -> Dict[str, Tuple[int, ...]]:
+    """各属性从1级升到各等级的累计成长值"""
+    table = {}
+    for attribute in ATTRIBUTES:
+        totals: List[int] = [0, 0]
+        for level in range(2, MAX_LEVEL + 1):
+            totals.append(totals[-1] + calculate_attribute_growth(level, 1.0, bonus.get(attribute, 1.0)))
+        table[attribute] = tuple(totals)
+    return table
+
+
+# 各职业的累计属性成长表，未知职业使用默认系数
+GROWTH_TABLES = {class_type: _growth_table(bonus) for class_type, bonus in CLASS_GROWTH_BONUSES.items()}
+DEFAULT_GROWTH_TABLE = _growth_table(DEFAULT_GROWTH_BONUS)
+
+
+# 未升级时的属性增加值（只读）
+NO_GROWTH = {attribute: 0 for attribute in ATTRIBUTES}
+
+
+class LevelGain(NamedTuple):
+    """经验结算结果：新等级、剩余经验值、各属性增加值"""
+    level: int
+    exp: int
+    attributes: Dict[str, int]
+
+
+# 查询升级所需经验值
+def get_next_level_exp(level: int) -> int:
+    """查表获取升级所需经验值，超出表格范围时按公式计算"""
+    if 1 <= level <= MAX_LEVEL:
+        return NEXT_LEVEL_EXP[level]
+    return calculate_next_level_exp(level)
+
+
+# 结算经验值
+def apply_exp(class_type: str, level: int, exp: int) -> LevelGain:
+    """
+    根据当前等级和获得经验后的经验值计算新等级
+    累计经验值二分查找确定等级，属性增加值为两个等级累计成长值之差，
+    跨多级升级时无需逐级循环；达到等级上限后经验值清零
+    """
+    if level >= MAX_LEVEL:
+        return LevelGain(level, 0, NO_GROWTH)
+    # 最常见的情况：经验不足以升级
+    if exp < NEXT_LEVEL_EXP[level]:
+        return LevelGain(level, exp, NO_GROWTH)
+
+    total_exp = CUMULATIVE_EXP[level] + exp
+    new_level = min(bisect.bisect_right(CUMULATIVE_EXP, total_exp, lo=1) - 1, MAX_LEVEL)
+    new_exp = 0 if new_level >= MAX_LEVEL else total_exp - CUMULATIVE_EXP[new_level]
+
+    table = GROWTH_TABLES.get((class_type or "").lower(), DEFAULT_GROWTH_TABLE)
+    attributes = {
+        attribute: table[attribute][new_level] - table[attribute][level]
+        for attribute in ATTRIBUTES
+    }
+    return LevelGain(new_level, new_exp, attributes)
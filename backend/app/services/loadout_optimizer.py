@@ -0,0 +1,229 @@
+import heapq
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from app import metrics
+from app.models.character import Character
+from app.models.equipment import EquipmentSlot
+from app.services import catalog, inventory
+from app.services.power import BASE_POWER, LEVEL_POWER, POWER_STATS, POWER_WEIGHTS
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，未安装时使用纯Python实现
+    np = None
+
+# 槽位组：前五组各对应一个槽位，饰品组可同时占用两个饰品槽位
+GROUPS = ("武器", "头盔", "胸甲", "手套", "靴子", "饰品")
+GROUP_SLOTS = (("武器",), ("头盔",), ("胸甲",), ("手套",), ("靴子",), ("饰品1", "饰品2"))
+# 装备类型对应的槽位组
+TYPE_GROUPS = {**{name: index for index, name in enumerate(GROUPS)}, "饰品1": 5, "饰品2": 5}
+
+# 最多返回的方案数
+MAX_TOP_K = 10
+
+
+class PowerTable(NamedTuple):
+    """装备目录的战力表（每件装备一行），安装 numpy 时各列为数组"""
+    # {装备ID: 行号}
+    index: Dict[int, int]
+    ids: Sequence[int]
+    power: Sequence[int]
+    level: Sequence[int]
+    # 槽位组序号，-1 表示无法穿戴
+    group: Sequence[int]
+
+
+class Loadout(NamedTuple):
+    """一套装备方案"""
+    # {槽位: 装备ID}，空槽位为None
+    slots: Dict[str, Optional[int]]
+    power: int
+    # 相对当前装备的战力变化
+    delta: int
+    # 与当前装备不同的槽位 (槽位, 当前装备ID, 方案装备ID)
+    changes: List[Tuple[str, Optional[int], Optional[int]]]
+
+
+class OptimizeResult(NamedTuple):
+    current_power: int
+    loadouts: List[Loadout]
+
+
+# 战力表缓存：(装备目录, 战力表)，目录重新加载后重建
+_table = (None, None)
+
+
+# 构建战力表
+def build_table(items) -> PowerTable:
+    """按 calculate_character_power 的权重计算每件装备的战力，有 numpy 时用一次矩阵乘法完成"""
+    ids = [item.id for item in items]
+    level = [item.level or 1 for item in items]
+    group = [TYPE_GROUPS.get(item.type, -1) for item in items]
+    stats = [[getattr(item, stat) or 0 for stat in POWER_STATS] for item in items]
+    index = {equipment_id: row for row, equipment_id in enumerate(ids)}
+    if np is None:
+        power = [sum(value * weight for value, weight in zip(row, POWER_WEIGHTS)) for row in stats]
+        return PowerTable(index, ids, power, level, group)
+    matrix = np.array(stats, dtype=np.int64).reshape(len(items), len(POWER_STATS))
+    return PowerTable(
+        index, np.array(ids, dtype=np.int64), matrix @ np.array(POWER_WEIGHTS, dtype=np.int64),
+        np.array(level, dtype=np.int64), np.array(group, dtype=np.int64)
+    )
+
+
+# 获取战力表
+def get_table(db: Session = None) -> PowerTable:
+    """与装备目录一起缓存，新建装备时 catalog.invalidate("equipment") 会使两者同时重建"""
+    global _table
+    equipment = catalog.get_catalog("equipment", db)
+    cached_catalog, table = _table
+    if cached_catalog is equipment:
+        return table
+    table = build_table(equipment.items)
+    _table = (equipment, table)
+    return table
+
+
+# 各槽位组战力最高的候选装备
+def top_candidates(table: PowerTable, owned: Sequence[int], level: int, limit: int) -> List[List[Tuple[int, int]]]:
+    """
+    对拥有的装备按 等级 <= 角色等级 过滤后，每个槽位组取战力最高的 limit 件，
+    返回 [[(战力, 装备ID), ...] 每组一个列表]，同战力按装备ID升序
+    """
+    rows = [table.index[equipment_id] for equipment_id in owned if equipment_id in table.index]
+    if np is None:
+        groups = [[] for _ in GROUPS]
+        for row in rows:
+            if table.level[row] <= level and table.group[row] >= 0:
+                groups[table.group[row]].append((table.power[row], table.ids[row]))
+        return [
+            heapq.nsmallest(limit, candidates, key=lambda candidate: (-candidate[0], candidate[1]))
+            for candidates in groups
+        ]
+
+    rows = np.array(rows, dtype=np.int64)
+    rows = rows[table.level[rows] <= level]
+    result = []
+    for group in range(len(GROUPS)):
+        group_rows = rows[table.group[rows] == group]
+        order = np.lexsort((table.ids[group_rows], -table.power[group_rows]))[:limit]
+        top = group_rows[order]
+        result.append(list(zip(table.power[top].tolist(), table.ids[top].tolist())))
+    return result
+
+
+# 单个槽位组的可选方案
+def group_options(group: int, candidates: List[Tuple[int, int]], owned: Dict[int, int],
+                  current: Dict[str, Optional[int]], limit: int) -> List[Tuple[int, Tuple[Optional[int], ...]]]:
+    """
+    返回按战力降序的 [(战力, 各槽位装备ID)]，饰品组的两件饰品须是不同实例；
+    空出槽位的方案只在没有更好的填满方案时保留（见 undominated）
+    """
+    slots = GROUP_SLOTS[group]
+    if len(slots) == 1:
+        options = [(power, (equipment_id,)) for power, equipment_id in candidates]
+        options.append((0, (None,)))
+        return undominated(options)[:limit]
+
+    options = [(0, (None, None))]
+    for i, (power, equipment_id) in enumerate(candidates):
+        options.append((power, (equipment_id, None)))
+        if owned.get(equipment_id, 0) >= 2:
+            options.append((power * 2, (equipment_id, equipment_id)))
+        for other_power, other_id in candidates[i + 1:]:
+            options.append((power + other_power, (equipment_id, other_id)))
+
+    # 两件饰品与当前穿戴的位置对应，减少不必要的更换
+    result = []
+    for power, (first, second) in undominated(options)[:limit]:
+        kept = (current.get(slots[0]) == first) + (current.get(slots[1]) == second)
+        if (current.get(slots[0]) == second) + (current.get(slots[1]) == first) > kept:
+            first, second = second, first
+        result.append((power, (first, second)))
+    return result
+
+
+# 去掉被支配的方案
+def undominated(options: List[Tuple[int, Tuple[Optional[int], ...]]]) -> List[Tuple[int, Tuple[Optional[int], ...]]]:
+    """
+    方案 A 在保留 B 全部装备的基础上多填了槽位且战力不低于 B 时，B 被支配，不再作为候选；
+    例如有候选装备时不返回空槽位方案，除非装备战力为负。结果按战力降序，同战力按装备ID升序
+    """
+    filled = [(power, Counter(item for item in items if item is not None)) for power, items in options]
+    result = [
+        option for option, (power, items) in zip(options, filled)
+        if not any(
+            other_power >= power and sum(other_items.values()) > sum(items.values()) and not items - other_items
+            for other_power, other_items in filled
+        )
+    ]
+    result.sort(key=lambda option: (-option[0], [-1 if item is None else item for item in option[1]]))
+    return result
+
+
+# 前 K 个最优组合
+def best_combinations(options: List[List[Tuple[int, Tuple]]], top_k: int) -> List[Tuple[int, Tuple[int, ...]]]:
+    """每组方案已按战力降序，用最大堆从全部取第一项开始逐步扩展，得到总战力最高的 top_k 个组合"""
+    start = tuple(0 for _ in options)
+    heap = [(-sum(group[0][0] for group in options), start)]
+    seen = {start}
+    result = []
+    while heap and len(result) < top_k:
+        total, choice = heapq.heappop(heap)
+        result.append((-total, choice))
+        for group, position in enumerate(choice):
+            if position + 1 >= len(options[group]):
+                continue
+            successor = choice[:group] + (position + 1,) + choice[group + 1:]
+            if successor in seen:
+                continue
+            seen.add(successor)
+            delta = options[group][position + 1][0] - options[group][position][0]
+            heapq.heappush(heap, (total - delta, successor))
+    return result
+
+
+# 计算最优装备方案
+def optimize(character_id: int, db: Session, top_k: int = 3) -> Optional[OptimizeResult]:
+    """
+    在角色拥有的装备（背包中的装备实例，已穿戴的装备也在背包中）中，按 装备等级 <= 角色等级 的限制
+    为每个槽位挑选装备，返回战力最高的 top_k 套方案及其相对当前装备的战力变化；
+    战力与 calculate_character_power 相同：基础战力 + 等级 * 10 + 装备属性之和。角色不存在时返回None
+    """
+    top_k = max(1, min(top_k, MAX_TOP_K))
+    level = db.query(Character.level).filter(Character.id == character_id).scalar()
+    if level is None:
+        return None
+
+    with metrics.timer("loadout_optimizer.seconds"):
+        # 穿戴不消耗背包中的实例，背包中的实例数即可穿戴的件数
+        owned = inventory.owned_equipment(db, character_id)
+        current = {slot: None for slots in GROUP_SLOTS for slot in slots}
+        for slot_type, equipment_id in db.query(EquipmentSlot.slot_type, EquipmentSlot.equipment_id).filter(
+            EquipmentSlot.character_id == character_id
+        ):
+            current[slot_type] = equipment_id
+
+        table = get_table(db)
+        base_power = BASE_POWER + level * LEVEL_POWER
+        current_power = base_power + sum(
+            int(table.power[table.index[equipment_id]])
+            for equipment_id in current.values() if equipment_id in table.index
+        )
+
+        # 饰品组需要多取一件，保证前 top_k 个两两组合都在候选中
+        candidates = top_candidates(table, list(owned), level, top_k + 1)
+        options = [
+            group_options(group, candidates[group], owned, current, top_k)
+            for group in range(len(GROUPS))
+        ]
+        loadouts = []
+        for equipment_power, choice in best_combinations(options, top_k):
+            slots = {}
+            for group, position in enumerate(choice):
+                slots.update(zip(GROUP_SLOTS[group], options[group][position][1]))
+            power = base_power + int(equipment_power)
+            changes = [(slot, current[slot], slots[slot]) for slot in slots if slots[slot] != current[slot]]
+            loadouts.append(Loadout(slots, power, power - current_power, changes))
+    return OptimizeResult(current_power, loadouts)
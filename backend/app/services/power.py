@@ -0,0 +1,190 @@
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, Query
+from app.models.character import Character
+from app.models.equipment import EquipmentSlot, Equipment
+from app.models.user import User
+
+# 战力公式常量
+BASE_POWER = 100
+LEVEL_POWER = 10
+
+# 装备属性之和（SQL表达式）
+EQUIPMENT_STAT_SUM = (
+    func.coalesce(Equipment.attack, 0)
+    + func.coalesce(Equipment.defense, 0)
+    + func.coalesce(Equipment.strength, 0)
+    + func.coalesce(Equipment.agility, 0)
+    + func.coalesce(Equipment.intelligence, 0)
+    + func.coalesce(Equipment.vitality, 0)
+)
+
+# 计入战力的装备属性及其权重（与 EQUIPMENT_STAT_SUM 一致，每点属性计1点战力）
+POWER_STATS = ("attack", "defense", "strength", "agility", "intelligence", "vitality")
+POWER_WEIGHTS = (1, 1, 1, 1, 1, 1)
+
+# 单件装备提供的战力
+def equipment_power(equipment: Equipment) -> int:
+    """单件装备的属性之和"""
+    return sum(
+        (getattr(equipment, attr) or 0) * weight
+        for attr, weight in zip(POWER_STATS, POWER_WEIGHTS)
+    )
+
+# 计算角色战力
+def calculate_character_power(character: Character, db: Session) -> int:
+    """
+    计算角色战力
+    公式: 基础战力 + 等级战力 + 装备战力
+    基础战力: 100
+    等级战力: 等级 * 10
+    装备战力: 所有装备属性之和
+    """
+    # 基础战力
+    base_power = BASE_POWER
+    # 等级战力
+    level_power = character.level * LEVEL_POWER
+    # 装备战力：已穿戴装备的属性之和，一次查询完成
+    equipment_power = db.query(func.coalesce(func.sum(EQUIPMENT_STAT_SUM), 0)).select_from(EquipmentSlot).join(
+        Equipment, Equipment.id == EquipmentSlot.equipment_id
+    ).filter(EquipmentSlot.character_id == character.id).scalar()
+    
+    # 总战力
+    total_power = base_power + level_power + int(equipment_power)
+    return total_power
+
+# 批量战力查询
+def character_power_query(db: Session, character_ids: Optional[Iterable[int]] = None) -> Query:
+    """
+    构建批量战力查询
+    一条聚合SQL关联 characters、equipment_slots、equipment、users，
+    每行返回 character_id、character_name、user_id、username、class_type、level、power
+    """
+    equipment_power = func.coalesce(func.sum(EQUIPMENT_STAT_SUM), 0)
+    query = db.query(
+        Character.id.label("character_id"),
+        Character.name.label("character_name"),
+        Character.user_id.label("user_id"),
+        User.username.label("username"),
+        Character.class_type.label("class_type"),
+        Character.level.label("level"),
+        (BASE_POWER + Character.level * LEVEL_POWER + equipment_power).label("power"),
+    ).join(
+        User, User.id == Character.user_id
+    ).outerjoin(
+        EquipmentSlot, EquipmentSlot.character_id == Character.id
+    ).outerjoin(
+        Equipment, Equipment.id == EquipmentSlot.equipment_id
+    ).group_by(
+        Character.id, Character.name, Character.user_id, User.username, Character.class_type, Character.level
+    )
+    if character_ids is not None:
+        query = query.filter(Character.id.in_(list(character_ids)))
+    return query
+
+# 批量计算角色战力
+def calculate_powers(db: Session, character_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """批量计算全部角色（或指定角色）的战力，返回字典列表"""
+    return [
+        {
+            "character_id": row.character_id,
+            "character_name": row.character_name,
+            "user_id": row.user_id,
+            "username": row.username,
+            "class_type": row.class_type,
+            "level": row.level,
+            "power": int(row.power),
+        }
+        for row in character_power_query(db, character_ids)
+    ]
+
+# 增量更新角色战力
+def adjust_power(db: Session, character_id: int, delta: int):
+    """
+    在数据库中原子地增加角色战力（delta 可为负数）
+    使用 UPDATE ... SET power = power + delta，并发更新不会丢失
+    """
+    if delta:
+        db.query(Character).filter(Character.id == character_id, Character.power.isnot(None)).update(
+            {Character.power: Character.power + delta}, synchronize_session=False
+        )
+
+# 已穿戴装备战力（关联子查询）
+def _equipment_power_subquery():
+    return select(
+        func.coalesce(func.sum(EQUIPMENT_STAT_SUM), 0)
+    ).select_from(EquipmentSlot).join(
+        Equipment, Equipment.id == EquipmentSlot.equipment_id
+    ).where(EquipmentSlot.character_id == Character.id).scalar_subquery()
+
+# 重新计算单个角色的战力
+def refresh_power(db: Session, character_id: int) -> Optional[int]:
+    """
+    在当前事务中用一条 UPDATE 按已穿戴的装备重新计算战力（不提交），返回新的战力
+    一次替换多个槽位时比逐件增量更新更简单，并发穿戴也不会产生偏差
+    """
+    return db.execute(
+        update(Character)
+        .where(Character.id == character_id)
+        .values(power=BASE_POWER + Character.level * LEVEL_POWER + _equipment_power_subquery())
+        .returning(Character.power)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+# 回填战力列
+def backfill_power(db: Session) -> int:
+    """用一条 UPDATE 语句为所有角色重新计算并写入战力，返回更新的行数"""
+    updated = db.query(Character).update(
+        {Character.power: BASE_POWER + Character.level * LEVEL_POWER + _equipment_power_subquery()},
+        synchronize_session=False
+    )
+    db.commit()
+    return updated
+
+# 校验战力列
+def verify_power(db: Session) -> List[Dict]:
+    """
+    对比存储的战力与实时计算的战力，返回存在偏差的角色
+    先用批量查询筛出可疑角色，再用 calculate_character_power 逐个确认
+    """
+    stored = dict(db.query(Character.id, Character.power).all())
+    drift = []
+    for row in character_power_query(db):
+        if stored.get(row.character_id) == int(row.power):
+            continue
+        character = db.query(Character).filter(Character.id == row.character_id).first()
+        expected = calculate_character_power(character, db)
+        if character.power != expected:
+            drift.append({
+                "character_id": character.id,
+                "stored": character.power,
+                "expected": expected,
+            })
+    return drift
+
+
+if __name__ == "__main__":
+    # 命令行工具:
+    #   python -m app.services.power backfill  回填战力列
+    #   python -m app.services.power verify    报告战力偏差
+    import sys
+    from app.database import SessionLocal
+    from app.database_init import init_db
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    init_db()
+    db = SessionLocal()
+    try:
+        if command == "backfill":
+            print(f"战力回填完成，共更新 {backfill_power(db)} 个角色")
+        elif command == "verify":
+            drift = verify_power(db)
+            for item in drift:
+                print(f"角色 {item['character_id']}: 存储战力 {item['stored']}，实际战力 {item['expected']}")
+            print(f"战力校验完成，{len(drift)} 个角色存在偏差")
+            sys.exit(1 if drift else 0)
+        else:
+            print(f"未知命令: {command}，可用命令: backfill, verify")
+            sys.exit(2)
+    finally:
+        db.close()
@@ -0,0 +1,116 @@
+from collections import deque
+from typing import Dict, Iterable, NamedTuple, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app import metrics
+from app.database import SessionLocal
+from app.models.task import Task, TaskPrerequisite, TaskType
+from app.services import catalog
+
+
+class QuestGraph(NamedTuple):
+    """任务前置关系图，随任务目录加载时预先计算"""
+    # {任务ID: 前置任务ID元组}
+    prerequisites: Dict[int, Tuple[int, ...]]
+    # {任务ID: 以它为前置的后续任务ID元组}
+    unlocked_by: Dict[int, Tuple[int, ...]]
+    # 拓扑序（前置任务总在后续任务之前），处于环中的任务不在其中
+    order: Tuple[int, ...]
+
+    def successors(self, task_ids: Iterable[int]) -> Tuple[int, ...]:
+        """task_ids 的直接后续任务"""
+        result = {}
+        for task_id in task_ids:
+            for successor in self.unlocked_by.get(task_id, ()):
+                result[successor] = None
+        return tuple(result)
+
+
+# 任务前置关系图缓存：(任务目录, 前置关系图)，目录重新加载后重建
+_graph = (None, None)
+
+
+# 构建前置关系图
+def build_graph(task_ids: Iterable[int], edges: Iterable[Tuple[int, int]]) -> QuestGraph:
+    """Kahn 算法计算拓扑序；edges 为 (任务ID, 前置任务ID)"""
+    task_ids = sorted(task_ids)
+    known = set(task_ids)
+    prerequisites: Dict[int, list] = {}
+    unlocked_by: Dict[int, list] = {}
+    for task_id, prerequisite_id in edges:
+        if task_id in known and prerequisite_id in known:
+            prerequisites.setdefault(task_id, []).append(prerequisite_id)
+            unlocked_by.setdefault(prerequisite_id, []).append(task_id)
+
+    pending = {task_id: len(prerequisites.get(task_id, ())) for task_id in task_ids}
+    ready = deque(task_id for task_id in task_ids if pending[task_id] == 0)
+    order = []
+    while ready:
+        task_id = ready.popleft()
+        order.append(task_id)
+        for successor in unlocked_by.get(task_id, ()):
+            pending[successor] -= 1
+            if pending[successor] == 0:
+                ready.append(successor)
+    if len(order) < len(task_ids):
+        cyclic = sorted(set(task_ids) - set(order))
+        print(f"任务前置关系存在环，以下任务无法解锁: {cyclic}")
+        metrics.set_gauge("quest_graph.cyclic_tasks", len(cyclic))
+
+    return QuestGraph(
+        prerequisites={task_id: tuple(sorted(ids)) for task_id, ids in prerequisites.items()},
+        unlocked_by={task_id: tuple(sorted(ids)) for task_id, ids in unlocked_by.items()},
+        order=tuple(order),
+    )
+
+
+# 获取前置关系图
+def get_graph(db: Session = None) -> QuestGraph:
+    """与任务目录一起缓存；新建任务时 catalog.invalidate("tasks") 会使两者同时重建"""
+    global _graph
+    tasks = catalog.get_catalog("tasks", db)
+    cached_catalog, graph = _graph
+    if cached_catalog is tasks:
+        return graph
+
+    owns_session = db is None
+    db = db or SessionLocal()
+    try:
+        edges = db.query(TaskPrerequisite.task_id, TaskPrerequisite.prerequisite_id).all()
+    finally:
+        if owns_session:
+            db.close()
+    graph = build_graph(tasks.by_id, edges)
+    _graph = (tasks, graph)
+    return graph
+
+
+# 新建任务的默认前置任务
+def default_prerequisites(task_type: str, db: Session = None) -> Tuple[int, ...]:
+    """主线任务必须按顺序完成：未指定前置任务时接在拓扑序中最后一个主线任务之后"""
+    if task_type != TaskType.MAIN:
+        return ()
+    tasks = catalog.get_catalog("tasks", db)
+    for task_id in reversed(get_graph(db).order):
+        if tasks.get(task_id).type == TaskType.MAIN:
+            return (task_id,)
+    return ()
+
+
+# 回填主线任务链
+def backfill_main_chain(conn: Connection) -> int:
+    """
+    前置关系上线前创建的主线任务没有前置任务，按ID顺序串成任务链；
+    已有任何主线任务的前置关系时不做修改，返回新增的边数
+    """
+    linked = conn.execute(
+        select(TaskPrerequisite.task_id).join(Task, Task.id == TaskPrerequisite.task_id).where(Task.type == TaskType.MAIN).limit(1)
+    ).first()
+    if linked:
+        return 0
+    main_ids = conn.execute(select(Task.id).where(Task.type == TaskType.MAIN).order_by(Task.id)).scalars().all()
+    edges = [{"task_id": task_id, "prerequisite_id": prerequisite_id} for prerequisite_id, task_id in zip(main_ids, main_ids[1:])]
+    if edges:
+        conn.execute(insert(TaskPrerequisite), edges)
+    return len(edges)
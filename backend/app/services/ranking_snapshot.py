@@ -0,0 +1,291 @@
+import json
+import os
+import threading
+import time
+import redis
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from app import metrics
+from app.database import SessionLocal
+from app.redis import acquire_lock, redis_client, release_lock
+from app.models.character import Character
+from app.models.user import User
+from app.services import leaderboard
+from app.services.leaderboard import level_bracket, view_key
+
+# 加载环境变量
+load_dotenv()
+
+# 快照刷新间隔（秒），需求：排行榜每10分钟更新一次；设为0则关闭快照，排行榜实时更新
+SNAPSHOT_INTERVAL = int(os.getenv("RANKING_SNAPSHOT_INTERVAL", "600"))
+# 其他进程正在构建时，多久后重新检查Redis中的新快照（秒）
+RECHECK_INTERVAL = int(os.getenv("RANKING_SNAPSHOT_RECHECK", "5"))
+# 构建锁超时（秒），只需覆盖一次构建的耗时，发布后立即释放
+BUILD_LOCK_TTL = int(os.getenv("RANKING_SNAPSHOT_LOCK_TTL", "60"))
+
+# Redis中的快照键与构建锁（多进程部署时只有一个进程负责构建）
+SNAPSHOT_KEY = "ranking:snapshot"
+BUILD_LOCK_KEY = "ranking:snapshot:lock"
+# 最新快照的构建时间，其他进程据此判断是否需要构建，无需读取整个快照
+BUILT_AT_KEY = "ranking:snapshot:built_at"
+
+# 排序规则，与 rank_from_database 保持一致
+SORT_KEYS = {
+    "level": lambda item: (-item["level"], -item["power"], item["character_id"]),
+    "power": lambda item: (-item["power"], item["character_id"]),
+}
+
+
+class BoardView(NamedTuple):
+    """单个排行榜视图：按名次排列的数据，以及角色名次、个人名次索引"""
+    entries: Tuple[Dict, ...]
+    # 角色名次索引: {character_id: 名次}
+    character_rank: Dict[int, int]
+    # 个人排名查找表: {user_id: 该用户最佳角色的名次}
+    personal_rank: Dict[int, int]
+
+    @classmethod
+    def from_ordered(cls, ordered: List[Dict]) -> "BoardView":
+        entries = tuple({**item, "rank": i + 1} for i, item in enumerate(ordered))
+        character_rank = {}
+        personal_rank = {}
+        for entry in entries:
+            character_rank[entry["character_id"]] = entry["rank"]
+            # 按名次顺序遍历，第一次出现即为该用户的最佳名次
+            personal_rank.setdefault(entry["user_id"], entry["rank"])
+        return cls(entries, character_rank, personal_rank)
+
+    @property
+    def total(self) -> int:
+        return len(self.entries)
+
+    def page(self, offset: int, limit: int) -> Tuple[Dict, ...]:
+        """按名次分页，深分页与第一页代价相同"""
+        return self.entries[offset:offset + limit]
+
+    def around(self, user_id: int, radius: int) -> Tuple[Tuple[Dict, ...], Optional[int]]:
+        """玩家最佳角色上下各 radius 名"""
+        rank = self.personal_rank.get(user_id)
+        if rank is None:
+            return (), None
+        start = max(rank - 1 - radius, 0)
+        return self.entries[start:rank + radius], rank
+
+
+EMPTY_VIEW = BoardView((), {}, {})
+
+
+class RankingSnapshot(NamedTuple):
+    """不可变的排行榜快照"""
+    version: int
+    built_at: float
+    # 各排行榜视图，键为 leaderboard.view_key 生成的视图名
+    views: Dict[str, BoardView]
+
+    def view(self, key: str) -> BoardView:
+        return self.views.get(key, EMPTY_VIEW)
+
+    def to_json(self) -> str:
+        # 只序列化排好序的数据，索引在加载时重建
+        return json.dumps({
+            "version": self.version,
+            "built_at": self.built_at,
+            "views": {key: view.entries for key, view in self.views.items()},
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "RankingSnapshot":
+        data = json.loads(raw)
+        return cls(
+            version=data["version"],
+            built_at=data["built_at"],
+            views={key: BoardView.from_ordered(entries) for key, entries in data["views"].items()},
+        )
+
+
+# 当前快照，整体替换保证读取方看到的始终是完整的快照
+_current: Optional[RankingSnapshot] = None
+_build_lock = threading.Lock()
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def _load_characters(db: Session) -> List[Dict]:
+    rows = db.query(
+        Character.id, Character.name, Character.user_id, User.username, Character.class_type,
+        Character.level, Character.power
+    ).join(User, User.id == Character.user_id).all()
+    return [
+        {
+            "character_id": row.id,
+            "character_name": row.name,
+            "user_id": row.user_id,
+            "username": row.username,
+            "class_type": row.class_type,
+            "level": row.level,
+            "power": row.power or 0,
+        }
+        for row in rows
+    ]
+
+
+# 构建快照
+def build_snapshot(db: Session) -> RankingSnapshot:
+    """
+    一次查询读取全部角色，每种排行榜排序一次，
+    再按职业、等级段拆分出子榜（拆分保持原有顺序，无需再次排序）
+    """
+    with metrics.timer("ranking.snapshot.build_seconds"):
+        characters = _load_characters(db)
+        views = {}
+        for board, sort_key in SORT_KEYS.items():
+            ordered = sorted(characters, key=sort_key)
+            partitions = {}
+            for item in ordered:
+                if item["class_type"]:
+                    partitions.setdefault(view_key(board, class_type=item["class_type"]), []).append(item)
+                partitions.setdefault(view_key(board, bracket=level_bracket(item["level"])), []).append(item)
+            views[view_key(board)] = BoardView.from_ordered(ordered)
+            for key, items in partitions.items():
+                views[key] = BoardView.from_ordered(items)
+        snapshot = RankingSnapshot(
+            version=time.time_ns(),
+            built_at=time.time(),
+            views=views,
+        )
+    metrics.set_gauge("ranking.snapshot.characters", len(characters))
+    metrics.set_gauge("ranking.snapshot.built_at", snapshot.built_at)
+    return snapshot
+
+
+# 原子替换当前快照
+def publish(snapshot: RankingSnapshot):
+    """替换进程内快照，并写入Redis供其他进程读取"""
+    global _current
+    _current = snapshot
+    try:
+        pipe = redis_client.pipeline()
+        pipe.set(SNAPSHOT_KEY, snapshot.to_json())
+        pipe.set(BUILT_AT_KEY, snapshot.built_at)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Ranking snapshot publish error: {e}")
+
+
+def _load_from_redis() -> Optional[RankingSnapshot]:
+    try:
+        raw = redis_client.get(SNAPSHOT_KEY)
+    except redis.RedisError as e:
+        print(f"Ranking snapshot load error: {e}")
+        return None
+    return RankingSnapshot.from_json(raw) if raw else None
+
+
+def _is_fresh(built_at: float) -> bool:
+    return time.time() - built_at < SNAPSHOT_INTERVAL
+
+
+def _adopt(snapshot: Optional[RankingSnapshot]) -> Optional[RankingSnapshot]:
+    """采用Redis中更新的快照"""
+    global _current
+    if snapshot is not None and (_current is None or snapshot.version > _current.version):
+        _current = snapshot
+    return _current
+
+
+def _build(db: Session = None) -> RankingSnapshot:
+    with _build_lock:
+        owns_session = db is None
+        db = db or SessionLocal()
+        try:
+            snapshot = build_snapshot(db)
+        finally:
+            if owns_session:
+                db.close()
+        publish(snapshot)
+    return snapshot
+
+
+# 刷新快照
+def refresh(db: Session = None) -> RankingSnapshot:
+    """
+    刷新快照：Redis中的快照未过期时直接加载；
+    已过期时获得构建锁的进程负责构建、发布并释放锁，
+    其他进程先使用已有快照，RECHECK_INTERVAL 后再检查
+    """
+    try:
+        built_at = redis_client.get(BUILT_AT_KEY)
+        if built_at is not None and _is_fresh(float(built_at)):
+            if _current is None or _current.built_at < float(built_at):
+                return _adopt(_load_from_redis()) or _build(db)
+            return _current
+        token = acquire_lock(BUILD_LOCK_KEY, BUILD_LOCK_TTL)
+    except redis.RedisError as e:
+        # Redis不可用时每个进程各自构建
+        print(f"Ranking snapshot lock error: {e}")
+        return _build(db)
+
+    if token is None:
+        return _adopt(_load_from_redis()) or _build(db)
+    try:
+        return _build(db)
+    finally:
+        release_lock(BUILD_LOCK_KEY, token)
+
+
+def current() -> Optional[RankingSnapshot]:
+    """当前进程内的快照（可能尚未构建）"""
+    return _current
+
+
+# 获取当前快照
+def get_snapshot(db: Session = None) -> RankingSnapshot:
+    """返回当前快照，尚未构建时同步构建一次"""
+    global _current
+    if _current is None:
+        _current = _load_from_redis() or refresh(db)
+    return _current
+
+
+def _next_wait() -> float:
+    """到当前快照过期为止的时间；快照仍是旧的（其他进程正在构建）时很快重新检查"""
+    if _current is None:
+        return RECHECK_INTERVAL
+    return max(_current.built_at + SNAPSHOT_INTERVAL - time.time(), RECHECK_INTERVAL)
+
+
+def _run():
+    while not _stop_event.wait(_next_wait()):
+        try:
+            refresh()
+        except Exception as e:
+            metrics.incr("ranking.snapshot.errors")
+            print(f"Ranking snapshot refresh error: {e}")
+
+
+# 启动后台快照任务
+def start_scheduler():
+    """启动后台线程，按 RANKING_SNAPSHOT_INTERVAL 周期刷新快照"""
+    global _worker
+    if SNAPSHOT_INTERVAL <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    _stop_event.clear()
+    # 快照模式下不再维护实时排行榜，切回实时模式时需要重新构建
+    leaderboard.invalidate()
+    try:
+        refresh()
+    except Exception as e:
+        print(f"Ranking snapshot refresh error: {e}")
+    _worker = threading.Thread(target=_run, name="ranking-snapshot", daemon=True)
+    _worker.start()
+
+
+# 停止后台快照任务
+def stop_scheduler():
+    _stop_event.set()
+
+
+def enabled() -> bool:
+    """是否启用快照模式"""
+    return SNAPSHOT_INTERVAL > 0
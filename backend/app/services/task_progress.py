@@ -0,0 +1,246 @@
+import os
+import threading
+import redis
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from app import metrics
+from app.database import SessionLocal
+from app.redis import acquire_lock, async_redis_client, redis_client, release_lock
+from app.models.task import CharacterTask, TaskStatus
+
+# 加载环境变量
+load_dotenv()
+
+# 缓冲进度写回数据库的间隔（秒），0 表示关闭缓冲，每次进度更新直接写库
+FLUSH_INTERVAL = int(os.getenv("TASK_PROGRESS_FLUSH_INTERVAL", "5"))
+
+# 待写回的任务进度: {角色任务ID: 进度}，同一任务的多次更新合并为最后一次
+PENDING_KEY = "task_progress:pending"
+# 正在写回的批次；写回过程中进程崩溃时保留，下次写回时重放
+FLUSHING_KEY = "task_progress:flushing"
+# 写回锁，多进程部署时同一时间只有一个进程写回
+FLUSH_LOCK_KEY = "task_progress:flush_lock"
+
+# 按主键批量更新进度，只更新仍处于已接取状态的任务（已完成、已领奖或已重置的任务不会被旧进度覆盖）
+_UPDATE_PROGRESS = (
+    update(CharacterTask.__table__)
+    .where(
+        CharacterTask.__table__.c.id == bindparam("b_id"),
+        CharacterTask.__table__.c.status == TaskStatus.ACCEPTED
+    )
+    .values(progress=bindparam("b_progress"))
+)
+
+# 累加进度脚本：KEYS = [缓冲区, 写回批次]，ARGV = [角色任务ID, 数据库中的进度, 增量, 目标]
+# 以缓冲中的最新进度（没有时用数据库进度）为基础原子地累加并封顶，不会覆盖并发写入的进度
+INCREMENT_SCRIPT = redis_client.register_script("""
+local current = redis.call('HGET', KEYS[1], ARGV[1]) or redis.call('HGET', KEYS[2], ARGV[1]) or ARGV[2]
+local progress = math.min(tonumber(current) + tonumber(ARGV[3]), tonumber(ARGV[4]))
+redis.call('HSET', KEYS[1], ARGV[1], progress)
+return progress
+""")
+
+# 批量累加进度脚本（幂等）：KEYS = [缓冲区, 写回批次, 已应用记录]，ARGV = [记录过期时间, 每个任务依次为 角色任务ID, 数据库中的进度, 增量, 目标]
+# 已应用记录中已有的任务直接返回记录的进度，不再累加；同一批次重放时进度不会重复累加
+INCREMENT_MANY_SCRIPT = redis_client.register_script("""
+local results = {}
+for i = 2, #ARGV, 4 do
+    local progress = redis.call('HGET', KEYS[3], ARGV[i])
+    if not progress then
+        local current = redis.call('HGET', KEYS[1], ARGV[i]) or redis.call('HGET', KEYS[2], ARGV[i]) or ARGV[i + 1]
+        progress = math.min(tonumber(current) + tonumber(ARGV[i + 2]), tonumber(ARGV[i + 3]))
+        redis.call('HSET', KEYS[1], ARGV[i], progress)
+        redis.call('HSET', KEYS[3], ARGV[i], progress)
+    end
+    results[#results + 1] = tonumber(progress)
+end
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+return results
+""")
+
+# 已应用记录的过期时间（秒），只需覆盖批次重放的时间窗口
+APPLIED_TTL = 86400
+
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def enabled() -> bool:
+    """是否启用进度缓冲"""
+    return FLUSH_INTERVAL > 0
+
+
+# 缓冲任务进度
+def record(character_task_id: int, progress: int) -> bool:
+    """写入缓冲区，Redis不可用时返回False，由调用方直接写库"""
+    if not enabled():
+        return False
+    try:
+        redis_client.hset(PENDING_KEY, character_task_id, progress)
+        metrics.incr("task_progress.buffered")
+        return True
+    except redis.RedisError as e:
+        print(f"Task progress buffer error: {e}")
+        return False
+
+
+# 在缓冲中累加任务进度
+def increment(character_task_id: int, progress: int, amount: int, target: int) -> Optional[int]:
+    """原子地累加缓冲中的进度（封顶为 target），返回累加后的进度；未启用缓冲或Redis不可用时返回None，由调用方直接写库"""
+    if not enabled():
+        return None
+    try:
+        result = INCREMENT_SCRIPT(keys=[PENDING_KEY, FLUSHING_KEY], args=[character_task_id, progress, amount, target])
+    except redis.RedisError as e:
+        print(f"Task progress buffer error: {e}")
+        return None
+    metrics.incr("task_progress.buffered")
+    return int(result)
+
+
+# 在缓冲中批量累加任务进度（幂等）
+def increment_many(applied_key: str, entries: List[Tuple[int, int, int, int]]) -> Dict[int, int]:
+    """
+    entries 为 (角色任务ID, 数据库中的进度, 增量, 目标)，返回 {角色任务ID: 累加后的进度}
+    applied_key 记录本批次已累加的任务，同一批次重放时返回记录的进度而不重复累加；
+    Redis错误由调用方处理（批次保留待重放）
+    """
+    args = [APPLIED_TTL]
+    for entry in entries:
+        args.extend(entry)
+    results = INCREMENT_MANY_SCRIPT(keys=[PENDING_KEY, FLUSHING_KEY, applied_key], args=args)
+    metrics.incr("task_progress.buffered", len(entries))
+    return {entry[0]: int(progress) for entry, progress in zip(entries, results)}
+
+
+# 丢弃缓冲的进度
+def discard(character_task_id: int):
+    """任务进度直接写库（如达到目标自动完成）时，丢弃尚未写回的旧进度"""
+    try:
+        redis_client.hdel(PENDING_KEY, character_task_id)
+    except redis.RedisError as e:
+        print(f"Task progress buffer error: {e}")
+
+
+# 读取缓冲中的进度
+def pending(character_task_ids: Iterable[int]) -> Dict[int, int]:
+    """返回尚未写回数据库的最新进度，用于读接口覆盖数据库中的旧值"""
+    ids = list(character_task_ids)
+    if not ids or not enabled():
+        return {}
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hmget(FLUSHING_KEY, ids)
+        pipe.hmget(PENDING_KEY, ids)
+        flushing, waiting = pipe.execute()
+    except redis.RedisError as e:
+        print(f"Task progress buffer error: {e}")
+        return {}
+    return _merge_pending(ids, flushing, waiting)
+
+
+async def pending_async(character_task_ids: Iterable[int]) -> Dict[int, int]:
+    """与 pending 相同，使用异步Redis客户端"""
+    ids = list(character_task_ids)
+    if not ids or not enabled():
+        return {}
+    try:
+        async with async_redis_client.pipeline() as pipe:
+            pipe.hmget(FLUSHING_KEY, ids)
+            pipe.hmget(PENDING_KEY, ids)
+            flushing, waiting = await pipe.execute()
+    except redis.RedisError as e:
+        print(f"Task progress buffer error: {e}")
+        return {}
+    return _merge_pending(ids, flushing, waiting)
+
+
+def _merge_pending(ids, flushing, waiting) -> Dict[int, int]:
+    result = {}
+    for character_task_id, older, newer in zip(ids, flushing, waiting):
+        value = newer if newer is not None else older
+        if value is not None:
+            result[character_task_id] = int(value)
+    return result
+
+
+def _apply(db: Session, entries: Dict[str, str]) -> int:
+    params = [{"b_id": int(task_id), "b_progress": int(progress)} for task_id, progress in entries.items()]
+    if params:
+        db.execute(_UPDATE_PROGRESS, params)
+        db.commit()
+    return len(params)
+
+
+# 写回缓冲的进度
+def flush(db: Session = None) -> int:
+    """
+    把缓冲区整体改名为写回批次，批量更新数据库后删除批次
+    上一次写回中途崩溃留下的批次会先被重放，进度不会丢失
+    """
+    try:
+        token = acquire_lock(FLUSH_LOCK_KEY, max(FLUSH_INTERVAL * 6, 30))
+        if token is None:
+            return 0
+    except redis.RedisError as e:
+        print(f"Task progress flush error: {e}")
+        return 0
+
+    owns_session = db is None
+    db = db or SessionLocal()
+    count = 0
+    try:
+        with metrics.timer("task_progress.flush_seconds"):
+            # 重放上次未完成的批次
+            leftover = redis_client.hgetall(FLUSHING_KEY)
+            if leftover:
+                count += _apply(db, leftover)
+                redis_client.delete(FLUSHING_KEY)
+                metrics.incr("task_progress.replayed", len(leftover))
+
+            try:
+                redis_client.rename(PENDING_KEY, FLUSHING_KEY)
+            except redis.ResponseError:
+                # 缓冲区为空
+                return count
+            count += _apply(db, redis_client.hgetall(FLUSHING_KEY))
+            redis_client.delete(FLUSHING_KEY)
+        metrics.incr("task_progress.flushed", count)
+        return count
+    finally:
+        if owns_session:
+            db.close()
+        release_lock(FLUSH_LOCK_KEY, token)
+
+
+def _run():
+    while not _stop_event.wait(FLUSH_INTERVAL):
+        try:
+            flush()
+        except Exception as e:
+            metrics.incr("task_progress.errors")
+            print(f"Task progress flush error: {e}")
+
+
+# 启动后台写回任务
+def start_flusher():
+    """启动后台线程，按 TASK_PROGRESS_FLUSH_INTERVAL 周期写回进度"""
+    global _worker
+    if not enabled() or (_worker is not None and _worker.is_alive()):
+        return
+    _stop_event.clear()
+    _worker = threading.Thread(target=_run, name="task-progress-flusher", daemon=True)
+    _worker.start()
+
+
+# 停止后台写回任务
+def stop_flusher():
+    """停止后台线程并写回剩余进度"""
+    _stop_event.set()
+    if enabled():
+        try:
+            flush()
+        except Exception as e:
+            print(f"Task progress flush error: {e}")
@@ -0,0 +1,91 @@
+"""
+热点接口并发压测：分别以同步、异步模式启动服务后运行，对比不同并发数下的吞吐量和延迟
+
+    DB_ASYNC=false uvicorn app.main:app --port 8000
+    python benchmarks/concurrency.py --url http://127.0.0.1:8000
+
+    DB_ASYNC=true uvicorn app.main:app --port 8000
+    python benchmarks/concurrency.py --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+try:
+    import httpx
+except ImportError:
+    raise SystemExit("压测脚本需要 httpx: pip install httpx")
+
+
+async def prepare(client: httpx.AsyncClient) -> dict:
+    """注册测试用户、创建角色，返回认证头和角色ID"""
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    await client.post("/api/user/register", json={"username": name, "email": f"{name}@bench.local", "password": "bench-password"})
+    response = await client.post("/api/user/login", data={"username": name, "password": "bench-password"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await client.post("/api/character/", json={"name": name, "class_type": "warrior"}, headers=headers)
+    return {"headers": headers, "character_id": response.json()["id"]}
+
+
+def hot_paths(character_id: int) -> list:
+    return [
+        "/api/ranking/level",
+        "/api/ranking/power?offset=0&limit=20",
+        f"/api/api/level/{character_id}",
+        "/api/api/level/",
+        f"/api/characters/{character_id}/tasks",
+        f"/api/equipment/character/{character_id}",
+    ]
+
+
+async def run_level(client: httpx.AsyncClient, context: dict, concurrency: int, total: int) -> dict:
+    """以固定并发数发送 total 个请求"""
+    paths = hot_paths(context["character_id"])
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.get(paths[i % len(paths)], headers=context["headers"])
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "rps": total / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="热点接口并发压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=2000, help="每个并发级别的请求总数")
+    parser.add_argument("--concurrency", default="1,10,50,100,200", help="逗号分隔的并发数")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        context = await prepare(client)
+        mode = (await client.get("/metrics")).json().get("gauges", {}).get("db.async")
+        print(f"服务: {args.url}  模式: {'异步' if mode else '同步'}")
+        print(f"{'并发':>6} {'吞吐(req/s)':>12} {'p50(ms)':>10} {'p95(ms)':>10} {'错误':>6}")
+        for concurrency in (int(value) for value in args.concurrency.split(",")):
+            result = await run_level(client, context, concurrency, args.requests)
+            print(f"{result['concurrency']:>6} {result['rps']:>12.1f} {result['p50']:>10.2f} {result['p95']:>10.2f} {result['errors']:>6}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
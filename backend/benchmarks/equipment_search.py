@@ -0,0 +1,126 @@
+"""
+装备目录查询压测：在10万件装备的目录上对比
+全量加载后在内存中筛选（原 get_equipment_list 的做法）、无索引的SQL筛选、带复合索引的SQL筛选 + 键集分页
+
+    python benchmarks/equipment_search.py
+    python benchmarks/equipment_search.py --items 100000 --pages 20
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, create_db_engine
+from app.models.equipment import Equipment
+from app.services.equipment_search import search
+
+# 导入全部模型，保证外键引用的表都已注册
+import app.models.user, app.models.character, app.models.skill, app.models.task, app.models.social, app.models.shop  # noqa: E402,F401
+
+TYPES = ("武器", "头盔", "胸甲", "手套", "靴子", "饰品")
+RARITIES = ("普通", "优秀", "稀有", "史诗", "传说")
+STATS = ("attack", "defense", "strength", "agility", "intelligence", "vitality")
+
+# 压测场景：(名称, search 参数)
+SCENARIOS = (
+    ("类型筛选，按ID翻页", {"type": "武器"}),
+    ("类型+稀有度+等级区间", {"type": "头盔", "rarity": "史诗", "min_level": 20, "max_level": 40, "sort": "level"}),
+    ("稀有度，按等级倒序", {"rarity": "传说", "sort": "level", "descending": True}),
+    ("类型，按攻击力倒序", {"type": "武器", "sort": "attack", "descending": True}),
+    ("全目录，按体力倒序", {"sort": "vitality", "descending": True}),
+    ("攻击力下限，按攻击力排序", {"min_stats": {"attack": 90}, "sort": "attack"}),
+)
+
+
+def prepare(engine, items: int):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = random.Random(42)
+    rows = [
+        {
+            "name": f"装备{i}", "type": rng.choice(TYPES), "rarity": rng.choice(RARITIES),
+            "level": rng.randint(1, 100), "durability": 100, "price": rng.randint(1, 10000),
+            **{stat: rng.randint(0, 100) for stat in STATS},
+        }
+        for i in range(items)
+    ]
+    with engine.begin() as conn:
+        conn.execute(Equipment.__table__.insert(), rows)
+        conn.execute(text("ANALYZE"))
+
+
+def drop_indexes(engine):
+    with engine.begin() as conn:
+        for index in Equipment.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def in_memory(db, params: dict, pages: int, limit: int) -> float:
+    """全量加载后在内存中筛选、排序、分页"""
+    start = time.perf_counter()
+    for _ in range(pages):
+        items = db.query(Equipment).all()
+        items = [
+            item for item in items
+            if item.type == params.get("type", item.type)
+            and item.rarity == params.get("rarity", item.rarity)
+            and params.get("min_level", 0) <= item.level <= params.get("max_level", 10 ** 9)
+            and all(getattr(item, stat) >= minimum for stat, minimum in params.get("min_stats", {}).items())
+        ]
+        sort = params.get("sort", "id")
+        items.sort(key=lambda item: (getattr(item, sort), item.id), reverse=params.get("descending", False))
+        items[:limit]
+        db.expunge_all()
+    return (time.perf_counter() - start) / pages
+
+
+def paged(db, params: dict, pages: int, limit: int) -> float:
+    """连续翻 pages 页的平均每页耗时"""
+    cursor = None
+    start = time.perf_counter()
+    count = 0
+    for _ in range(pages):
+        page = search(db, limit=limit, cursor=cursor, **params)
+        count += 1
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="装备目录查询压测")
+    parser.add_argument("--url", help="数据库地址，默认在临时目录创建SQLite数据库")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--pages", type=int, default=20, help="每个场景连续翻页数")
+    parser.add_argument("--limit", type=int, default=20, help="每页数量")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_db_engine(url)
+    Session = sessionmaker(bind=engine)
+    print(f"数据库: {url}  装备数: {args.items}  翻页数: {args.pages}  每页: {args.limit}")
+    prepare(engine, args.items)
+
+    with Session() as db:
+        memory = {name: in_memory(db, params, 3, args.limit) for name, params in SCENARIOS}
+        indexed = {name: paged(db, params, args.pages, args.limit) for name, params in SCENARIOS}
+    drop_indexes(engine)
+    with Session() as db:
+        unindexed = {name: paged(db, params, args.pages, args.limit) for name, params in SCENARIOS}
+
+    print(f"{'场景':<24}{'内存筛选':>12}{'无索引SQL':>12}{'复合索引SQL':>12}  (毫秒/页)")
+    for name, _ in SCENARIOS:
+        print(f"{name:<24}{memory[name] * 1000:>12.2f}{unindexed[name] * 1000:>12.2f}{indexed[name] * 1000:>12.2f}")
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+等级曲线微基准：对比逐级循环结算与预计算等级曲线结算（1级升到100级、单次升一级）
+
+    python benchmarks/level_curve.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.level_curve import (  # noqa: E402
+    ATTRIBUTES, CUMULATIVE_EXP, MAX_LEVEL, apply_exp, calculate_attribute_growth, calculate_next_level_exp,
+    get_class_growth_bonus,
+)
+
+
+def loop_level_up(class_type: str, level: int, exp: int):
+    """原逐级循环实现，作为对照"""
+    attributes = dict.fromkeys(ATTRIBUTES, 0)
+    while exp >= calculate_next_level_exp(level):
+        level += 1
+        exp -= calculate_next_level_exp(level - 1)
+        class_bonus = get_class_growth_bonus(class_type)
+        for attribute in ATTRIBUTES:
+            attributes[attribute] += calculate_attribute_growth(level, 1.0, class_bonus.get(attribute, 1.0))
+        if level >= MAX_LEVEL:
+            exp = 0
+            break
+    return level, exp, attributes
+
+
+def main():
+    cases = {
+        "1→100级": ("warrior", 1, CUMULATIVE_EXP[MAX_LEVEL]),
+        "1→2级": ("mage", 1, 1000),
+        "不升级": ("archer", 10, 10),
+    }
+    number = 20000
+    print(f"{'场景':<8} {'逐级循环(us)':>14} {'等级曲线(us)':>14} {'加速比':>8}")
+    for name, (class_type, level, exp) in cases.items():
+        assert loop_level_up(class_type, level, exp) == tuple(apply_exp(class_type, level, exp))
+        loop = timeit.timeit(lambda: loop_level_up(class_type, level, exp), number=number) / number * 1e6
+        table = timeit.timeit(lambda: apply_exp(class_type, level, exp), number=number) / number * 1e6
+        print(f"{name:<8} {loop:>14.2f} {table:>14.2f} {loop / table:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
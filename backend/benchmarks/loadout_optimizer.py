@@ -0,0 +1,98 @@
+"""
+最优装备方案压测：角色背包中有大量装备实例时，对比 numpy 向量化与纯Python实现的单次计算耗时
+
+    python benchmarks/loadout_optimizer.py
+    python benchmarks/loadout_optimizer.py --catalog 100000 --owned 5000 --top-k 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, create_db_engine
+from app.models.user import User
+from app.models.character import Character
+from app.models.equipment import Equipment
+from app.models.inventory import InventoryItem
+from app.services import loadout_optimizer
+
+# 导入全部模型，保证外键引用的表都已注册
+import app.models.skill, app.models.task, app.models.social, app.models.shop  # noqa: E402,F401
+
+TYPES = ("武器", "头盔", "胸甲", "手套", "靴子", "饰品")
+STATS = ("attack", "defense", "strength", "agility", "intelligence", "vitality")
+
+
+def prepare(engine, catalog_size: int, owned: int) -> int:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(Equipment.__table__.insert(), [
+            {
+                "name": f"装备{i}", "type": rng.choice(TYPES), "rarity": "普通", "level": rng.randint(1, 60),
+                "durability": 100, "price": 0, **{stat: rng.randint(0, 50) for stat in STATS},
+            }
+            for i in range(catalog_size)
+        ])
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user = User(username="bench", email="bench@bench.local", password_hash="-")
+        db.add(user)
+        db.flush()
+        character = Character(name="bench", user_id=user.id, class_type="warrior", level=50)
+        db.add(character)
+        db.flush()
+        db.execute(InventoryItem.__table__.insert(), [
+            {"character_id": character.id, "item_key": f"equipment:{equipment_id}", "equipment_id": equipment_id,
+             "quantity": 1, "durability": 100}
+            for equipment_id in (rng.randint(1, catalog_size) for _ in range(owned))
+        ])
+        db.commit()
+        return character.id
+
+
+def measure(db, character_id: int, top_k: int, rounds: int) -> float:
+    # 第一次调用构建战力表，不计入耗时
+    loadout_optimizer.optimize(character_id, db, top_k)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        loadout_optimizer.optimize(character_id, db, top_k)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="最优装备方案压测")
+    parser.add_argument("--catalog", type=int, default=100000, help="装备目录大小")
+    parser.add_argument("--owned", type=int, default=5000, help="背包中的装备实例数")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_db_engine(url)
+    character_id = prepare(engine, args.catalog, args.owned)
+    Session = sessionmaker(bind=engine)
+    print(f"装备目录: {args.catalog}  背包装备: {args.owned}  方案数: {args.top_k}")
+
+    numpy = loadout_optimizer.np
+    with Session() as db:
+        if numpy is not None:
+            print(f"numpy: {measure(db, character_id, args.top_k, args.rounds) * 1000:.2f} 毫秒/次")
+        else:
+            print("numpy 未安装，仅测试纯Python实现")
+        loadout_optimizer.np = None
+        loadout_optimizer._table = (None, None)
+        print(f"纯Python: {measure(db, character_id, args.top_k, args.rounds) * 1000:.2f} 毫秒/次")
+        loadout_optimizer.np = numpy
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,13 @@ async def startup_event():
         print("数据库初始化成功！")
     except Exception as e:
         print(f"数据库初始化失败: {e}")
+    # 启动排行榜快照、目录失效订阅和任务进度写回
+    from app.services import catalog, daily_reset, game_events, ranking_snapshot, task_progress
+    ranking_snapshot.start_scheduler()
+    catalog.start_subscriber()
+    task_progress.start_flusher()
+    daily_reset.start_scheduler()
+    game_events.start_dispatcher()
 
 # 导入路由
 from app.api import router as api_router
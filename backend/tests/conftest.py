@@ -0,0 +1,82 @@
+"""
+测试环境：临时SQLite数据库 + 内存Redis（fakeredis，Lua脚本需要 lupa）
+必须在导入 app 之前设置数据库地址并替换Redis客户端，服务模块导入时会绑定 redis_client
+
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+import os
+import sys
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+# 测试默认使用实时排行榜，快照相关测试自行开启
+os.environ["RANKING_SNAPSHOT_INTERVAL"] = "0"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+import app.redis  # noqa: E402
+
+redis_server = fakeredis.FakeServer()
+app.redis.redis_client = fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+app.redis.async_redis_client = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app as fastapi_app  # noqa: E402
+from app.auth import dependencies  # noqa: E402
+from app import response_cache  # noqa: E402
+from app.services import catalog, ranking_snapshot  # noqa: E402
+
+redis_client = app.redis.redis_client
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """每个测试使用空的数据库、Redis和进程内缓存"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    redis_client.flushall()
+    for name in list(catalog._catalogs):
+        catalog._drop(name)
+    response_cache._cache.clear()
+    response_cache._local_versions.clear()
+    dependencies._user_cache.clear()
+    dependencies._token_cache.clear()
+    ranking_snapshot._current = None
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    return TestClient(fastapi_app)
+
+
+@pytest.fixture
+def register(client):
+    """注册并登录用户，返回认证头"""
+    def register(username: str) -> dict:
+        client.post("/api/user/register", json={"username": username, "email": f"{username}@test.local", "password": "password1"})
+        response = client.post("/api/user/login", data={"username": username, "password": "password1"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
+
+
+@pytest.fixture
+def create_character(client):
+    """创建角色，返回角色ID"""
+    def create_character(headers: dict, name: str, class_type: str = "mage") -> int:
+        response = client.post("/api/character/", json={"name": name, "class_type": class_type}, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+    return create_character
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import database
+from app.api import async_routes
+from app.database import create_async_db_engine
+from app.models.equipment import Equipment, EquipmentSlot
+from app.services import leaderboard, ranking_snapshot
+
+
+@pytest.fixture
+def async_client(monkeypatch):
+    """只注册异步热点接口的应用，使用测试数据库的异步引擎（一个事件循环）"""
+    async_engine = create_async_db_engine(os.environ["DATABASE_URL"])
+    monkeypatch.setattr(database, "AsyncSessionLocal", async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    app = FastAPI()
+    app.include_router(async_routes.router, prefix="/api")
+    with TestClient(app) as client:
+        yield client
+        client.portal.call(async_engine.dispose)
+
+
+def test_async_engine_uses_pooled_aiosqlite():
+    async_engine = create_async_db_engine("sqlite:///./pool.db")
+    assert async_engine.url.drivername == "sqlite+aiosqlite"
+    assert type(async_engine.pool).__name__ == "AsyncAdaptedQueuePool"
+
+
+def test_gain_exp_and_level_info(async_client, register, create_character):
+    headers = register("alice")
+    character_id = create_character(headers, "a1")
+
+    response = async_client.post("/api/api/level/gain-exp", json={"character_id": character_id, "exp": 3000}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["level"] > 1
+    assert response.json()["exp_gained"] == 3000
+
+    info = async_client.get(f"/api/api/level/{character_id}", headers=headers).json()
+    assert info["daily_exp"] == 3000
+    assert info["level"] == response.json()["level"]
+    levels = async_client.get("/api/api/level/", headers=headers).json()
+    assert [item["character_id"] for item in levels["characters"]] == [character_id]
+
+    missing = async_client.post("/api/api/level/gain-exp", json={"character_id": 999, "exp": 1}, headers=headers)
+    assert missing.status_code == 404
+
+
+def test_ranking_falls_back_to_database(async_client, register, create_character, monkeypatch):
+    headers = register("bob")
+    character_id = create_character(headers, "b1")
+    # 实时排行榜不可用时由异步会话查询数据库
+    monkeypatch.setattr(async_routes.ranking, "leaderboard_page", lambda *args: None)
+
+    response = async_client.get("/api/ranking/level", headers=headers)
+    assert response.status_code == 200
+    assert [entry["character_id"] for entry in response.json()["ranking"]] == [character_id]
+    assert response.json()["personal_rank"] == 1
+    assert async_client.get("/api/ranking/foo/around-me", headers=headers).status_code == 404
+
+
+def test_ranking_reads_loaded_snapshot(async_client, db, register, create_character, monkeypatch):
+    headers = register("carol")
+    character_id = create_character(headers, "c1")
+    monkeypatch.setattr(ranking_snapshot, "SNAPSHOT_INTERVAL", 600)
+    ranking_snapshot.publish(ranking_snapshot.build_snapshot(db))
+
+    response = async_client.get("/api/ranking/power/around-me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["ranking"][0]["character_id"] == character_id
+
+
+def test_tasks_and_equipment(async_client, db, register, create_character):
+    headers = register("dave")
+    character_id = create_character(headers, "d1", "warrior")
+    sword = Equipment(name="剑", type="weapon", level=1, rarity="common", attack=5)
+    db.add(sword)
+    db.flush()
+    db.add(EquipmentSlot(character_id=character_id, equipment_id=sword.id, slot_type="weapon"))
+    db.commit()
+
+    slots = async_client.get(f"/api/equipment/character/{character_id}", headers=headers)
+    assert slots.status_code == 200
+    assert slots.json()[0]["equipment"]["name"] == "剑"
+
+    tasks = async_client.get(f"/api/characters/{character_id}/tasks?compact=true")
+    assert tasks.status_code == 200
+    assert async_client.get("/api/characters/999/tasks").status_code == 404
+
+
+def test_level_up_updates_leaderboard(async_client, register, create_character):
+    headers = register("erin")
+    character_id = create_character(headers, "e1")
+    async_client.post("/api/api/level/gain-exp", json={"character_id": character_id, "exp": 3000}, headers=headers)
+    assert leaderboard.get_page("level:bracket:1-10")[0][0]["level"] == 3
@@ -0,0 +1,32 @@
+from app.models.character import Character
+from app.models.equipment import Equipment, EquipmentSlot
+from app.services import effective_stats, equip
+from tests.conftest import redis_client
+
+
+def test_equip_caches_loadout_stats(db, register, create_character, monkeypatch):
+    headers = register("alice")
+    character_id = create_character(headers, "a1")
+    sword = Equipment(name="剑", type="武器", level=1, rarity="普通", attack=5, strength=2)
+    helmet = Equipment(name="头盔", type="头盔", level=1, rarity="普通", defense=3)
+    db.add_all([sword, helmet])
+    db.flush()
+    db.add(EquipmentSlot(character_id=character_id, equipment_id=sword.id, slot_type="武器"))
+    db.commit()
+    expected_before = effective_stats.compute_many([character_id], db)[character_id]
+
+    character = db.get(Character, character_id)
+    # 穿戴后不应重新汇总最终属性
+    monkeypatch.setattr(effective_stats, "compute_many", lambda *args: _fail_compute())
+    result = equip.equip(db, character, {"头盔": helmet.id})
+    monkeypatch.undo()
+
+    assert set(result.slots) == {"武器", "头盔"}
+    assert result.stats.defense == expected_before.defense + 3
+    assert result.stats == effective_stats.compute_many([character_id], db)[character_id]
+    cached = redis_client.get(effective_stats.KEY.format(character_id=character_id))
+    assert effective_stats.EffectiveStats.decode(cached) == result.stats
+
+
+def _fail_compute():
+    raise AssertionError("equip 不应重新汇总最终属性")
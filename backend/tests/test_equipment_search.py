@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from app.models.equipment import Equipment
+from app.services import equipment_search
+
+
+@pytest.fixture
+def catalog_items(db):
+    rng = random.Random(5)
+    items = [
+        Equipment(
+            name=f"i{index}", type=rng.choice(["武器", "头盔"]), level=rng.randint(1, 5), rarity="普通",
+            attack=rng.randint(0, 3), price=None if index % 7 == 0 else rng.randint(0, 4)
+        )
+        for index in range(60)
+    ]
+    db.add_all(items)
+    db.commit()
+    return [(item.id, item.type, item.level, item.attack, item.price) for item in items]
+
+
+def walk(db, limit, **filters):
+    """按 next_cursor 翻完全部页，返回装备ID顺序"""
+    ids, cursor = [], None
+    while True:
+        page = equipment_search.search(db, limit=limit, cursor=cursor, **filters)
+        assert len(page.items) <= limit
+        ids.extend(item.id for item in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_pages_cover_every_row_once(db, catalog_items, descending):
+    # 排序值大量重复时靠 (排序值, ID) 区分，翻页不重复也不遗漏
+    expected = sorted(catalog_items, key=lambda item: (item[3], item[0]), reverse=descending)
+    assert walk(db, 7, sort="attack", descending=descending) == [item[0] for item in expected]
+
+    by_id = sorted(catalog_items, reverse=descending)
+    assert walk(db, 9, sort="id", descending=descending) == [item[0] for item in by_id]
+
+
+def test_keyset_pages_with_filters_and_null_sort_values(db, catalog_items):
+    expected = sorted(
+        (item for item in catalog_items if item[1] == "武器" and 2 <= item[2] <= 4 and item[4] is not None),
+        key=lambda item: (item[4], item[0])
+    )
+    assert walk(db, 4, sort="price", type="武器", min_level=2, max_level=4) == [item[0] for item in expected]
+
+
+def test_invalid_cursor(client, register, catalog_items):
+    headers = register("alice")
+    for cursor in ("not-a-cursor", equipment_search.encode_cursor([1], 2), equipment_search.encode_cursor(1, "2")):
+        response = client.get("/api/equipment/search", params={"sort": "attack", "cursor": cursor}, headers=headers)
+        assert response.status_code == 400
+
+    first = client.get("/api/equipment/search", params={"sort": "attack", "limit": 5}, headers=headers).json()
+    second = client.get("/api/equipment/search", params={"sort": "attack", "limit": 5, "cursor": first["next_cursor"]}, headers=headers)
+    assert second.status_code == 200
+    assert not {item["id"] for item in first["items"]} & {item["id"] for item in second.json()["items"]}
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from app.api import level
+from app.models.character import Character
+
+
+def grant_row(db, character_id):
+    return SimpleNamespace(**db.query(*level.GRANT_COLUMNS).filter(Character.id == character_id).one()._asdict())
+
+
+def test_apply_grant_rejects_stale_row(db, register, create_character):
+    character_id = create_character(register("alice"), "a1")
+    stale = grant_row(db, character_id)
+    fresh = grant_row(db, character_id)
+    assert level.apply_grant(db, fresh, 1200) is not None
+    db.commit()
+
+    # 读取后等级和经验已被其他请求修改，比较失败且不写回
+    assert level.apply_grant(db, stale, 1200) is None
+    db.commit()
+    character = db.get(Character, character_id)
+    assert (character.level, character.exp) == (2, 200)
+    assert character.power == fresh.power
+
+
+def test_batch_grant_retries_conflicts(client, db, register, create_character, monkeypatch):
+    headers = register("bob")
+    character_id = create_character(headers, "b1")
+    power_before = grant_row(db, character_id).power
+    apply_grant = level.apply_grant
+    calls = []
+
+    def racing_apply_grant(session, character, exp, **values):
+        # 第一次写回前模拟另一个请求先为该角色增加了经验
+        if not calls:
+            other = grant_row(session, character.id)
+            assert apply_grant(session, other, 900) is not None
+        calls.append(character.id)
+        return apply_grant(session, character, exp, **values)
+
+    monkeypatch.setattr(level, "apply_grant", racing_apply_grant)
+    response = client.post("/api/api/level/gain-exp/batch", json={"grants": [{"character_id": character_id, "exp": 700}]}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert calls == [character_id, character_id]
+    result = response.json()["results"][0]
+    assert (result["level"], result["exp"], result["levels_gained"]) == (2, 600, 1)
+
+    character = db.get(Character, character_id)
+    assert (character.level, character.exp) == (2, 600)
+    assert character.power == power_before + level.LEVEL_POWER
+
+
+def test_concurrent_gain_exp_loses_no_updates(client, db, register, create_character):
+    headers = register("carol")
+    character_id = create_character(headers, "c1")
+
+    def gain(_):
+        return client.post("/api/api/level/gain-exp", json={"character_id": character_id, "exp": 250}, headers=headers).status_code
+
+    with ThreadPoolExecutor(8) as executor:
+        assert set(executor.map(gain, range(10))) == {200}
+    character = db.get(Character, character_id)
+    # 2500 经验：1000 升到2级，1500 升到3级
+    assert (character.level, character.exp) == (3, 0)
@@ -0,0 +1,66 @@
+import pytest
+import redis
+
+from app.services import exp_quota
+
+
+@pytest.fixture
+def characters(register, create_character):
+    headers = register("alice")
+    return create_character(headers, "a1"), create_character(headers, "a2")
+
+
+def redis_down(monkeypatch):
+    def fail(*args, **kwargs):
+        raise redis.ConnectionError("redis down")
+    monkeypatch.setattr(exp_quota, "RESERVE_SCRIPT", fail)
+
+
+def test_first_reservation_seeds_counter_from_database(db, characters):
+    first, _ = characters
+    assert exp_quota.reserve(db, first, 4000).granted == 4000
+    assert exp_quota.reserve(db, first, 7000).granted == 6000
+    assert exp_quota.reserve(db, first, 1).granted == 0
+    assert exp_quota.used_today(db, first) == exp_quota.DAILY_EXP_LIMIT
+
+
+def test_outage_usage_is_merged_by_every_worker(db, characters, monkeypatch):
+    first, second = characters
+    assert exp_quota.reserve(db, first, 1000).in_redis
+
+    # 本进程在Redis故障期间回退到数据库记录
+    with monkeypatch.context() as patch:
+        redis_down(patch)
+        reservation = exp_quota.reserve(db, first, 8000)
+    assert (reservation.granted, reservation.in_redis) == (8000, False)
+    db.commit()
+
+    # Redis恢复后本进程的第一次预占（任意角色）记录故障
+    assert exp_quota.reserve(db, second, 10).granted == 10
+    assert exp_quota._outage_days == set()
+
+    # 从未回退过的其他进程也会合并数据库用量，不会超过每日上限
+    assert exp_quota.reserve(db, first, 5000).granted == 1000
+    # 合并只发生一次，之后只访问Redis
+    monkeypatch.setattr(exp_quota, "_used_in_database", lambda *args: pytest.fail("不应再次读取数据库"))
+    assert exp_quota.reserve(db, first, 100).granted == 0
+    assert exp_quota.reserve(db, second, 100).granted == 100
+
+
+def test_repeated_outage_merges_only_the_difference(db, characters, monkeypatch):
+    first, second = characters
+    exp_quota.reserve(db, first, 1000)
+
+    def outage():
+        with monkeypatch.context() as patch:
+            redis_down(patch)
+            assert exp_quota.reserve(db, first, 3000).granted == 3000
+        db.commit()
+        exp_quota.reserve(db, second, 1)
+
+    outage()
+    # 合并第一次故障的 3000
+    assert exp_quota.reserve(db, first, 1).granted == 1
+    outage()
+    # 数据库记录 6000，第二次只累加尚未合并的 3000：1000 + 1 + 6000
+    assert exp_quota.reserve(db, first, 10000).granted == 10000 - 7001
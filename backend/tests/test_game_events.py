@@ -0,0 +1,67 @@
+import pytest
+
+from app.services import game_events, task_progress
+from tests.conftest import redis_client
+
+
+@pytest.fixture
+def kill_task(client, register, create_character):
+    """已接取“击杀100次”任务的角色，返回 (角色ID, 角色任务ID)"""
+    character_id = create_character(register("alice"), "a1")
+    client.post("/api/tasks", json={"name": "k", "description": "d", "type": "side", "target_count": 100, "objective_event": "kill"})
+    task = client.get(f"/api/characters/{character_id}/tasks?compact=true").json()[0]
+    client.post(f"/api/characters/{character_id}/tasks/accept", json={"task_id": task["task_id"]})
+    return character_id, task["id"]
+
+
+def report_kills(client, character_id, amount):
+    response = client.post(f"/api/characters/{character_id}/events", json={"events": [{"type": "kill", "amount": amount}]})
+    assert response.status_code == 200, response.text
+
+
+def test_replay_after_failed_commit_counts_once(client, db, kill_task, monkeypatch):
+    character_id, character_task_id = kill_task
+    report_kills(client, character_id, 3)
+
+    commit = db.commit
+    calls = []
+
+    def failing_commit():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("commit failed")
+        commit()
+
+    monkeypatch.setattr(db, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        game_events.dispatch(db)
+    # 进度已在缓冲中累加，但批次保留待重放
+    assert redis_client.llen(game_events.PROCESSING_KEY) == 1
+
+    assert game_events.dispatch(db) == 1
+    assert task_progress.pending([character_task_id]) == {character_task_id: 3}
+    assert not redis_client.exists(game_events.PROCESSING_KEY, game_events.BATCH_KEY)
+    assert not redis_client.keys("game_events:applied:*")
+
+
+def test_failing_batch_moves_to_dead_letter(client, db, kill_task, monkeypatch):
+    character_id, character_task_id = kill_task
+    report_kills(client, character_id, 3)
+
+    apply_events = game_events.apply_events
+
+    def poison(events, db, batch_id=None):
+        raise ValueError("bad batch")
+
+    monkeypatch.setattr(game_events, "apply_events", poison)
+    for _ in range(game_events.MAX_ATTEMPTS):
+        with pytest.raises(ValueError):
+            game_events.dispatch(db)
+
+    # 后续事件不再被阻塞
+    monkeypatch.setattr(game_events, "apply_events", apply_events)
+    report_kills(client, character_id, 2)
+    assert game_events.dispatch(db) == 1
+    assert redis_client.llen(game_events.DEAD_LETTER_KEY) == 1
+    assert task_progress.pending([character_task_id]) == {character_task_id: 2}
+    assert not redis_client.exists(game_events.PROCESSING_KEY, game_events.QUEUE_KEY)
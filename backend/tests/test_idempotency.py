@@ -0,0 +1,30 @@
+from app.services import idempotency
+from tests.conftest import redis_client
+
+NAME = idempotency.KEY.format(scope="s", key="k")
+
+
+def test_pending_marker_expires_quickly_and_result_is_kept():
+    assert idempotency.begin("s", "k") is None
+    assert 0 < redis_client.ttl(NAME) <= idempotency.IDEMPOTENCY_PENDING_TTL
+    assert idempotency.begin("s", "k") == idempotency.PENDING
+
+    idempotency.complete("s", "k", {"ok": 1})
+    assert redis_client.ttl(NAME) > idempotency.IDEMPOTENCY_PENDING_TTL
+    assert idempotency.begin("s", "k") == {"ok": 1}
+    # 已保存的结果不会被释放
+    idempotency.abort("s", "k")
+    assert idempotency.begin("s", "k") == {"ok": 1}
+
+
+def test_failed_request_releases_key(client, register, create_character):
+    character_id = create_character(register("alice"), "a1")
+    client.post("/api/tasks", json={"name": "t", "description": "d", "type": "side"})
+    task_id = client.get(f"/api/characters/{character_id}/tasks?compact=true").json()[0]["task_id"]
+    headers = {"Idempotency-Key": "retry-me"}
+
+    for _ in range(2):
+        response = client.post(f"/api/characters/{character_id}/tasks/reward", json={"task_id": task_id}, headers=headers)
+        # 任务尚未完成：失败后立即可以用同一个键重试，而不是得到“请求正在处理中”
+        assert response.status_code == 400
+    assert not redis_client.keys("idempotency:*")
@@ -0,0 +1,59 @@
+from app.database import engine
+from app.models.equipment import Equipment, EquipmentSlot
+from app.services import inventory
+
+
+def add_equipment(db, **values) -> int:
+    equipment = Equipment(name=values.pop("name", "剑"), type=values.pop("type", "武器"), level=1, rarity="普通", **values)
+    db.add(equipment)
+    db.commit()
+    return equipment.id
+
+
+def test_add_keeps_zero_durability(db, register, create_character):
+    character_id = create_character(register("alice"), "a1")
+    broken = add_equipment(db, durability=0)
+    inventory.add(db, character_id, {inventory.equipment_key(broken): 2})
+    db.commit()
+
+    instances = inventory.load(character_id, db).instances
+    assert [durability for _, _, durability in instances] == [0, 0]
+
+
+def test_equip_requires_owned_instances(client, db, register, create_character):
+    headers = register("bob")
+    character_id = create_character(headers, "b1")
+    ring = add_equipment(db, name="戒指", type="饰品", attack=3)
+
+    def equip(slots):
+        return client.post("/api/equipment/equip/loadout", json={"character_id": character_id, "slots": slots}, headers=headers)
+
+    assert equip({"饰品1": ring}).status_code == 400
+    inventory.add(db, character_id, {inventory.equipment_key(ring): 1})
+    db.commit()
+    assert equip({"饰品1": ring}).status_code == 200
+    # 同一装备占用两个槽位需要两件实例
+    assert equip({"饰品2": ring}).status_code == 400
+
+    # 正在穿戴的实例不能移除
+    instance_id = inventory.load(character_id, db).instances[0][0]
+    response = client.post(f"/api/inventory/{character_id}/remove", json={"instance_ids": [instance_id]}, headers=headers)
+    assert response.status_code == 400
+    assert len(inventory.load(character_id, db).instances) == 1
+
+
+def test_backfill_equipped(db, register, create_character):
+    character_id = create_character(register("carol"), "c1")
+    ring = add_equipment(db, name="戒指", type="饰品", durability=40)
+    db.add_all([
+        EquipmentSlot(character_id=character_id, equipment_id=ring, slot_type="饰品1"),
+        EquipmentSlot(character_id=character_id, equipment_id=ring, slot_type="饰品2"),
+    ])
+    inventory.add(db, character_id, {inventory.equipment_key(ring): 1})
+    db.commit()
+
+    with engine.begin() as conn:
+        assert inventory.backfill_equipped(conn) == 1
+        assert inventory.backfill_equipped(conn) == 0
+    assert inventory.owned_equipment(db, character_id) == {ring: 2}
+    assert {durability for _, _, durability in inventory.load(character_id, db).instances} == {40}
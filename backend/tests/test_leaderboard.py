@@ -0,0 +1,72 @@
+from app.models.character import Character
+from app.services import leaderboard
+from tests.conftest import redis_client
+
+
+def board_ids(view: str = "level"):
+    return [entry["character_id"] for entry in leaderboard.get_page(view, 0, 100)[0]]
+
+
+def test_rebuild_builds_views_and_removes_orphan_user_keys(db, register, create_character):
+    headers = register("alice")
+    first = create_character(headers, "a1")
+    second = create_character(headers, "a2", "warrior")
+    redis_client.sadd(leaderboard.USER_KEY.format(user_id=999), 12345)
+    redis_client.zadd(leaderboard.KEY_PREFIX + "level:class:gone", {12345: 1})
+    redis_client.sadd(leaderboard.VIEWS_KEY, "level:class:gone")
+
+    assert leaderboard.rebuild(db) == 2
+    assert sorted(board_ids()) == [first, second]
+    assert board_ids("level:class:warrior") == [second]
+    assert not redis_client.exists(leaderboard.USER_KEY.format(user_id=999))
+    assert not redis_client.exists(leaderboard.KEY_PREFIX + "level:class:gone")
+    assert not redis_client.keys("*" + leaderboard.REBUILD_SUFFIX)
+    assert not redis_client.exists(leaderboard.REBUILD_LOCK_KEY)
+
+
+def test_ensure_ready_does_not_rebuild_while_another_process_holds_the_lock(db, client, register, create_character):
+    headers = register("bob")
+    character_id = create_character(headers, "b1")
+    redis_client.delete(leaderboard.READY_KEY)
+    redis_client.set(leaderboard.REBUILD_LOCK_KEY, "other")
+
+    assert leaderboard.ensure_ready(db) is False
+    assert not redis_client.exists(leaderboard.READY_KEY)
+    # 重建期间从数据库读取
+    response = client.get("/api/ranking/level", headers=headers)
+    assert response.status_code == 200
+    assert [entry["character_id"] for entry in response.json()["ranking"]] == [character_id]
+
+    redis_client.delete(leaderboard.REBUILD_LOCK_KEY)
+    assert leaderboard.ensure_ready(db) is True
+    assert redis_client.exists(leaderboard.READY_KEY)
+
+
+def test_updates_during_rebuild_are_not_overwritten(db, register, create_character, monkeypatch):
+    headers = register("carol")
+    updated = create_character(headers, "c1")
+    deleted = create_character(headers, "c2")
+    write_rebuild = leaderboard._write_rebuild
+    calls = []
+
+    def concurrent_update(pipe, rows, views, user_keys):
+        rows = list(rows)
+        if not calls:
+            # 重建已读取旧数据后，其他请求提交了升级和删除
+            character = db.get(Character, updated)
+            character.level = 20
+            db.commit()
+            leaderboard.sync_character(character, db)
+            user_id = db.get(Character, deleted).user_id
+            db.delete(db.get(Character, deleted))
+            db.commit()
+            leaderboard.remove_character(deleted, user_id)
+        calls.append(len(rows))
+        write_rebuild(pipe, rows, views, user_keys)
+
+    monkeypatch.setattr(leaderboard, "_write_rebuild", concurrent_update)
+    assert leaderboard.rebuild(db) == 1
+    assert board_ids() == [updated]
+    assert board_ids("level:bracket:11-20") == [updated]
+    assert board_ids("level:bracket:1-10") == []
+    assert not redis_client.exists(leaderboard.DIRTY_KEY)
@@ -0,0 +1,42 @@
+import random
+
+from app.services import level_curve
+
+
+def step_by_step(class_type, level, exp):
+    """逐级升级的原始算法，作为查表结果的对照"""
+    bonus = level_curve.get_class_growth_bonus(class_type)
+    attributes = dict(level_curve.NO_GROWTH)
+    while level < level_curve.MAX_LEVEL and exp >= level_curve.calculate_next_level_exp(level):
+        exp -= level_curve.calculate_next_level_exp(level)
+        level += 1
+        for attribute in level_curve.ATTRIBUTES:
+            attributes[attribute] += level_curve.calculate_attribute_growth(level, 1.0, bonus.get(attribute, 1.0))
+    if level >= level_curve.MAX_LEVEL:
+        exp = 0
+    return level_curve.LevelGain(level, exp, attributes)
+
+
+def test_next_level_exp_table():
+    assert [level_curve.get_next_level_exp(level) for level in range(1, 5)] == [1000, 1500, 2250, 3375]
+    assert level_curve.get_next_level_exp(level_curve.MAX_LEVEL + 1) == level_curve.calculate_next_level_exp(level_curve.MAX_LEVEL + 1)
+    assert level_curve.CUMULATIVE_EXP[1] == 0
+    assert level_curve.CUMULATIVE_EXP[3] == 2500
+
+
+def test_apply_exp_matches_step_by_step():
+    rng = random.Random(11)
+    cases = [("mage", 1, 999), ("mage", 1, 1000), ("warrior", 1, 4750), ("Priest", 3, 2250), ("unknown", 2, 0)]
+    cases += [
+        (rng.choice(["warrior", "mage", "archer", "thief", "priest", "knight"]), rng.randint(1, 40), rng.randint(0, 10 ** 9))
+        for _ in range(200)
+    ]
+    for class_type, level, exp in cases:
+        assert level_curve.apply_exp(class_type, level, exp) == step_by_step(class_type, level, exp), (class_type, level, exp)
+
+
+def test_apply_exp_at_max_level():
+    gain = level_curve.apply_exp("mage", level_curve.MAX_LEVEL - 1, 10 ** 30)
+    assert gain.level == level_curve.MAX_LEVEL
+    assert gain.exp == 0
+    assert level_curve.apply_exp("mage", level_curve.MAX_LEVEL, 123) == (level_curve.MAX_LEVEL, 0, level_curve.NO_GROWTH)
@@ -0,0 +1,54 @@
+from app.models.equipment import Equipment
+from app.services import inventory, loadout_optimizer
+
+
+def add_items(db, character_id, items):
+    """items: [(类型, 攻击, 件数)]，返回装备ID列表"""
+    equipment = [
+        Equipment(name=f"i{index}", type=item_type, level=1, rarity="普通", attack=attack)
+        for index, (item_type, attack, _) in enumerate(items)
+    ]
+    db.add_all(equipment)
+    db.commit()
+    ids = [item.id for item in equipment]
+    inventory.add(db, character_id, {inventory.equipment_key(item_id): count for item_id, (_, _, count) in zip(ids, items)})
+    db.commit()
+    return ids
+
+
+def test_group_options_drop_dominated_empty_slots():
+    assert loadout_optimizer.group_options(0, [(5, 1), (3, 2)], {}, {}, 3) == [(5, (1,)), (3, (2,))]
+    assert loadout_optimizer.group_options(0, [], {}, {}, 3) == [(0, (None,))]
+    # 负战力装备不如空槽位
+    assert loadout_optimizer.group_options(0, [(-2, 1)], {}, {}, 3) == [(0, (None,)), (-2, (1,))]
+    # 只有一件饰品时才保留空出一个饰品槽位的方案
+    accessories = loadout_optimizer.group_options(5, [(4, 7), (2, 8)], {7: 1, 8: 1}, {}, 3)
+    assert accessories == [(6, (7, 8))]
+    assert loadout_optimizer.group_options(5, [(4, 7)], {7: 1}, {}, 3) == [(4, (7, None))]
+    assert loadout_optimizer.group_options(5, [(4, 7)], {7: 2}, {}, 3) == [(8, (7, 7))]
+
+
+def test_optimize_top_k_and_equip_round_trip(client, db, register, create_character):
+    headers = register("alice")
+    character_id = create_character(headers, "a1")
+    sword, axe, ring, helmet = add_items(db, character_id, [("武器", 10, 1), ("武器", 6, 1), ("饰品", 3, 2), ("头盔", 2, 1)])
+
+    response = client.get(f"/api/equipment/optimize/{character_id}?top_k=5", headers=headers)
+    assert response.status_code == 200, response.text
+    loadouts = response.json()["loadouts"]
+    # 只有武器存在不同选择，不会用卸下装备的方案凑满前 K 个
+    assert [loadout["slots"]["武器"] for loadout in loadouts] == [sword, axe]
+    best = loadouts[0]
+    assert best["slots"] == {"武器": sword, "头盔": helmet, "胸甲": None, "手套": None, "靴子": None, "饰品1": ring, "饰品2": ring}
+    assert best["delta"] == 18
+
+    # 方案可直接用于整套穿戴，空槽位表示卸下
+    equipped = client.post("/api/equipment/equip/loadout", json={"character_id": character_id, "slots": best["slots"]}, headers=headers)
+    assert equipped.status_code == 200, equipped.text
+    assert equipped.json()["power"] == best["power"]
+    assert len(equipped.json()["slots"]) == 4
+
+    unequipped = client.post("/api/equipment/equip/loadout", json={"character_id": character_id, "slots": {"头盔": None}}, headers=headers)
+    assert unequipped.status_code == 200, unequipped.text
+    assert {slot["slot_type"] for slot in unequipped.json()["slots"]} == {"武器", "饰品1", "饰品2"}
+    assert unequipped.json()["power"] == best["power"] - 2
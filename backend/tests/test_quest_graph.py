@@ -0,0 +1,33 @@
+from app.database_init import upgrade_db
+from app.models.task import Task, TaskPrerequisite, TaskType
+
+
+def add_tasks(db, *types):
+    tasks = [Task(name=f"t{i}", description="d", type=task_type) for i, task_type in enumerate(types)]
+    db.add_all(tasks)
+    db.commit()
+    return [task.id for task in tasks]
+
+
+def edges(db):
+    return sorted(db.query(TaskPrerequisite.task_id, TaskPrerequisite.prerequisite_id).all())
+
+
+def test_upgrade_chains_existing_main_tasks(db):
+    first, side, second, third = add_tasks(db, TaskType.MAIN, TaskType.SIDE, TaskType.MAIN, TaskType.MAIN)
+
+    assert "task_prerequisites.backfilled" in upgrade_db()
+    assert edges(db) == [(second, first), (third, second)]
+    # 再次升级不重复添加
+    assert "task_prerequisites.backfilled" not in upgrade_db()
+    assert len(edges(db)) == 2
+
+
+def test_upgrade_keeps_existing_main_chain(db, client):
+    first = client.post("/api/tasks", json={"name": "m1", "description": "d", "type": "main"}).json()["id"]
+    second = client.post("/api/tasks", json={"name": "m2", "description": "d", "type": "main"}).json()["id"]
+    # 明确指定没有前置任务的主线任务
+    client.post("/api/tasks", json={"name": "m3", "description": "d", "type": "main", "prerequisite_ids": []})
+
+    assert "task_prerequisites.backfilled" not in upgrade_db()
+    assert edges(db) == [(second, first)]
@@ -0,0 +1,58 @@
+import pytest
+
+from app.services import leaderboard, ranking_snapshot
+from tests.conftest import redis_client
+
+
+@pytest.fixture
+def snapshot_mode(monkeypatch):
+    monkeypatch.setattr(ranking_snapshot, "SNAPSHOT_INTERVAL", 600)
+
+
+def test_builder_releases_lock_after_publish(db, register, create_character, snapshot_mode):
+    create_character(register("alice"), "a1")
+
+    snapshot = ranking_snapshot.refresh(db)
+    assert snapshot.view("level").total == 1
+    assert not redis_client.exists(ranking_snapshot.BUILD_LOCK_KEY)
+    assert float(redis_client.get(ranking_snapshot.BUILT_AT_KEY)) == snapshot.built_at
+
+
+def test_fresh_snapshot_is_loaded_not_rebuilt(db, register, create_character, snapshot_mode, monkeypatch):
+    create_character(register("alice"), "a1")
+    published = ranking_snapshot.refresh(db)
+    ranking_snapshot._current = None
+    monkeypatch.setattr(ranking_snapshot, "build_snapshot", lambda db: pytest.fail("不应重新构建"))
+
+    assert ranking_snapshot.refresh(db).version == published.version
+
+
+def test_non_builder_rechecks_soon_and_picks_up_new_snapshot(db, register, create_character, snapshot_mode):
+    headers = register("alice")
+    create_character(headers, "a1")
+    stale = ranking_snapshot.refresh(db)
+    # 快照过期，另一个进程持有构建锁
+    redis_client.set(ranking_snapshot.BUILT_AT_KEY, stale.built_at - 601)
+    ranking_snapshot._current = stale._replace(built_at=stale.built_at - 601)
+    redis_client.set(ranking_snapshot.BUILD_LOCK_KEY, "other")
+
+    assert ranking_snapshot.refresh(db).version == stale.version
+    assert ranking_snapshot._next_wait() == ranking_snapshot.RECHECK_INTERVAL
+
+    # 另一个进程发布新快照后，下次检查即可读到
+    create_character(headers, "a2")
+    ranking_snapshot.publish(ranking_snapshot.build_snapshot(db))
+    ranking_snapshot._current = stale._replace(built_at=stale.built_at - 601)
+    assert ranking_snapshot.refresh(db).view("level").total == 2
+    assert ranking_snapshot._next_wait() > 500
+
+
+def test_snapshot_mode_does_not_maintain_sorted_sets(register, create_character, snapshot_mode):
+    redis_client.set(leaderboard.READY_KEY, 1)
+    ranking_snapshot.start_scheduler()
+    ranking_snapshot.stop_scheduler()
+
+    create_character(register("alice"), "a1")
+    assert not redis_client.exists(leaderboard.META_KEY)
+    assert not redis_client.keys(leaderboard.KEY_PREFIX + "level*")
+    assert not redis_client.exists(leaderboard.READY_KEY)